@@ -0,0 +1,3 @@
+"""
+benchmark suite running the config-controller against in-process fake backends
+"""
@@ -0,0 +1,395 @@
+"""
+in-process stand-in for the kubernetes apiserver
+"""
+
+import copy
+import datetime
+import itertools
+import re
+import secrets
+import threading
+import time
+
+from benchmarks.server import FakeServer
+
+# resource name to api version and kind
+kinds = {
+    'pods': ('v1', 'Pod'),
+    'configmaps': ('v1', 'ConfigMap'),
+    'jobs': ('batch/v1', 'Job'),
+    'leases': ('coordination.k8s.io/v1', 'Lease'),
+    'endpointslices': ('discovery.k8s.io/v1', 'EndpointSlice'),
+    'daemonsets': ('apps/v1', 'DaemonSet'),
+}
+
+path_pattern = re.compile(
+    r'^/(?:api/v1|apis/[^/]+/[^/]+)/namespaces/(?P<namespace>[^/]+)'
+    r'/(?P<resource>[^/]+)(?:/(?P<name>[^/]+))?$'
+)
+
+
+def now():
+    return datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def parse_selector(selector):
+    """parse a label selector into a predicate on a label dict
+
+    Supports key, !key, key=value, key==value and key!=value terms.
+    """
+    terms = []
+    for term in filter(None, (selector or '').split(',')):
+        if '!=' in term:
+            key, value = term.split('!=', 1)
+            terms.append(lambda labels, k=key, v=value: labels.get(k) != v)
+        elif '=' in term:
+            key, value = term.replace('==', '=').split('=', 1)
+            terms.append(lambda labels, k=key, v=value: labels.get(k) == v)
+        elif term.startswith('!'):
+            terms.append(lambda labels, k=term[1:]: k not in labels)
+        else:
+            terms.append(lambda labels, k=term: k in labels)
+    return lambda labels: all(term(labels) for term in terms)
+
+
+def merge_patch(target, patch):
+    """apply a JSON merge patch, None values remove keys"""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_patch(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+    return target
+
+
+class FakeApiServer(FakeServer):
+    """kubernetes apiserver holding pods, jobs and configmaps in memory
+
+    Supports list and watch with label selectors and resourceVersions,
+    get, create, merge patch and replace with resourceVersion preconditions
+    and delete.
+    Created jobs get a pod that is scheduled after schedule_delay,
+    pulls its image and becomes ready after ready_delay.
+    Created DaemonSets get a pod on the single fake node.
+    """
+
+    log_size = 100000
+
+    def __init__(self, latency=0.0, schedule_delay=0.05, ready_delay=0.2):
+        """construct a fake apiserver
+
+        :param latency: Seconds to delay every call with.
+        :param schedule_delay: Seconds until the pod of a new job is scheduled.
+        :param ready_delay: Seconds until the pod of a new job is ready.
+        """
+        super().__init__(latency)
+        self.schedule_delay = schedule_delay
+        self.ready_delay = ready_delay
+        self.resources = {resource: {} for resource in kinds}
+        self.resource_version = 0
+        self.log = []
+        self.log_start = 1
+        self.cond = threading.Condition()
+        self._ips = itertools.count(1)
+
+    def _next_ip(self):
+        ip = next(self._ips)
+        return f'10.1.{ip // 256 % 256}.{ip % 256}'
+
+    def add_config_map(self, name, data, labels=None, annotations=None):
+        """register a configmap, e.g. a template"""
+        self.store(
+            'configmaps',
+            'ADDED',
+            {
+                'metadata': {
+                    'name': name,
+                    'labels': labels or {},
+                    'annotations': annotations or {},
+                },
+                'data': data,
+            },
+        )
+
+    def store(self, resource, event_type, obj):
+        """add, replace or remove an object and log the watch event"""
+        with self.cond:
+            self.resource_version += 1
+            meta = obj['metadata']
+            meta['resourceVersion'] = str(self.resource_version)
+            meta.setdefault('namespace', 'default')
+            meta.setdefault('uid', secrets.token_hex(8))
+            meta.setdefault('creationTimestamp', now())
+            api_version, kind = kinds[resource]
+            obj.update(apiVersion=api_version, kind=kind)
+            if event_type == 'DELETED':
+                self.resources[resource].pop(meta['name'], None)
+            else:
+                self.resources[resource][meta['name']] = obj
+            self.log.append((resource, event_type, copy.deepcopy(obj)))
+            if len(self.log) > self.log_size:
+                drop = len(self.log) - self.log_size
+                del self.log[:drop]
+                self.log_start += drop
+            self.cond.notify_all()
+
+    def route(self, method, path, query, body):
+        match = path_pattern.match(path)
+        if match is None or match['resource'] not in self.resources:
+            return 404, status(404, 'NotFound')
+        resource, name = match['resource'], match['name']
+
+        if method == 'GET' and name is None:
+            if query.get('watch', '').lower() in ('true', '1'):
+                self.count('watch ' + resource)
+                return 200, self._watch(resource, query)
+            self.count('list ' + resource)
+            return 200, self._list(resource, query)
+
+        verb = {
+            'GET': 'get',
+            'POST': 'create',
+            'PATCH': 'patch',
+            'PUT': 'replace',
+            'DELETE': 'delete',
+        }
+        self.count(verb.get(method, method.lower()) + ' ' + resource)
+        with self.cond:
+            if method == 'POST':
+                return self._create(resource, body)
+            obj = self.resources[resource].get(name)
+            if obj is None:
+                return 404, status(404, 'NotFound')
+            if method == 'GET':
+                return 200, copy.deepcopy(obj)
+            if method == 'PATCH':
+                return self._patch(resource, obj, body)
+            if method == 'PUT':
+                return self._replace(resource, obj, body)
+            if method == 'DELETE':
+                self._delete(resource, obj)
+                return 200, status(200, 'Success')
+        return 405, status(405, 'MethodNotAllowed')
+
+    def _list(self, resource, query):
+        matches = parse_selector(query.get('labelSelector'))
+        with self.cond:
+            items = [
+                copy.deepcopy(obj)
+                for obj in self.resources[resource].values()
+                if matches(obj['metadata'].get('labels') or {})
+            ]
+            items.sort(key=lambda obj: obj['metadata']['name'])
+            resource_version = str(self.resource_version)
+
+        meta = {'resourceVersion': resource_version}
+        limit = int(query.get('limit') or 0)
+        offset = int(query.get('continue') or 0)
+        if limit:
+            if offset + limit < len(items):
+                meta['continue'] = str(offset + limit)
+            items = items[offset : offset + limit]
+
+        api_version, kind = kinds[resource]
+        return {
+            'apiVersion': api_version,
+            'kind': kind + 'List',
+            'metadata': meta,
+            'items': items,
+        }
+
+    def _watch(self, resource, query):
+        matches = parse_selector(query.get('labelSelector'))
+        since = int(query.get('resourceVersion') or 0)
+        deadline = time.monotonic() + float(query.get('timeoutSeconds') or 60)
+        with self.cond:
+            if since + 1 < self.log_start:
+                yield {'type': 'ERROR', 'object': status(410, 'Expired')}
+                return
+        position = since + 1
+        while not self.stopped.is_set():
+            with self.cond:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if position >= self.log_start + len(self.log):
+                    self.cond.wait(min(remaining, 1))
+                    continue
+                events = self.log[position - self.log_start :]
+                position = self.log_start + len(self.log)
+            for event_resource, event_type, obj in events:
+                if event_resource != resource:
+                    continue
+                if matches(obj['metadata'].get('labels') or {}):
+                    yield {'type': event_type, 'object': obj}
+
+    def _create(self, resource, body):
+        name = body['metadata']['name']
+        if name in self.resources[resource]:
+            return 409, status(409, 'AlreadyExists')
+        obj = copy.deepcopy(body)
+        obj.setdefault('status', {})
+        if resource == 'daemonsets':
+            obj['status'] = {
+                'currentNumberScheduled': 1,
+                'desiredNumberScheduled': 1,
+                'numberMisscheduled': 0,
+                'numberReady': 0,
+            }
+        self.store(resource, 'ADDED', obj)
+        if resource == 'jobs':
+            self._start_pod(obj)
+        if resource == 'daemonsets':
+            self._start_daemon_pod(obj)
+        return 201, copy.deepcopy(obj)
+
+    def _patch(self, resource, obj, body):
+        expected = (body.get('metadata') or {}).pop('resourceVersion', None)
+        if expected is not None and expected != obj['metadata']['resourceVersion']:
+            return 409, status(409, 'Conflict')
+        obj = merge_patch(copy.deepcopy(obj), body)
+        self.store(resource, 'MODIFIED', obj)
+        return 200, copy.deepcopy(obj)
+
+    def _replace(self, resource, obj, body):
+        expected = body['metadata'].get('resourceVersion')
+        if expected is not None and expected != obj['metadata']['resourceVersion']:
+            return 409, status(409, 'Conflict')
+        obj = copy.deepcopy(body)
+        self.store(resource, 'MODIFIED', obj)
+        return 200, copy.deepcopy(obj)
+
+    def _delete(self, resource, obj):
+        self.store(resource, 'DELETED', copy.deepcopy(obj))
+        if resource == 'jobs':
+            for pod in list(self.resources['pods'].values()):
+                if pod['metadata']['labels'].get('job-name') == obj['metadata']['name']:
+                    self.store('pods', 'DELETED', copy.deepcopy(pod))
+        if resource == 'daemonsets':
+            selector = obj['spec']['selector']['matchLabels'].items()
+            for pod in list(self.resources['pods'].values()):
+                if selector <= pod['metadata']['labels'].items():
+                    self.store('pods', 'DELETED', copy.deepcopy(pod))
+
+    def _start_daemon_pod(self, daemon_set):
+        """start the pod of a DaemonSet on the single fake node
+
+        Its init containers complete after schedule_delay.
+        """
+        template = daemon_set['spec']['template']
+        pod_name = daemon_set['metadata']['name'] + '-' + secrets.token_hex(3)
+        pod = {
+            'metadata': copy.deepcopy(template['metadata']) | {'name': pod_name},
+            'spec': copy.deepcopy(template['spec']) | {'nodeName': 'fake-node'},
+            'status': {'phase': 'Pending'},
+        }
+        self.store('pods', 'ADDED', copy.deepcopy(pod))
+
+        def pulled():
+            with self.cond:
+                current = self.resources['pods'].get(pod_name)
+                if current is None:
+                    return
+                current = copy.deepcopy(current)
+                current['status'] = {
+                    'phase': 'Pending',
+                    'initContainerStatuses': [
+                        {
+                            'name': c['name'],
+                            'image': c['image'],
+                            'imageID': '',
+                            'ready': True,
+                            'restartCount': 0,
+                            'state': {'terminated': {'exitCode': 0}},
+                        }
+                        for c in template['spec'].get('initContainers') or []
+                    ],
+                }
+                self.store('pods', 'MODIFIED', current)
+
+        timer = threading.Timer(self.schedule_delay, pulled)
+        timer.daemon = True
+        timer.start()
+
+    def _start_pod(self, job):
+        job_name = job['metadata']['name']
+        template = job['spec']['template']
+        pod_name = job_name + '-' + secrets.token_hex(3)
+        containers = template['spec']['containers']
+        pod = {
+            'metadata': {
+                'name': pod_name,
+                'labels': dict(template['metadata'].get('labels') or {})
+                | {'job-name': job_name},
+            },
+            'spec': copy.deepcopy(template['spec']) | {'nodeName': 'fake-node'},
+            'status': {'phase': 'Pending'},
+        }
+
+        def container_status(**state):
+            return [
+                {
+                    'name': c['name'],
+                    'image': c['image'],
+                    'imageID': '',
+                    'ready': 'running' in state,
+                    'restartCount': 0,
+                    'state': state,
+                }
+                for c in containers
+            ]
+
+        def update(status):
+            with self.cond:
+                if job_name not in self.resources['jobs']:
+                    return
+                current = self.resources['pods'].get(pod_name)
+                event_type = 'ADDED' if current is None else 'MODIFIED'
+                current = copy.deepcopy(current or pod)
+                current['status'] = status
+                self.store('pods', event_type, current)
+
+        scheduled = [
+            {'type': 'PodScheduled', 'status': 'True', 'lastTransitionTime': now()}
+        ]
+        steps = [
+            (self.schedule_delay, {'phase': 'Pending', 'conditions': scheduled}),
+            (
+                (self.schedule_delay + self.ready_delay) / 2,
+                {
+                    'phase': 'Pending',
+                    'conditions': scheduled,
+                    'containerStatuses': container_status(
+                        waiting={'reason': 'ContainerCreating'}
+                    ),
+                },
+            ),
+            (
+                max(self.ready_delay, self.schedule_delay),
+                {
+                    'phase': 'Running',
+                    'podIP': self._next_ip(),
+                    'startTime': now(),
+                    'conditions': scheduled + [{'type': 'Ready', 'status': 'True'}],
+                    'containerStatuses': container_status(running={'startedAt': now()}),
+                },
+            ),
+        ]
+        for delay, pod_status in steps:
+            timer = threading.Timer(delay, update, [pod_status])
+            timer.daemon = True
+            timer.start()
+
+
+def status(code, reason):
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Status',
+        'metadata': {},
+        'status': 'Success' if code < 400 else 'Failure',
+        'reason': reason,
+        'message': reason,
+        'code': code,
+    }
@@ -0,0 +1,192 @@
+"""
+in-process stand-in for the docker engine API
+"""
+
+import copy
+import datetime
+import itertools
+import json
+import re
+import secrets
+import socket
+import threading
+import time
+
+from benchmarks.server import FakeServer
+
+container_pattern = re.compile(r'^/containers/(?P<id>[^/]+)(?:/(?P<action>[^/]+))?$')
+
+
+def now():
+    return datetime.datetime.now(datetime.UTC).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def label_filter(filters):
+    """build a predicate on a label dict from docker label filters"""
+    terms = []
+    for term in filters.get('label', []):
+        key, _, value = term.partition('=')
+        terms.append((key, value if '=' in term else None))
+    return lambda labels: all(
+        key in labels and (value is None or labels[key] == value)
+        for key, value in terms
+    )
+
+
+class FakeDockerDaemon(FakeServer):
+    """docker daemon holding containers in memory
+
+    Supports the calls of the docker backend: version, container create,
+    start, inspect, list and remove, and the event stream. It also knows the
+    container of the controller itself, named after the local hostname.
+    """
+
+    def __init__(self, latency=0.0, network='bench'):
+        """construct a fake docker daemon
+
+        :param latency: Seconds to delay every call with.
+        :param network: Network the controller container is attached to.
+        """
+        super().__init__(latency)
+        self.network = network
+        self.containers = {}
+        self.events = []
+        self.cond = threading.Condition()
+        self._ips = itertools.count(2)
+        self._add(
+            socket.gethostname(),
+            {'com.docker.compose.project.working_dir': '/tmp'},
+            network,
+            running=True,
+        )
+
+    def _add(self, name, labels, network, running=False, image='fake'):
+        container_id = secrets.token_hex(32)
+        self.containers[container_id] = {
+            'Id': container_id,
+            'Name': '/' + name,
+            'Config': {'Image': image, 'Labels': labels},
+            'State': {
+                'Status': 'running' if running else 'created',
+                'Running': running,
+                'StartedAt': now() if running else '0001-01-01T00:00:00Z',
+                'FinishedAt': '0001-01-01T00:00:00Z',
+            },
+            'NetworkSettings': {
+                'Networks': {network: {'IPAddress': self._next_ip() if running else ''}}
+            },
+        }
+        return container_id
+
+    def _next_ip(self):
+        ip = next(self._ips)
+        return f'172.30.{ip // 256 % 256}.{ip % 256}'
+
+    def _find(self, key):
+        for container_id, attrs in self.containers.items():
+            if key in (container_id, attrs['Name'][1:]) or container_id.startswith(key):
+                return attrs
+        return None
+
+    def _event(self, action, attrs):
+        attributes = dict(attrs['Config']['Labels']) | {'name': attrs['Name'][1:]}
+        self.events.append(
+            {
+                'Type': 'container',
+                'Action': action,
+                'Actor': {
+                    'ID': attrs['Id'],
+                    'Attributes': attributes,
+                },
+                'time': int(time.time()),
+                'timeNano': time.time_ns(),
+            }
+        )
+        self.cond.notify_all()
+
+    def route(self, method, path, query, body):
+        path = re.sub(r'^/v[\d.]+', '', path)
+        if path in ('/version', '/_ping'):
+            self.count('version')
+            return 200, {'ApiVersion': '1.44', 'Version': 'fake'}
+        if path == '/events':
+            self.count('events')
+            return 200, self._stream_events(query)
+
+        with self.cond:
+            if path == '/containers/json':
+                self.count('containers.list')
+                return 200, self._list(query)
+            if path == '/containers/create' and method == 'POST':
+                self.count('containers.create')
+                return self._create(query, body)
+
+            match = container_pattern.match(path)
+            if match is None:
+                return 404, {'message': 'page not found'}
+            attrs = self._find(match['id'])
+            if attrs is None:
+                return 404, {'message': 'No such container: ' + match['id']}
+            if method == 'GET' and match['action'] == 'json':
+                self.count('containers.inspect')
+                return 200, copy.deepcopy(attrs)
+            if method == 'POST' and match['action'] == 'start':
+                self.count('containers.start')
+                attrs['State'] |= {
+                    'Status': 'running',
+                    'Running': True,
+                    'StartedAt': now(),
+                }
+                for network in attrs['NetworkSettings']['Networks'].values():
+                    network['IPAddress'] = self._next_ip()
+                self._event('start', attrs)
+                return 204, None
+            if method == 'DELETE' and match['action'] is None:
+                self.count('containers.remove')
+                del self.containers[attrs['Id']]
+                self._event('destroy', attrs)
+                return 204, None
+        return 405, {'message': 'not allowed'}
+
+    def _list(self, query):
+        matches = label_filter(json.loads(query.get('filters') or '{}'))
+        return [
+            {
+                'Id': attrs['Id'],
+                'Names': [attrs['Name']],
+                'Labels': attrs['Config']['Labels'],
+                'State': 'running' if attrs['State']['Running'] else 'created',
+            }
+            for attrs in self.containers.values()
+            if (query.get('all') in ('1', 'true') or attrs['State']['Running'])
+            and matches(attrs['Config']['Labels'])
+        ]
+
+    def _create(self, query, body):
+        name = query.get('name') or secrets.token_hex(6)
+        if self._find(name) is not None:
+            return 409, {'message': 'Conflict. The container name is already in use'}
+        host_config = body.get('HostConfig') or {}
+        network = host_config.get('NetworkMode') or 'bridge'
+        container_id = self._add(
+            name, body.get('Labels') or {}, network, image=body.get('Image')
+        )
+        self._event('create', self.containers[container_id])
+        return 201, {'Id': container_id, 'Warnings': []}
+
+    def _stream_events(self, query):
+        filters = json.loads(query.get('filters') or '{}')
+        matches = label_filter(filters)
+        since = int(query.get('since') or 0)
+        with self.cond:
+            position = 0
+        while not self.stopped.is_set():
+            with self.cond:
+                if position >= len(self.events):
+                    self.cond.wait(1)
+                    continue
+                events = self.events[position:]
+                position = len(self.events)
+            for event in events:
+                if event['time'] >= since and matches(event['Actor']['Attributes']):
+                    yield event
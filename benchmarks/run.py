@@ -0,0 +1,393 @@
+"""
+run the config-controller against a fake backend and report latencies
+
+    python -m benchmarks.run --backend kubernetes --requests 2000 --concurrency 50
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_apiserver import FakeApiServer
+from benchmarks.fake_docker import FakeDockerDaemon
+
+app_type = 'bench'
+job_template = """
+metadata:
+  labels: {}
+spec:
+  restartPolicy: Never
+  containers:
+  - name: app
+    image: ${alternatives.get('image', 'bench:latest')}
+"""
+kubeconfig = """
+apiVersion: v1
+kind: Config
+clusters:
+- name: bench
+  cluster: {server: '%s'}
+users:
+- name: bench
+  user: {}
+contexts:
+- name: bench
+  context: {cluster: bench, user: bench, namespace: default}
+current-context: bench
+"""
+operations = ('list', 'get', 'patch', 'delete', 'templates')
+
+
+def parse_mix(value):
+    """parse an operation mix like list=2,get=5,patch=2,delete=1
+
+    :return dict
+            The weight of each operation.
+    """
+    mix = {}
+    for term in value.split(','):
+        operation, _, weight = term.partition('=')
+        if operation not in operations:
+            raise argparse.ArgumentTypeError('unknown operation ' + operation)
+        mix[operation] = float(weight or 1)
+    return mix
+
+
+def percentile(values, fraction):
+    """nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(int(round(fraction * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def git_revision():
+    try:
+        p = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True
+        )
+        if p.returncode == 0:
+            return p.stdout.strip()
+    except OSError:
+        pass
+    return None
+
+
+def start_backend(args, workdir):
+    """start the fake backend and point the controller configuration at it
+
+    Must run before the controller is imported, it reads its configuration
+    from the environment at import time.
+
+    :return FakeServer
+            The started fake apiserver or docker daemon.
+    """
+    os.environ.pop('KUBERNETES_SERVICE_HOST', None)
+    os.environ['BACKEND'] = args.backend
+    os.environ.setdefault('INFORMER_SYNC_TIMEOUT', '10')
+
+    if args.backend == 'kubernetes':
+        fake = FakeApiServer(args.latency, args.schedule_delay, args.ready_delay)
+        annotations = {}
+        if args.warm_pool:
+            annotations['config-controller.semafor.ch/warm-pool'] = str(args.warm_pool)
+        fake.add_config_map(
+            'templates',
+            {app_type + '.yaml': job_template},
+            labels={'config-controller.semafor.ch/template': 'true'},
+            annotations=annotations,
+        )
+        fake.start()
+        config_file = os.path.join(workdir, 'kubeconfig')
+        with open(config_file, 'w') as f:
+            f.write(kubeconfig % fake.url)
+        os.environ['KUBECONFIG'] = config_file
+        os.environ['JOB_NAMESPACE'] = 'default'
+        return fake
+
+    fake = FakeDockerDaemon(args.latency).start()
+    with open(os.path.join(workdir, app_type + '.properties'), 'w') as f:
+        f.write('image = bench:latest\n')
+    os.environ['DOCKER_HOST'] = 'tcp://' + fake.url.removeprefix('http://')
+    os.environ['TEMPLATE_FOLDER'] = workdir
+    return fake
+
+
+class Recorder:
+    """collects the latency and status code of every request"""
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+
+    def record(self, operation, seconds, status_code):
+        self.latencies[operation].append(seconds)
+        self.statuses[operation][status_code] += 1
+
+    def summary(self):
+        summary = {}
+        for operation, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            summary[operation] = {
+                'count': len(latencies),
+                'mean': sum(latencies) / len(latencies),
+                'p50': percentile(latencies, 0.5),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1],
+                'status': {
+                    str(code): n for code, n in sorted(self.statuses[operation].items())
+                },
+            }
+        return summary
+
+
+async def request(client, recorder, operation, name, wait):
+    start = time.perf_counter()
+    if operation == 'list':
+        r = await client.get('/app/' + app_type)
+    elif operation == 'templates':
+        r = await client.get('/app')
+    elif operation == 'get':
+        r = await client.get(
+            f'/app/{app_type}/{name}', headers={'Prefer': f'wait={wait}'}
+        )
+    elif operation == 'patch':
+        r = await client.patch(f'/app/{app_type}/{name}', json={'user': name})
+    else:
+        r = await client.delete(f'/app/{app_type}/{name}')
+    recorder.record(operation, time.perf_counter() - start, r.status_code)
+
+
+async def drive(app, fake, args):
+    """run the request mix against the app
+
+    Measures the time from the app startup to the first answered request
+    and until /info reports it as ready. Then creates the instances,
+    the setup is not part of the measurement.
+
+    :return dict
+            The report of the run.
+    """
+    import httpx
+
+    rng = random.Random(args.seed)
+    names = [f'i{i}' for i in range(max(args.instances, 1))]
+    weights = [args.mix.get(operation, 0) for operation in operations]
+    plan = [
+        (operation, rng.choice(names))
+        for operation in rng.choices(operations, weights, k=args.requests)
+    ]
+
+    transport = httpx.ASGITransport(app=app)
+    started = time.perf_counter()
+    async with (
+        app.router.lifespan_context(app),
+        httpx.AsyncClient(
+            transport=transport, base_url='http://bench', timeout=None
+        ) as client,
+    ):
+        # the first request waits for the backend if it is not loaded yet
+        await client.get('/app/' + app_type)
+        first_request = time.perf_counter() - started
+        while (await client.get('/info')).status_code != 200:
+            await asyncio.sleep(0.01)
+        ready = time.perf_counter() - started
+
+        setup = Recorder()
+        await client.post('/app/' + app_type, json=names)
+        await asyncio.gather(
+            *(request(client, setup, 'get', name, args.wait) for name in names)
+        )
+
+        recorder = Recorder()
+        semaphore = asyncio.Semaphore(args.concurrency)
+        calls_before, connections_before = fake.snapshot()
+
+        async def worker(operation, name):
+            async with semaphore:
+                await request(client, recorder, operation, name, args.wait)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(*item) for item in plan))
+        duration = time.perf_counter() - start
+        calls_after, connections_after = fake.snapshot()
+
+    calls = {
+        verb: calls_after[verb] - calls_before.get(verb, 0)
+        for verb in sorted(calls_after)
+        if calls_after[verb] != calls_before.get(verb, 0)
+    }
+    total_calls = sum(calls.values())
+    return {
+        'revision': git_revision(),
+        'backend': args.backend,
+        'parameters': {
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'instances': args.instances,
+            'mix': args.mix,
+            'latency': args.latency,
+            'schedule_delay': args.schedule_delay,
+            'ready_delay': args.ready_delay,
+            'wait': args.wait,
+            'seed': args.seed,
+        },
+        'startup': {'first_request': first_request, 'ready': ready},
+        'duration': duration,
+        'rps': args.requests / duration if duration else None,
+        'operations': recorder.summary(),
+        'backend_calls': {
+            'total': total_calls,
+            'per_request': total_calls / args.requests if args.requests else None,
+            'by_verb': calls,
+        },
+        'connections': connections_after - connections_before,
+    }
+
+
+def format_report(report):
+    lines = [
+        f'revision {report["revision"]} backend {report["backend"]}',
+        f'{report["parameters"]["requests"]} requests in {report["duration"]:.2f}s,'
+        f' {report["rps"]:.1f} req/s',
+    ]
+    startup = report.get('startup')
+    if startup:
+        lines.append(
+            f'startup: import {startup["import"] * 1000:.0f} ms,'
+            f' first request {startup["first_request"] * 1000:.0f} ms,'
+            f' ready {startup["ready"] * 1000:.0f} ms'
+        )
+    lines.append(f'{"operation":<10} {"count":>6} {"p50 ms":>9} {"p99 ms":>9}  status')
+    for operation, stats in report['operations'].items():
+        lines.append(
+            f'{operation:<10} {stats["count"]:>6} {stats["p50"] * 1000:>9.2f}'
+            f' {stats["p99"] * 1000:>9.2f}  {stats["status"]}'
+        )
+    calls = report['backend_calls']
+    lines.append(
+        f'backend calls {calls["total"]} ({calls["per_request"]:.2f} per request),'
+        f' {report["connections"]} new connections'
+    )
+    for verb, n in calls['by_verb'].items():
+        lines.append(f'  {verb:<24} {n:>8}')
+    return '\n'.join(lines) + '\n'
+
+
+def compare(before, after):
+    """format the differences between two reports"""
+
+    def change(a, b):
+        if not a or b is None:
+            return ''
+        return f'{(b - a) / a * 100:+.1f}%'
+
+    lines = [
+        f'{before["revision"]} -> {after["revision"]}',
+        f'{"":<22} {"before":>10} {"after":>10} {"change":>8}',
+    ]
+    rows = [
+        ('req/s', before['rps'], after['rps']),
+        (
+            'backend calls/req',
+            before['backend_calls']['per_request'],
+            after['backend_calls']['per_request'],
+        ),
+        ('connections', before['connections'], after['connections']),
+    ]
+    for key in ('import', 'first_request', 'ready'):
+        a = before.get('startup', {}).get(key)
+        b = after.get('startup', {}).get(key)
+        rows.append(
+            (
+                f'{key.replace("_", " ")} ms',
+                a * 1000 if a is not None else None,
+                b * 1000 if b is not None else None,
+            )
+        )
+    for operation in sorted(set(before['operations']) | set(after['operations'])):
+        for key in ('p50', 'p99'):
+            a = before['operations'].get(operation, {}).get(key)
+            b = after['operations'].get(operation, {}).get(key)
+            rows.append(
+                (
+                    f'{operation} {key} ms',
+                    a * 1000 if a is not None else None,
+                    b * 1000 if b is not None else None,
+                )
+            )
+    for label, a, b in rows:
+        lines.append(
+            f'{label:<22} {"-" if a is None else f"{a:.2f}":>10}'
+            f' {"-" if b is None else f"{b:.2f}":>10} {change(a, b):>8}'
+        )
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run')
+    parser.add_argument(
+        '--backend', choices=('kubernetes', 'docker'), default='kubernetes'
+    )
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--instances', type=int, default=50)
+    parser.add_argument(
+        '--mix',
+        type=parse_mix,
+        default=parse_mix('list=3,get=5,patch=1,delete=1'),
+        help='weights of the operations list, get, patch, delete and templates',
+    )
+    parser.add_argument(
+        '--latency', type=float, default=0.002, help='seconds added to backend calls'
+    )
+    parser.add_argument('--schedule-delay', type=float, default=0.05)
+    parser.add_argument('--ready-delay', type=float, default=0.2)
+    parser.add_argument(
+        '--wait', type=int, default=10, help='Prefer: wait seconds of gets'
+    )
+    parser.add_argument('--warm-pool', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    parser.add_argument(
+        '--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two reports'
+    )
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        reports = []
+        for file_name in args.compare:
+            with open(file_name) as f:
+                reports.append(json.load(f))
+        sys.stdout.write(compare(*reports))
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        fake = start_backend(args, workdir)
+        try:
+            start = time.perf_counter()
+            from controller import app
+
+            imported = time.perf_counter() - start
+            report = asyncio.run(drive(app, fake, args))
+            report['startup']['import'] = imported
+        finally:
+            fake.stop()
+
+    sys.stdout.write(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
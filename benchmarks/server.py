@@ -0,0 +1,140 @@
+"""
+threaded HTTP server base for the fake backends
+"""
+
+import collections
+import inspect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FakeServer:
+    """local HTTP server answering backend API calls
+
+    Subclasses implement route, which returns a status code and a payload.
+    A payload that is a generator is streamed with chunked encoding,
+    like watches and event streams. Every call is delayed by the injected
+    latency and counted per verb, every new connection is counted
+    as a handshake.
+    """
+
+    def __init__(self, latency=0.0):
+        """construct a fake server
+
+        :param latency: Seconds to delay every call with.
+        """
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.connections = 0
+        self.stopped = threading.Event()
+        self._lock = threading.Lock()
+        handler = type('Handler', (_Handler,), {'fake': self})
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.httpd.serve_forever, name=type(self).__name__, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def count(self, verb):
+        with self._lock:
+            self.calls[verb] += 1
+
+    def snapshot(self):
+        """get the call counts per verb and the number of connections"""
+        with self._lock:
+            return dict(self.calls), self.connections
+
+    def route(self, method, path, query, body):
+        """answer a call
+
+        :return tuple(int, object)
+                The status code and a JSON serializable payload,
+                None for an empty body or a generator of payloads to stream.
+        """
+        raise NotImplementedError
+
+    def _connected(self):
+        with self._lock:
+            self.connections += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake: FakeServer
+
+    def setup(self):
+        super().setup()
+        self.fake._connected()
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+        status, payload = self.fake.route(method, url.path, query, body)
+        try:
+            if inspect.isgenerator(payload):
+                self._stream(status, payload)
+            else:
+                self._send(status, payload)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _send(self, status, payload):
+        data = b'' if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, status, payload):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for item in payload:
+            chunk = json.dumps(item).encode() + b'\n'
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def log_message(self, format, *args):
+        pass
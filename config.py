@@ -1,14 +1,17 @@
+import functools
 import os
 import pathlib
 
 name = 'config-controller'
 
 
+@functools.cache
 def vcs_info():
     g = pathlib.Path(__file__).parent / 'vcs.info'
     if g.exists():
         return g.read_text().strip()
     import subprocess
+
     try:
         p = subprocess.run(['git', 'describe'], capture_output=True)
         if p.returncode == 0:
@@ -19,8 +22,58 @@ def vcs_info():
 
 
 class Config:
-    VCS_INFO = vcs_info()
     BASE_DIR = os.environ.get('BASE_DIR')
+    BACKEND = os.environ.get(
+        'BACKEND', 'kubernetes' if os.getenv('KUBERNETES_SERVICE_HOST') else 'docker'
+    )
+    TEMPLATE_FOLDER = os.environ.get('TEMPLATE_FOLDER', '/etc/config-controller')
+    TEMPLATE_POLL_SECONDS = int(os.environ.get('TEMPLATE_POLL_SECONDS', '5'))
     NAMESPACE = os.environ.get('JOB_NAMESPACE', 'default')
     CONFIG_MAP_SELECTOR = os.environ.get(
-        'CONFIGMAP_SELECTOR', 'config-controller.semafor.ch/template')
+        'CONFIGMAP_SELECTOR', 'config-controller.semafor.ch/template'
+    )
+    INFORMER_RESYNC_SECONDS = int(os.environ.get('INFORMER_RESYNC_SECONDS', '300'))
+    INFORMER_WATCH_SECONDS = int(os.environ.get('INFORMER_WATCH_SECONDS', '60'))
+    INFORMER_SYNC_TIMEOUT = int(os.environ.get('INFORMER_SYNC_TIMEOUT', '30'))
+    WARM_POOL_INTERVAL = int(os.environ.get('WARM_POOL_INTERVAL', '10'))
+    WARM_POOL_PENDING_SECONDS = int(os.environ.get('WARM_POOL_PENDING_SECONDS', '60'))
+    READY_TIMEOUT = int(os.environ.get('READY_TIMEOUT', '300'))
+    BATCH_PARALLELISM = int(os.environ.get('BATCH_PARALLELISM', '10'))
+    ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', '0'))
+    ADMISSION_BURST = int(os.environ.get('ADMISSION_BURST', '10'))
+    # the processes the admission rate is split between
+    WORKERS = int(os.environ.get('WORKERS', '1'))
+    REPLICAS = int(os.environ.get('REPLICAS', '1'))
+    MAX_STARTING = int(os.environ.get('MAX_STARTING', '0'))
+    ENDPOINT_SLICES = os.environ.get('ENDPOINT_SLICES', 'true').lower() == 'true'
+    RETRY_AFTER_MAX = int(os.environ.get('RETRY_AFTER_MAX', '30'))
+    PRE_PULL = os.environ.get('PRE_PULL', 'false').lower() == 'true'
+    PRE_PULL_INTERVAL = int(os.environ.get('PRE_PULL_INTERVAL', '60'))
+    PRE_PULL_PAUSE_IMAGE = os.environ.get(
+        'PRE_PULL_PAUSE_IMAGE', 'registry.k8s.io/pause:3.9'
+    )
+    PRE_PULL_TOOLS_IMAGE = os.environ.get('PRE_PULL_TOOLS_IMAGE', 'busybox:1.36')
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', '2'))
+    RESPONSE_CACHE_ENTRIES = int(os.environ.get('RESPONSE_CACHE_ENTRIES', '1024'))
+    RESPONSE_CACHE_BYTES = int(os.environ.get('RESPONSE_CACHE_BYTES', str(8 << 20)))
+    EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', '500'))
+    SKELETON_CACHE_ENTRIES = int(os.environ.get('SKELETON_CACHE_ENTRIES', '256'))
+    SKELETON_CACHE_BYTES = int(os.environ.get('SKELETON_CACHE_BYTES', str(16 << 20)))
+    REAPER_INTERVAL = int(os.environ.get('REAPER_INTERVAL', '60'))
+    REAPER_BATCH_SIZE = int(os.environ.get('REAPER_BATCH_SIZE', '20'))
+    REAPER_RETRIES = int(os.environ.get('REAPER_RETRIES', '5'))
+    REAPER_FINISHED_TTL = int(os.environ.get('REAPER_FINISHED_TTL', '300'))
+    IDLE_TTL = int(os.environ.get('IDLE_TTL', '0'))
+    IDLE_SWEEP_INTERVAL = int(os.environ.get('IDLE_SWEEP_INTERVAL', '60'))
+    ACTIVITY_WINDOW = int(os.environ.get('ACTIVITY_WINDOW', '300'))
+    STATE_STORE = os.environ.get('STATE_STORE', 'memory')
+    LEADER_ELECTION = os.environ.get('LEADER_ELECTION', 'false').lower() == 'true'
+    LEADER_LEASE_NAME = os.environ.get('LEADER_LEASE_NAME', 'config-controller')
+    LEADER_LOCK_FILE = os.environ.get('LEADER_LOCK_FILE', '/tmp/config-controller.lock')
+    LEADER_LEASE_SECONDS = int(os.environ.get('LEADER_LEASE_SECONDS', '15'))
+    LEADER_RENEW_SECONDS = int(os.environ.get('LEADER_RENEW_SECONDS', '5'))
+    KUBE_POOL_MAXSIZE = int(os.environ.get('KUBE_POOL_MAXSIZE', '32'))
+    KUBE_CONNECT_TIMEOUT = float(os.environ.get('KUBE_CONNECT_TIMEOUT', '5'))
+    KUBE_READ_TIMEOUT = float(os.environ.get('KUBE_READ_TIMEOUT', '30'))
+    DOCKER_POOL_MAXSIZE = int(os.environ.get('DOCKER_POOL_MAXSIZE', '32'))
+    DOCKER_TIMEOUT = int(os.environ.get('DOCKER_TIMEOUT', '60'))
@@ -1,26 +1,76 @@
 import logging
+import os
 import platform
+import threading
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
 
-from config import Config
 from config import name as appname
+from config import vcs_info
+from controller import routes
 from controller.routes import bp
 
 logger = logging.getLogger(__name__)
 
-# create and configure the app
-app = FastAPI()
+
+def warm_up():
+    try:
+        routes.warm_up()
+    except Exception as e:
+        logger.exception(e)
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    """load the backend in the background while the server starts"""
+    logger.info("{'name': '%s',  'version': '%s'}", appname, vcs_info())
+    threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    yield
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        # drop the live gauges of this worker from the shared metrics
+        multiprocess.mark_process_dead(os.getpid())
 
 
-logger.info("{'name': '%s',  'version': '%s'}", appname, Config.VCS_INFO)
+# create and configure the app
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get('/info')
-def get_info():
-    """return info"""
-    info = {'status': 'UP', 'hostname': platform.node(), 'rev': Config.VCS_INFO}
+def get_info(response: Response):
+    """return info, with status 503 until the backend is ready"""
+    info = {
+        'status': 'UP',
+        'hostname': platform.node(),
+        'rev': vcs_info(),
+        'responseCache': routes.response_cache.stats(),
+    }
+    if not routes.ready.is_set():
+        response.status_code = 503
+        info['status'] = 'STARTING'
     return info
 
 
+@app.get('/metrics')
+def get_metrics():
+    """return prometheus metrics
+
+    With several workers PROMETHEUS_MULTIPROC_DIR is set and the metrics
+    of all of them are collected from its files, whichever worker serves
+    the scrape.
+    """
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
 app.include_router(bp)
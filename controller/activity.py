@@ -0,0 +1,190 @@
+"""
+tracks the last access of instances and reclaims idle ones
+"""
+
+import logging
+import threading
+import time
+
+from config import Config
+from controller import metrics
+from controller.leader import AlwaysLeader
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    """time of the last access per instance, kept in memory
+
+    Touching an instance is a dict update, so it can be done
+    on every request without calling the backend.
+    """
+
+    def __init__(self):
+        self._last = {}
+        self._touched = set()
+        self._lock = threading.Lock()
+
+    def touch(self, app_type, name, now=None):
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._last[(app_type, name)] = now
+            self._touched.add((app_type, name))
+
+    def flush(self, templates=None, max_age=None, now=None):
+        """get the instances touched since the last flush
+
+        The accesses of app types that are not in templates or older than
+        max_age seconds are forgotten first.
+
+        :param templates: The app types with a template, None keeps all.
+        :param max_age: Seconds after which an access is forgotten,
+                        None keeps them.
+
+        :return dict
+                App type to dict of instance name to last access.
+        """
+        if now is None:
+            now = time.time()
+        with self._lock:
+            for key, last in list(self._last.items()):
+                if (templates is not None and key[0] not in templates) or (
+                    max_age is not None and now - last > max_age
+                ):
+                    del self._last[key]
+            touched, self._touched = self._touched, set()
+            flushed = {}
+            for app_type, name in touched:
+                last = self._last.get((app_type, name))
+                if last is not None:
+                    flushed.setdefault(app_type, {})[name] = last
+            return flushed
+
+    def last_access(self, app_type, name):
+        with self._lock:
+            return self._last.get((app_type, name))
+
+    def ages(self, app_type, names, now=None, shared=None):
+        """get the seconds since the last access of the instances of a type
+
+        Instances without a recorded access, e.g. after a restart of the
+        controller, count as accessed now. Instances of the type that are
+        not in names any more are forgotten.
+
+        :param names: Names of the existing instances of the type.
+        :param shared: Dict of instance names to the last access recorded
+                       by other processes, the later access counts.
+
+        :return dict
+                Name to seconds since the last access.
+        """
+        if now is None:
+            now = time.time()
+        names = set(names)
+        with self._lock:
+            for key in [k for k in self._last if k[0] == app_type]:
+                if key[1] not in names:
+                    del self._last[key]
+            for name, last in (shared or {}).items():
+                key = (app_type, name)
+                if name in names and last > self._last.get(key, 0):
+                    self._last[key] = last
+            return {
+                name: now - self._last.setdefault((app_type, name), now)
+                for name in names
+            }
+
+
+class IdleReclaimer:
+    """deletes instances that were not accessed within the idle TTL
+    of their template
+
+    Every IDLE_SWEEP_INTERVAL seconds the instances of every template are
+    taken from the instance listing and compared with their last access.
+    Instances accessed within ACTIVITY_WINDOW seconds count as active.
+    With LEADER_ELECTION every process shares the accesses it saw through
+    the backend and only the leader sweeps.
+    """
+
+    def __init__(self, tracker, api, reclaim, leader=None):
+        """construct a reclaimer
+
+        :param tracker: The ActivityTracker of the instances.
+        :param api: The backend, providing list_templates, listing, idle_ttl,
+                    record_access and last_access.
+        :param reclaim: Function called with app type and name to delete
+                        an idle instance.
+        :param leader: The leader election deciding whether to sweep.
+        """
+        self.tracker = tracker
+        self.api = api
+        self.reclaim = reclaim
+        self.leader = leader or AlwaysLeader()
+        self._thread = None
+
+    def start(self):
+        """start sweeping in a background thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name='idle-reclaimer', daemon=True
+        )
+        self._thread.start()
+
+    def sweep(self, now=None):
+        """update the activity metrics and reclaim idle instances
+
+        :return list(tuple(str, str))
+                App type and name of the reclaimed instances.
+        """
+        if now is None:
+            now = time.time()
+        reclaimed = []
+        for app_type in self.api.list_templates():
+            _, items = self.api.listing.snapshot(app_type)
+            shared = self.api.last_access(app_type) if Config.LEADER_ELECTION else None
+            ages = self.tracker.ages(
+                app_type, [e['name'] for _, e in items], now, shared
+            )
+            active = sum(age <= Config.ACTIVITY_WINDOW for age in ages.values())
+            metrics.active_instances.labels(app_type).set(active)
+            metrics.idle_instances.labels(app_type).set(len(ages) - active)
+
+            ttl = self.api.idle_ttl(app_type)
+            if not ttl:
+                continue
+            for name, age in sorted(ages.items()):
+                if age > ttl:
+                    logger.info('%s/%s idle for %ds, reclaiming', app_type, name, age)
+                    self.reclaim(app_type, name)
+                    reclaimed.append((app_type, name))
+        return reclaimed
+
+    def share(self):
+        """forget outdated accesses and record the new ones with the backend
+
+        Every process forgets the accesses of app types without a template.
+        The leader forgets those of removed instances when it sweeps, the
+        others forget accesses older than the longest idle TTL or
+        ACTIVITY_WINDOW instead. The accesses since the last call are
+        recorded with LEADER_ELECTION only.
+        """
+        templates = set(self.api.list_templates())
+        max_age = None
+        if not self.leader.is_leader:
+            ttls = [self.api.idle_ttl(app_type) or 0 for app_type in templates]
+            max_age = max(ttls + [Config.ACTIVITY_WINDOW])
+        for app_type, accesses in self.tracker.flush(templates, max_age).items():
+            if Config.LEADER_ELECTION:
+                self.api.record_access(app_type, accesses)
+
+    def _run(self):
+        while True:
+            time.sleep(Config.IDLE_SWEEP_INTERVAL)
+            try:
+                self.share()
+                if self.leader.is_leader:
+                    self.sweep()
+            except Exception as e:
+                logger.warning(e)
@@ -0,0 +1,228 @@
+"""
+rate limits and queues the creation of instances
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from controller import metrics
+from controller.lru import LruCache
+
+logger = logging.getLogger(__name__)
+
+
+def rate():
+    """get the tokens per second of this process"""
+    return Config.ADMISSION_RATE / (Config.WORKERS * Config.REPLICAS)
+
+
+def burst():
+    """get the bucket size of this process, at least one token"""
+    return max(Config.ADMISSION_BURST / (Config.WORKERS * Config.REPLICAS), 1.0)
+
+
+class Admission:
+    """creation scheduler with a token bucket and per-template limits
+
+    A creation needs a token of the bucket, refilled with ADMISSION_RATE
+    tokens per second up to ADMISSION_BURST, both divided by the WORKERS
+    times REPLICAS processes sharing them, and its template must have
+    fewer instances starting than its max-starting limit. Creations that
+    are admitted right away run in the calling thread, the others wait in
+    a queue worked off in order by a background thread, up to
+    BATCH_PARALLELISM at a time. Queued creations of a template at its
+    limit do not hold back those of other templates. The error of a failed
+    queued creation is raised by the next submit of the same instance.
+    """
+
+    def __init__(self, max_starting, starting):
+        """construct a scheduler
+
+        :param max_starting: Function returning the max-starting limit of
+                             an app type, 0 for no limit.
+        :param starting: Function returning the number of instances of an
+                         app type that are created but not ready yet.
+        """
+        self.max_starting = max_starting
+        self.starting = starting
+        self._tokens = burst()
+        self._refilled = time.monotonic()
+        self._queue = {}
+        self._running = set()
+        self._failed = LruCache(4096, 4096)
+        self._creating = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=Config.BATCH_PARALLELISM, thread_name_prefix='admission'
+        )
+        self._thread = None
+
+    def submit(self, app_type, name, create):
+        """create an instance now or queue its creation
+
+        :param create: Function creating the instance, exceptions of
+                       creations run right away or of the last queued
+                       creation are raised.
+
+        :return int
+                0 if the instance was created, otherwise its queue position.
+        """
+        key = (app_type, name)
+        error = self.failure(app_type, name)
+        if error is not None:
+            raise error
+        with self._cond:
+            if key in self._queue:
+                return self.position(app_type, name)
+            if key in self._running:
+                return 0
+            queued = any(t == app_type for t, _ in self._queue)
+            if queued or not self._admit(app_type):
+                self._queue[key] = (create, time.monotonic())
+                self._update_depth(app_type)
+                self._start()
+                self._cond.notify()
+                return len(self._queue)
+        label = metrics.app_type_label(app_type)
+        metrics.admission_wait_seconds.labels(label).observe(0)
+        self._create(app_type, create)
+        return 0
+
+    def position(self, app_type, name):
+        """get the queue position of an instance, None if it is not queued"""
+        with self._cond:
+            for position, key in enumerate(self._queue, 1):
+                if key == (app_type, name):
+                    return position
+        return None
+
+    def pending(self, app_type, name):
+        """whether the creation of an instance is queued or still running"""
+        with self._cond:
+            key = (app_type, name)
+            return key in self._queue or key in self._running
+
+    def failure(self, app_type, name):
+        """take the error of the last queued creation of an instance
+
+        :return Exception
+                The error or None if the creation did not fail.
+        """
+        return self._failed.pop((app_type, name))
+
+    def cancel(self, app_type, name):
+        """remove a creation from the queue
+
+        :return bool
+                Whether the creation was queued.
+        """
+        with self._cond:
+            if self._queue.pop((app_type, name), None) is None:
+                return False
+            self._update_depth(app_type)
+            return True
+
+    def wait_estimate(self, position):
+        """estimate the seconds until a queue position gets its token
+
+        :return float
+                0 without rate limit, the limits of starting instances
+                are not taken into account.
+        """
+        if Config.ADMISSION_RATE <= 0:
+            return 0.0
+        with self._cond:
+            return max(position - self._tokens, 0.0) / rate()
+
+    def _admit(self, app_type):
+        """take a token and a starting slot if both are available
+
+        Must be called with the lock held.
+        """
+        if Config.ADMISSION_RATE > 0:
+            now = time.monotonic()
+            self._tokens = min(
+                self._tokens + (now - self._refilled) * rate(),
+                burst(),
+            )
+            self._refilled = now
+            if self._tokens < 1:
+                return False
+        limit = self.max_starting(app_type)
+        creating = self._creating.get(app_type, 0)
+        if limit and self.starting(app_type) + creating >= limit:
+            return False
+        if Config.ADMISSION_RATE > 0:
+            self._tokens -= 1
+        self._creating[app_type] = creating + 1
+        return True
+
+    def _create(self, app_type, create):
+        try:
+            create()
+        finally:
+            with self._cond:
+                self._creating[app_type] -= 1
+                self._cond.notify()
+
+    def _update_depth(self, app_type):
+        # the types without a template share the unknown label
+        label = metrics.app_type_label(app_type)
+        depth = sum(metrics.app_type_label(t) == label for t, _ in self._queue)
+        metrics.admission_queue.labels(label).set(depth)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='admission', daemon=True
+            )
+            self._thread.start()
+
+    def run_once(self):
+        """start the first admissible queued creation
+
+        :return Future
+                The started creation or None if none is admissible.
+        """
+        with self._cond:
+            blocked = set()
+            for key in self._queue:
+                if key[0] in blocked:
+                    continue
+                if self._admit(key[0]):
+                    break
+                blocked.add(key[0])
+            else:
+                return None
+            app_type = key[0]
+            create, queued = self._queue.pop(key)
+            self._running.add(key)
+            self._update_depth(app_type)
+        label = metrics.app_type_label(app_type)
+        metrics.admission_wait_seconds.labels(label).observe(time.monotonic() - queued)
+        return self._executor.submit(self._create_queued, key, create)
+
+    def _create_queued(self, key, create):
+        try:
+            self._create(key[0], create)
+        except Exception as e:
+            logger.warning('creating %s/%s failed: %s', *key, e)
+            self._failed.put(key, e, 1)
+        finally:
+            with self._cond:
+                self._running.discard(key)
+
+    def _run(self):
+        while True:
+            if self.run_once() is not None:
+                continue
+            with self._cond:
+                # the starting instances change without notification,
+                # so look again after a while even without a new token
+                timeout = 1.0
+                if Config.ADMISSION_RATE > 0 and self._tokens < 1:
+                    timeout = min(timeout, (1 - self._tokens) / rate())
+                self._cond.wait(timeout)
@@ -0,0 +1,63 @@
+"""
+registry of the backends, imported and initialized on first use
+"""
+
+import importlib
+import threading
+
+from config import Config
+
+# backend name to the module and class implementing it
+registry = {
+    'kubernetes': ('controller.kubernetes_api', 'KubernetesApi'),
+    'docker': ('controller.docker_api', 'DockerApi'),
+}
+
+_api = None
+_lock = threading.Lock()
+
+
+def register(name, module, class_name):
+    """add a backend that can be selected with BACKEND
+
+    :param module: Name of the module, it is imported on first use and
+                   its load_config function called before the class
+                   is instantiated.
+    :param class_name: Name of the backend class in the module.
+    """
+    registry[name] = (module, class_name)
+
+
+def loaded():
+    """whether the backend is loaded"""
+    return _api is not None
+
+
+def load():
+    """get the backend selected with BACKEND, loading it on first use
+
+    Importing the client library and syncing the caches of the backend
+    can take seconds, concurrent callers wait for the first one.
+
+    :return
+            The backend instance, e.g. a KubernetesApi.
+    """
+    global _api
+    if _api is not None:
+        return _api
+    with _lock:
+        if _api is None:
+            if Config.BACKEND not in registry:
+                raise ValueError('unknown backend ' + Config.BACKEND)
+            module_name, class_name = registry[Config.BACKEND]
+            module = importlib.import_module(module_name)
+            module.load_config()
+            _api = getattr(module, class_name)()
+    return _api
+
+
+class LazyApi:
+    """stand-in for the backend that loads it on first attribute access"""
+
+    def __getattr__(self, name):
+        return getattr(load(), name)
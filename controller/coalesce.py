@@ -0,0 +1,72 @@
+"""
+coalesces concurrent label patches of the same instance
+"""
+
+import threading
+
+from controller import metrics
+
+
+class _Batch:
+    def __init__(self):
+        self.changes = {}
+        self.done = False
+        self.error = None
+
+
+class PatchCoalescer:
+    """merge concurrent patches per instance into one backend call
+
+    While a patch of an instance is being sent, further patches of it
+    are merged into the next batch, which is sent by one of their callers
+    as soon as the running one finished. Every caller returns once its
+    changes were sent, or raises the error of the call that sent them.
+    Later changes of a key win over earlier ones within a batch.
+    """
+
+    def __init__(self, send):
+        """construct a coalescer
+
+        :param send: Function called with the key and the merged changes,
+                     raising on failure.
+        """
+        self.send = send
+        self._pending = {}
+        self._running = set()
+        self._cond = threading.Condition()
+
+    def patch(self, key, changes):
+        """send changes of an instance, merged with concurrent ones
+
+        :param key: (app_type, name) tuple of the instance.
+        :param changes: Dict of the changes.
+        """
+        with self._cond:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch()
+            else:
+                metrics.label_patches.labels(key[0], 'coalesced').inc()
+            batch.changes.update(changes)
+            while key in self._running and not batch.done:
+                self._cond.wait()
+            if not batch.done:
+                # this caller sends the batch, later ones start a new one
+                del self._pending[key]
+                self._running.add(key)
+        if batch.done:
+            if batch.error is not None:
+                raise batch.error
+            return
+
+        try:
+            self.send(key, batch.changes)
+            metrics.label_patches.labels(key[0], 'sent').inc()
+        except Exception as e:
+            batch.error = e
+            raise
+        finally:
+            with self._cond:
+                batch.done = True
+                self._running.discard(key)
+                self._cond.notify_all()
@@ -2,32 +2,53 @@
 lists, creates and deletes pods with docker API
 """
 
+import asyncio
 import configparser
 import datetime
-import glob
+import functools
 import logging
 import os
 import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import docker
 
 from config import Config
+from controller import metrics
+from controller.admission import Admission
+from controller.leader import AlwaysLeader, FileLockElector
+from controller.listing import InstanceListing
+from controller.readiness import retry_after
+from controller.state import MemoryStore, open_store
 
 logger = logging.getLogger(__name__)
 
-TEMPLATE_FOLDER = '/etc/config-controller'
+TEMPLATE_FOLDER = Config.TEMPLATE_FOLDER
 name_label = 'config-controller.semafor.ch/instance-name'
 type_label = 'config-controller.semafor.ch/instance-type'
 
 client: docker.DockerClient
 docker_network: str
 work_dir: str
-meta_labels: dict[str, dict[str, str]] = {}
+registry: 'ContainerRegistry'
+templates: 'TemplateCatalogue'
+
+
+# docker labels can not be changed on running containers, so the metadata
+# set with add_labels is kept here per container name, shared by the workers
+# with a STATE_STORE other than memory
+state = MemoryStore()
+# summaries of the running instances per app type, kept up to date by the registry
+listing = InstanceListing()
 
 
 def load_config():
-    global client, docker_network, work_dir
-    client = docker.DockerClient()
+    global client, docker_network, work_dir, registry, templates, state
+    client = docker.DockerClient.from_env(
+        max_pool_size=Config.DOCKER_POOL_MAXSIZE, timeout=Config.DOCKER_TIMEOUT
+    )
     cc_container = client.containers.get(socket.gethostname())
     work_dir = cc_container.labels['com.docker.compose.project.working_dir']
     networks = list(cc_container.attrs['NetworkSettings']['Networks'])
@@ -38,33 +59,462 @@ def load_config():
         docker_network = 'bridge'
         logger.warning('WARNING: Use default network: %s', docker_network)
 
+    state = open_store(Config.STATE_STORE)
+    templates = TemplateCatalogue(TEMPLATE_FOLDER)
+    templates.start()
+    metrics.templates = templates
+    registry = ContainerRegistry()
+    registry.start()
+    if not registry.wait_for_sync(Config.INFORMER_SYNC_TIMEOUT):
+        logger.warning('container registry not synced')
+    if state.shared:
+        threading.Thread(target=_follow_state, name='state', daemon=True).start()
+
+
+def _follow_state():
+    """republish the listing when another worker changed meta labels"""
+    version = state.version()
+    while True:
+        time.sleep(1)
+        try:
+            current = state.version()
+            if current != version:
+                version = current
+                for entry in registry.entries():
+                    _publish(entry)
+        except Exception as e:
+            logger.warning(e)
+
+
+def _container_entry(attrs):
+    """extract the indexed fields of an inspected managed container
+
+    :param attrs: The inspect result of the container.
+
+    :return dict
+            The container id and name, instance type and name,
+            ip address, start timestamp, whether it is running,
+            its status and finish timestamp.
+    """
+    labels = attrs['Config']['Labels'] or {}
+    networks = attrs['NetworkSettings']['Networks'] or {}
+    return {
+        'id': attrs['Id'],
+        'container_name': attrs['Name'].lstrip('/'),
+        'type': labels.get(type_label),
+        'name': labels.get(name_label),
+        'ip': networks.get(docker_network, {}).get('IPAddress'),
+        'start': _timestamp(attrs['State'].get('StartedAt')),
+        'running': attrs['State']['Running'],
+        'status': attrs['State'].get('Status'),
+        'finished': _timestamp(attrs['State'].get('FinishedAt')),
+    }
+
+
+def _timestamp(value):
+    """parse a docker time like 2024-01-01T10:00:00.123456789Z, 0 if unset"""
+    try:
+        return datetime.datetime.strptime(
+            (value or '').split('.')[0], '%Y-%m-%dT%H:%M:%S'
+        ).timestamp()
+    except ValueError:
+        return 0
+
+
+def _publish(entry):
+    """update the instance listing from the registry entry of a container"""
+    container_name = entry['container_name']
+    if entry['running']:
+        name = entry['name']
+        listing.put(
+            entry['type'],
+            container_name,
+            {
+                'ip': entry['ip'],
+                'name': name,
+                'sessionID': name,
+                'hostname': name,
+                'addr': entry['ip'],
+                'start': entry['start'],
+            }
+            | state.get('meta-labels', container_name),
+        )
+    else:
+        listing.discard(entry['type'], container_name)
+    metrics.instances.labels(entry['type']).set(listing.count(entry['type']))
+
+
+def _unpublish(entry):
+    listing.discard(entry['type'], entry['container_name'])
+    metrics.instances.labels(entry['type']).set(listing.count(entry['type']))
+
+
+def template_setting(app_type, key, default):
+    """get a numeric setting from the properties file of a template
+
+    :return int
+            The setting, at least 0, or the default if it is not set or invalid.
+    """
+    try:
+        value = templates.properties(app_type).get(key)
+    except Exception:
+        return default
+    if value is None:
+        return default
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        logger.warning('invalid %s %s of %s', key, value, app_type)
+        return default
+
+
+def max_starting(app_type):
+    """get how many containers of an app type may be started at once
+
+    Set with max_starting in the properties file of the template,
+    MAX_STARTING applies to templates without it.
+    """
+    return template_setting(app_type, 'max_starting', Config.MAX_STARTING)
+
+
+# containers are ready once started, only the running starts count
+admission = Admission(max_starting, lambda app_type: 0)
+
+
+class ContainerRegistry:
+    """indexed view of the managed containers
+
+    Lists the containers with the instance type label once and then follows
+    the docker event stream, inspecting only containers that changed.
+    Reads never go to the docker daemon and do not take a lock:
+    every change builds new index dicts that replace the old ones.
+    """
+
+    def __init__(self):
+        self._by_name = {}
+        self._by_type = {}
+        self._by_instance = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """start listing and following events in a background thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name='container-registry', daemon=True
+        )
+        self._thread.start()
+
+    def wait_for_sync(self, timeout=None):
+        return self._synced.wait(timeout)
+
+    def get(self, container_name):
+        """get the entry of a container by its name or None"""
+        return self._by_name.get(container_name)
+
+    def by_type(self, app_type):
+        """get the entries of all containers of an app type sorted by name"""
+        return self._by_type.get(app_type, [])
+
+    def entries(self):
+        """get the entries of all containers"""
+        return list(self._by_name.values())
+
+    def by_instance(self, name):
+        """get the entries of all containers with an instance name"""
+        return self._by_instance.get(name, [])
+
+    def update(self, attrs):
+        """add or replace a container from its inspect result"""
+        entry = _container_entry(attrs)
+        if entry['type'] is None:
+            return
+        with self._lock:
+            by_name = dict(self._by_name)
+            by_name[entry['container_name']] = entry
+            self._swap(by_name)
+
+    def remove(self, container_id):
+        with self._lock:
+            by_name = {
+                k: v for k, v in self._by_name.items() if v['id'] != container_id
+            }
+            self._swap(by_name)
+
+    def _swap(self, by_name):
+        by_type = {}
+        by_instance = {}
+        for entry in sorted(by_name.values(), key=lambda e: e['container_name']):
+            by_type.setdefault(entry['type'], []).append(entry)
+            by_instance.setdefault(entry['name'], []).append(entry)
+        previous = self._by_name
+        self._by_name, self._by_type, self._by_instance = by_name, by_type, by_instance
+
+        for container_name, entry in previous.items():
+            if container_name not in by_name:
+                _unpublish(entry)
+        for container_name, entry in by_name.items():
+            if previous.get(container_name) != entry:
+                _publish(entry)
+
+    def _list(self):
+        with metrics.backend_call('docker', 'containers.list'):
+            containers = client.api.containers(all=True, filters={'label': type_label})
+        by_name = {}
+        for summary in containers:
+            with metrics.backend_call('docker', 'containers.get'):
+                attrs = client.api.inspect_container(summary['Id'])
+            entry = _container_entry(attrs)
+            by_name[entry['container_name']] = entry
+        with self._lock:
+            self._swap(by_name)
+        self._synced.set()
+
+    def _follow(self, since):
+        events = client.events(
+            since=since,
+            decode=True,
+            filters={'type': 'container', 'label': type_label},
+        )
+        for event in events:
+            container_id = event['Actor']['ID']
+            if event['Action'] == 'destroy':
+                self.remove(container_id)
+            elif event['Action'] in ('create', 'start', 'die', 'stop', 'rename'):
+                try:
+                    with metrics.backend_call('docker', 'containers.get'):
+                        self.update(client.api.inspect_container(container_id))
+                except docker.errors.NotFound:
+                    self.remove(container_id)
+
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                # follow from before the listing so no change is missed
+                since = int(time.time())
+                self._list()
+                backoff = 1
+                self._follow(since)
+            except Exception as e:
+                logger.warning(e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+class TemplateCatalogue:
+    """templates in the properties files of the template folder
+
+    The folder is checked every TEMPLATE_POLL_SECONDS and only rescanned
+    if a properties file was added, changed or removed, so listing templates
+    does not touch the file system.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._templates = {}
+        self._properties = {}
+        self._stamp = None
+        self._thread = None
+
+    def start(self):
+        """scan the folder and follow its changes in a background thread"""
+        if self._thread is not None:
+            return
+        self.refresh()
+        self._thread = threading.Thread(
+            target=self._run, name='template-catalogue', daemon=True
+        )
+        self._thread.start()
+
+    def __contains__(self, app_type):
+        return app_type in self._templates
+
+    def list_templates(self):
+        return list(self._templates)
+
+    def template_info(self):
+        """get the metadata of all templates
+
+        :return list(dict(name=str, source=str, revision=str,
+                          variables=list, modified=float))
+        """
+        return list(self._templates.values())
+
+    def properties(self, app_type):
+        """get the parsed properties file of a template
+
+        The file is parsed once per revision.
+
+        :return dict
+                The properties, empty if there is no such template.
+        """
+        entry = self._templates.get(app_type)
+        if entry is None:
+            return {}
+        key = (entry['source'], entry['revision'])
+        properties = self._properties.get(key)
+        if properties is None:
+            config_parser = configparser.RawConfigParser(allow_unnamed_section=True)
+            config_parser.read(entry['source'])
+            properties = dict(config_parser.items(configparser.UNNAMED_SECTION))
+            self._properties = {
+                k: v for k, v in self._properties.items() if k[0] != entry['source']
+            } | {key: properties}
+        return properties
+
+    def refresh(self):
+        """rescan the folder if its properties files changed"""
+        try:
+            files = sorted(
+                (e.name, e.path, e.stat().st_mtime_ns)
+                for e in os.scandir(self.folder)
+                if e.name.endswith('.properties') and e.is_file()
+            )
+        except FileNotFoundError:
+            files = []
+        if files == self._stamp:
+            return
+
+        self._templates = {
+            file_name.removesuffix('.properties'): {
+                'name': file_name.removesuffix('.properties'),
+                'source': path,
+                'revision': str(mtime),
+                # properties files are not rendered, they have no variables
+                'variables': [],
+                'modified': mtime / 1e9,
+            }
+            for file_name, path, mtime in files
+        }
+        self._stamp = files
+
+    def _run(self):
+        while True:
+            time.sleep(Config.TEMPLATE_POLL_SECONDS)
+            try:
+                self.refresh()
+            except OSError as e:
+                logger.warning(e)
+
+
+class ImagePrePuller:
+    """pulls the images of the templates before their containers start
+
+    Templates opt in with pre_pull = true in their properties file,
+    PRE_PULL sets the default. The leader pulls the missing images when
+    it starts and every PRE_PULL_INTERVAL seconds, the docker host is
+    the only node.
+    """
+
+    def __init__(self, leader=None):
+        self.leader = leader or AlwaysLeader()
+        self._pulling = set()
+        self._errors = set()
+        self._node = None
+        self._thread = None
+
+    def start(self):
+        """start pulling in a background thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='pre-pull', daemon=True)
+        self._thread.start()
+
+    def images(self):
+        """get the images to pre-pull
+
+        :return dict
+                Image to the names of the templates using it.
+        """
+        images = {}
+        for app_type in templates.list_templates():
+            properties = templates.properties(app_type)
+            enabled = properties.get('pre_pull', str(Config.PRE_PULL))
+            if enabled.lower() == 'true' and properties.get('image'):
+                images.setdefault(properties['image'], []).append(app_type)
+        return images
+
+    def pull(self):
+        """pull the images that are not on the docker host"""
+        for image in self.images():
+            if self._present(image):
+                continue
+            self._pulling.add(image)
+            try:
+                with metrics.backend_call('docker', 'images.pull'):
+                    client.images.pull(image)
+                self._errors.discard(image)
+            except docker.errors.APIError as e:
+                logger.warning('pulling %s failed: %s', image, e)
+                self._errors.add(image)
+            finally:
+                self._pulling.discard(image)
+
+    def status(self):
+        """get the pull status of the pre-pulled images
+
+        :return list(dict(image=str, templates=list, nodes=dict))
+                The nodes map the docker host to pulled, pulling or error.
+        """
+        if self._node is None:
+            with metrics.backend_call('docker', 'info'):
+                self._node = client.info()['Name']
+        result = []
+        for image, app_types in sorted(self.images().items()):
+            if image not in self._pulling and self._present(image):
+                status = 'pulled'
+            elif image in self._errors:
+                status = 'error'
+            else:
+                status = 'pulling'
+            result.append(
+                {'image': image, 'templates': app_types, 'nodes': {self._node: status}}
+            )
+        return result
+
+    def _present(self, image):
+        try:
+            with metrics.backend_call('docker', 'images.get'):
+                client.images.get(image)
+        except docker.errors.ImageNotFound:
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                if self.leader.is_leader:
+                    self.pull()
+            except Exception as e:
+                logger.warning(e)
+            time.sleep(Config.PRE_PULL_INTERVAL)
+
 
 class IntensJob:
     def __init__(self, app_type, name, create=True, template_variables=None):
         if template_variables is None:
             template_variables = {}
-        properties_file = os.path.join(TEMPLATE_FOLDER, app_type + '.properties')
-        config_parser = configparser.RawConfigParser(allow_unnamed_section=True)
-        config_parser.read(properties_file)
+        self.app_type = app_type
+        self.name = name
         self.container_name = app_type + '-' + name
+        self.container_id = None
 
-        if self.container_name not in meta_labels.keys():
-            meta_labels[self.container_name] = {}
-
-        try:
-            self.container = client.containers.get(self.container_name)
-            self.ip = self.container.attrs['NetworkSettings']['Networks'][
-                docker_network
-            ]['IPAddress']
+        with metrics.stage(app_type, 'lookup'):
+            entry = registry.get(self.container_name)
+        if entry is not None:
+            self.container_id = entry['id']
+            self.ip = entry['ip']
+            return
+        if not create:
             return
-        except:
-            if not create:
-                return
 
         self.env = {}
         self.volumes = []
 
-        for key, val in config_parser.items(configparser.UNNAMED_SECTION):
+        for key, val in templates.properties(app_type).items():
             if key == 'image':
                 self.image = val
                 continue
@@ -83,41 +533,80 @@ class IntensJob:
                 # self.volumes[key.removeprefix("volume.")] = val
                 continue
 
-        client.containers.run(
-            self.image,
-            name=self.container_name,
-            environment=self.env,
-            volumes=self.volumes,
-            labels={name_label: name, type_label: app_type},
-            network=docker_network,
-            detach=True,
-        )
-        self.container = client.containers.get(self.container_name)
-        self.ip = self.container.attrs['NetworkSettings']['Networks'][docker_network][
-            'IPAddress'
-        ]
-        pass
+        self.ip = None
+        admission.submit(app_type, name, self._run_container)
+
+    def _run_container(self):
+        with (
+            metrics.stage(self.app_type, 'create'),
+            metrics.backend_call('docker', 'containers.run', self.app_type),
+        ):
+            container = client.containers.run(
+                self.image,
+                name=self.container_name,
+                environment=self.env,
+                volumes=self.volumes,
+                labels={name_label: self.name, type_label: self.app_type},
+                network=docker_network,
+                detach=True,
+            )
+        with metrics.backend_call('docker', 'containers.get', self.app_type):
+            container.reload()
+        # do not wait for the start event to make the container visible
+        registry.update(container.attrs)
+        self.container_id = container.id
+        self.ip = registry.get(self.container_name)['ip']
 
     def get_ip(self):
+        if not self.exists:
+            return False, 'queued'
+        metrics.ready_outcome(self.app_type, True, None)
         return True, self.ip
         # return False, "unfinished"
         pass
 
+    async def wait_ip(self, timeout=10):
+        return self.get_ip()
+
+    def eta(self):
+        """containers are ready once they run, None if not created yet"""
+        return 0.0 if self.exists else None
+
+    def phase(self):
+        if not self.exists:
+            if admission.position(self.app_type, self.name) is not None:
+                return 'pending', 'queued'
+            return 'error', 'not_found'
+        return 'ready', self.ip
+
+    async def wait_phase(self, phase, timeout):
+        # containers are ready once they are started, the phase does not change
+        await asyncio.sleep(timeout)
+        return self.phase()
+
     def get_meta_labels(self):
-        return meta_labels[self.container_name]
+        return state.get('meta-labels', self.container_name)
 
     def add_labels(self, pod_labels):
-        for key, val in pod_labels.items():
-            meta_labels[self.container_name][key] = val
+        state.update('meta-labels', self.container_name, pod_labels)
+        entry = registry.get(self.container_name)
+        if entry is not None:
+            _publish(entry)
 
     @property
     def exists(self):
-        return hasattr(self, 'container') and self.container is not None
+        return self.container_id is not None
 
     def _delete(self):
         if self.exists:
-            self.container.remove(force=True)
-            del meta_labels[self.container_name]
+            try:
+                with metrics.backend_call('docker', 'container.remove', self.app_type):
+                    client.api.remove_container(self.container_id, force=True)
+            except docker.errors.NotFound:
+                logger.info('container %s already removed', self.container_name)
+            registry.remove(self.container_id)
+            state.delete('meta-labels', self.container_name)
+            state.delete('activity', self.app_type + '/' + self.name)
             return True
 
         return False
@@ -125,37 +614,24 @@ class IntensJob:
 
 class DockerApi:
     def __init__(self):
-        pass
+        self.listing = listing
+        if Config.LEADER_ELECTION:
+            self.leader = FileLockElector(Config.LEADER_LOCK_FILE)
+        else:
+            self.leader = AlwaysLeader()
+        self.leader.start()
+        self.pre_puller = ImagePrePuller(self.leader)
+        self.pre_puller.start()
+        self.admission = admission
 
     def get_jobs(self, type):
-        jobs = []
-        for container in client.containers.list(
-            filters={'label': f'{type_label}={type}'}
-        ):
-            logger.info(container.attrs)
-            ip = container.attrs['NetworkSettings']['Networks'][docker_network][
-                'IPAddress'
-            ]
-            name = container.labels[name_label]
-            time: str = container.attrs['State']['StartedAt'].split('.')[0]
-            start = datetime.datetime.strptime(time, '%Y-%m-%dT%H:%M:%S').timestamp()
-            jobs.append(
-                {
-                    'ip': ip,
-                    'name': name,
-                    'sessionID': name,
-                    'hostname': name,
-                    'addr': ip,
-                    'start': start,
-                }
-            )
-
-        return jobs
+        return [entry for _, entry in listing.snapshot(type)[1]]
 
     def list_templates(self):
-        template_files = glob.glob(os.path.join(TEMPLATE_FOLDER, '*.properties'))
+        return templates.list_templates()
 
-        return [os.path.basename(f.removesuffix('.properties')) for f in template_files]
+    def template_info(self):
+        return templates.template_info()
 
     def get_job(self, type, name, create=True, template_variables=None):
         if template_variables is None:
@@ -163,5 +639,181 @@ class DockerApi:
         job = IntensJob(type, name, create, template_variables)
         return job
 
-    def delete_job(self, type, name):
-        return self.get_job(type, name, create=False)._delete()
+    def export_instances(self, type=None):
+        """iterate over all instances of the container registry
+
+        The registry is kept in memory anyway, the rows are built one
+        at a time while iterating.
+
+        :param type: App type to restrict the export to, all types if None.
+
+        :return iterator(dict(type=str, name=str, ip=str, phase=str,
+                              start=float, labels=dict))
+        """
+        entries = registry.entries() if type is None else registry.by_type(type)
+        for entry in entries:
+            if entry['running']:
+                phase = 'ready'
+            elif entry['status'] in ('exited', 'dead'):
+                phase = 'finished'
+            else:
+                phase = 'pending'
+            yield {
+                'type': entry['type'],
+                'name': entry['name'],
+                'ip': entry['ip'],
+                'phase': phase,
+                'start': entry['start'],
+                'labels': state.get('meta-labels', entry['container_name']),
+            }
+
+    def pre_pull_status(self):
+        """get the pull status of the pre-pulled template images
+
+        :return list(dict(image=str, templates=list, nodes=dict))
+        """
+        return self.pre_puller.status()
+
+    def retry_after(self, type, name):
+        """suggest when to ask again for an instance that is not ready
+
+        :return int
+                Seconds for the Retry-After header, from the admission queue.
+        """
+        position = admission.position(type, name)
+        if position is None:
+            return retry_after(None)
+        return retry_after(admission.wait_estimate(position))
+
+    def create_jobs(self, type, instances):
+        """create many instances of an app type at once
+
+        :param type: What application you want instances of.
+        :param instances: List of (name, template_variables) tuples.
+
+        :return list(dict(name=str, status=str))
+                The status of each instance, one of created,
+                queued with its position, exists or error.
+                Repeated names are created once and reported as duplicate.
+        """
+        seen = set()
+        duplicates = set()
+        for i, (name, _) in enumerate(instances):
+            if name in seen:
+                duplicates.add(i)
+            seen.add(name)
+
+        def submit(i, name, template_variables):
+            if i in duplicates:
+                return {'name': name, 'status': 'duplicate'}
+            try:
+                if IntensJob(type, name, create=False).exists:
+                    return {'name': name, 'status': 'exists'}
+                job = IntensJob(type, name, True, template_variables)
+            except Exception as e:
+                return {'name': name, 'status': 'error', 'msg': str(e)}
+            position = admission.position(type, name)
+            if not job.exists and position is not None:
+                return {'name': name, 'status': 'queued', 'position': position}
+            return {'name': name, 'status': 'created'}
+
+        with ThreadPoolExecutor(max_workers=Config.BATCH_PARALLELISM) as executor:
+            return list(
+                executor.map(
+                    lambda args: submit(args[0], *args[1]), enumerate(instances)
+                )
+            )
+
+    def patch_jobs(self, type, instances):
+        """set and remove meta labels of many instances of an app type at once
+
+        :param type: What application the instances are of.
+        :param instances: Dict of instance names to dicts of labels,
+                          a None value removes the label.
+
+        :return list(dict(name=str, status=str))
+                The status of each instance, one of patched, not_found or error.
+        """
+
+        def patch(name, labels):
+            try:
+                job = IntensJob(type, name, create=False)
+                if not job.exists:
+                    return {'name': name, 'status': 'not_found'}
+                job.add_labels(labels)
+            except Exception as e:
+                return {'name': name, 'status': 'error', 'msg': str(e)}
+            return {'name': name, 'status': 'patched'}
+
+        with ThreadPoolExecutor(max_workers=Config.BATCH_PARALLELISM) as executor:
+            return list(executor.map(lambda args: patch(*args), instances.items()))
+
+    def find_job(self, name):
+        """find a running instance by name in any app type
+
+        :return IntensJob
+                The instance or None if there is none of that name.
+        """
+        for entry in registry.by_instance(name):
+            if entry['running']:
+                return IntensJob(entry['type'], name, create=False)
+        return None
+
+    def record_access(self, type, accesses):
+        """share the last access of instances with the other workers
+
+        :param accesses: Dict of instance names to access timestamps.
+        """
+        for name, last in accesses.items():
+            state.update('activity', type + '/' + name, {'last': last})
+
+    def last_access(self, type):
+        """get the last access of the instances of a type recorded by any worker
+
+        :return dict
+                Instance name to access timestamp.
+        """
+        return {
+            key.removeprefix(type + '/'): value['last']
+            for key, value in state.items('activity').items()
+            if key.startswith(type + '/') and 'last' in value
+        }
+
+    def idle_ttl(self, type):
+        """get the seconds after which idle instances of a type are deleted
+
+        Set with idle_ttl in the properties file of the template,
+        IDLE_TTL applies to templates without it.
+
+        :return int
+                The TTL in seconds, 0 if idle instances are kept.
+        """
+        return template_setting(type, 'idle_ttl', Config.IDLE_TTL)
+
+    def collect_finished(self):
+        """find containers that exited more than REAPER_FINISHED_TTL ago
+
+        :return list(tuple(str, str, function))
+                App type, instance name and a function removing the container.
+        """
+        deadline = time.time() - Config.REAPER_FINISHED_TTL
+        finished = []
+        for entry in registry.entries():
+            if (
+                entry['status'] not in ('exited', 'dead')
+                or entry['finished'] > deadline
+            ):
+                continue
+            finished.append(
+                (
+                    entry['type'],
+                    entry['name'],
+                    functools.partial(self.delete_job, entry['type'], entry['name']),
+                )
+            )
+        return finished
+
+    def delete_job(self, type, name, job=None):
+        if job is None:
+            job = self.get_job(type, name, create=False)
+        return job._delete()
@@ -2,23 +2,100 @@
 lists, creates and deletes pods with kubernetes API
 """
 
+import asyncio
+import copy
+import datetime
+import functools
+import hashlib
+import json
 import logging
 import os
+import re
+import secrets
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
 from mako.template import Template
+from urllib3.connection import HTTPConnection
 
 from config import Config
+from controller import metrics
+from controller.admission import Admission
+from controller.coalesce import PatchCoalescer
+from controller.leader import AlwaysLeader, identity
+from controller.listing import InstanceListing
+from controller.lru import LruCache
+from controller.readiness import StartupEstimates, retry_after
 
 logger = logging.getLogger(__name__)
 
 meta_label_prefix = 'config-controller.semafor.ch/meta-'
 name_label = 'config-controller.semafor.ch/instance-name'
 type_label = 'config-controller.semafor.ch/instance-type'
+pool_label = 'config-controller.semafor.ch/pool'
+warm_pool_annotation = 'config-controller.semafor.ch/warm-pool'
+idle_ttl_annotation = 'config-controller.semafor.ch/idle-ttl'
+max_starting_annotation = 'config-controller.semafor.ch/max-starting'
+last_access_annotation = 'config-controller.semafor.ch/last-access'
+skeleton_cache_annotation = 'config-controller.semafor.ch/skeleton-cache'
+pre_pull_annotation = 'config-controller.semafor.ch/pre-pull'
+pre_pull_label = 'config-controller.semafor.ch/pre-pull-image'
+pre_pull_image_annotation = 'config-controller.semafor.ch/pre-pull-image'
+# pod spec fields deciding the nodes a template's pods may run on
+placement_fields = ('nodeSelector', 'affinity', 'tolerations', 'imagePullSecrets')
+# waiting reasons of containers whose image can not be pulled
+pull_errors = ('ErrImagePull', 'ImagePullBackOff', 'InvalidImageName')
+# template variables are read as alternatives['name'] or alternatives.get('name')
+variable_pattern = re.compile(r"""alternatives(?:\[|\.get\()\s*(['"])(\w+)\1""")
+
+
+# process-wide api client, shared by all jobs, informers and watches
+api_client: client.ApiClient | None = None
+core_v1: client.CoreV1Api | None = None
+batch_v1: client.BatchV1Api | None = None
+
+pod_informer: 'Informer'
+job_informer: 'Informer'
+config_map_informer: 'Informer'
+# endpoint slices of the services selecting instances, None if disabled
+endpoint_informer: 'Informer | None' = None
+template_registry: 'TemplateRegistry'
+warm_pool: 'WarmPool'
+pre_puller: 'ImagePrePuller'
+# summaries of the running instances per app type, kept up to date by the pod informer
+listing = InstanceListing()
+# observed startup durations per app type, for the Retry-After hints
+startup_estimates = StartupEstimates()
+# job name to whether it was deleted since it was last seen
+deleted_jobs = LruCache(4096, 4096)
+
+
+class SharedApiClient(client.ApiClient):
+    """api client applying default timeouts to every request
+
+    Requests without an explicit timeout get the configured connect and
+    read timeout. Streaming requests like watches only get the connect
+    timeout, their duration is limited with timeout_seconds instead.
+    """
+
+    def request(self, method, url, *args, _request_timeout=None, **kwargs):
+        if _request_timeout is None:
+            read_timeout = Config.KUBE_READ_TIMEOUT
+            if not kwargs.get('_preload_content', True):
+                read_timeout = None
+            _request_timeout = (Config.KUBE_CONNECT_TIMEOUT, read_timeout)
+        return super().request(
+            method, url, *args, _request_timeout=_request_timeout, **kwargs
+        )
 
 
 def load_config():
+    global api_client, core_v1, batch_v1
     from kubernetes import config
 
     if os.getenv('KUBERNETES_SERVICE_HOST'):
@@ -26,6 +103,1093 @@ def load_config():
     else:
         config.load_kube_config()
 
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = Config.KUBE_POOL_MAXSIZE
+    api_client = SharedApiClient(configuration)
+    # keep idle connections to the apiserver alive instead of handshaking again
+    api_client.rest_client.pool_manager.connection_pool_kw['socket_options'] = [
+        *HTTPConnection.default_socket_options,
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+    core_v1 = client.CoreV1Api(api_client)
+    batch_v1 = client.BatchV1Api(api_client)
+
+
+def _label_indexer(*labels):
+    """build an indexer function that keys objects by label values
+
+    :param labels: Labels whose values form the index key, joined with '/'.
+
+    :return function
+            Returns a list with the index key or an empty list if any label
+            is missing on the object.
+    """
+
+    def indexer(obj):
+        obj_labels = obj.metadata.labels or {}
+        if not all(label in obj_labels for label in labels):
+            return []
+        return ['/'.join(obj_labels[label] for label in labels)]
+
+    return indexer
+
+
+instance_indexers = {
+    'job-name': _label_indexer('job-name'),
+    'instance-type': _label_indexer(type_label),
+    'instance-name': _label_indexer(name_label),
+    'instance': _label_indexer(type_label, name_label),
+    'pool': _label_indexer(pool_label),
+}
+
+
+def _endpoint_targets(endpoint_slice):
+    """get the names of the pods of an endpoint slice"""
+    return [
+        endpoint.target_ref.name
+        for endpoint in endpoint_slice.endpoints or []
+        if endpoint.target_ref is not None and endpoint.target_ref.kind == 'Pod'
+    ]
+
+
+class Informer:
+    """in-memory copy of a watched kubernetes resource
+
+    Lists the resource once and then follows a watch from the listed
+    resourceVersion, so reads can be answered without asking the apiserver.
+    The watch is reconnected from the last seen resourceVersion and
+    the whole resource is listed again when the watch expires (410 Gone),
+    after errors and every resync period.
+    """
+
+    def __init__(self, list_func, label_selector=None, indexers=None):
+        """construct an informer
+
+        :param list_func: Namespaced list function of the resource,
+                          e.g. CoreV1Api.list_namespaced_pod.
+        :param label_selector: Selector restricting the watched objects.
+        :param indexers: Dict of index name to a function returning
+                         the index keys of an object.
+        """
+        self.list_func = list_func
+        self.label_selector = label_selector
+        self.indexers = indexers or {}
+        self.resource_version = None
+        self._objects = {}
+        self._indices = {index: {} for index in self.indexers}
+        self._handlers = []
+        self._flush_handlers = []
+        self._waiters = {}
+        self._cond = threading.Condition()
+        self._synced = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """start listing and watching in a background thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name='informer-' + self.list_func.__name__, daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def has_synced(self):
+        return self._synced.is_set()
+
+    def wait_for_sync(self, timeout=None):
+        """block until the initial list has been loaded
+
+        :return bool
+                Whether the informer has synced within the timeout.
+        """
+        return self._synced.wait(timeout)
+
+    def add_handler(self, handler):
+        """register a callback for changes
+
+        The handler is called with the event type (ADDED, MODIFIED, DELETED)
+        and the object after the cache has been updated.
+        """
+        self._handlers.append(handler)
+
+    def add_flush_handler(self, handler):
+        """register a callback for the end of a batch of changes
+
+        The handler is called without arguments once the handlers have seen
+        a watch event or all events of a full listing, so derived state can
+        be published once per listing instead of once per object.
+        """
+        self._flush_handlers.append(handler)
+
+    def get(self, name):
+        with self._cond:
+            return self._objects.get(name)
+
+    def list(self):
+        """get all cached objects sorted by name"""
+        with self._cond:
+            return [self._objects[name] for name in sorted(self._objects)]
+
+    def by_index(self, index, key):
+        """get all objects with the given key in an index
+
+        :return list
+                The objects sorted by name.
+        """
+        with self._cond:
+            return self._by_index(index, key)
+
+    def wait_for(self, index, key, predicate, timeout):
+        """block until the objects of an index key satisfy a predicate
+
+        :param predicate: Function called with the list of objects.
+        :param timeout: Maximum seconds to wait.
+
+        :return list
+                The objects of the index key when the predicate became true
+                or the timeout expired.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                objects = self._by_index(index, key)
+                remaining = deadline - time.monotonic()
+                if predicate(objects) or remaining <= 0:
+                    return objects
+                self._cond.wait(remaining)
+
+    async def wait_for_async(self, index, key, predicate, timeout):
+        """wait on the event loop until the objects of an index key
+        satisfy a predicate
+
+        Same as wait_for but does not occupy a thread while waiting,
+        the informer wakes the waiting coroutine when an object
+        of the index key changes.
+
+        :param predicate: Function called with the list of objects.
+        :param timeout: Maximum seconds to wait.
+
+        :return list
+                The objects of the index key when the predicate became true
+                or the timeout expired.
+        """
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(changed.set)
+
+        deadline = loop.time() + timeout
+        with self._cond:
+            self._waiters.setdefault((index, key), set()).add(wake)
+        try:
+            while True:
+                changed.clear()
+                objects = self.by_index(index, key)
+                remaining = deadline - loop.time()
+                if predicate(objects) or remaining <= 0:
+                    return objects
+                try:
+                    await asyncio.wait_for(changed.wait(), remaining)
+                except TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                waiters = self._waiters.get((index, key))
+                waiters.discard(wake)
+                if not waiters:
+                    del self._waiters[(index, key)]
+
+    def wake(self, index, key):
+        """wake the waiters of an index key whose derived state changed
+
+        E.g. the readiness of pods taken from their endpoint slices
+        or the deletion of their job.
+        """
+        with self._cond:
+            self._cond.notify_all()
+            self._wake_all(self._waiters.get((index, key), ()))
+
+    def _wake(self, *objects):
+        """wake the async waiters of the index keys of the objects
+
+        Wakes every waiter if no objects are given.
+        Must be called with the lock held.
+        """
+        if objects:
+            keys = {
+                (index, key)
+                for obj in objects
+                for index, indexer in self.indexers.items()
+                for key in indexer(obj)
+            }
+            wakes = [w for k in keys for w in self._waiters.get(k, ())]
+        else:
+            wakes = [w for waiters in self._waiters.values() for w in waiters]
+        self._wake_all(wakes)
+
+    @staticmethod
+    def _wake_all(wakes):
+        for wake in list(wakes):
+            try:
+                wake()
+            except RuntimeError:
+                # the event loop of the waiter is closed
+                pass
+
+    def _by_index(self, index, key):
+        names = self._indices[index].get(key, ())
+        return [self._objects[name] for name in sorted(names)]
+
+    def _index(self, name, obj):
+        for index, indexer in self.indexers.items():
+            for key in indexer(obj):
+                self._indices[index].setdefault(key, set()).add(name)
+
+    def _unindex(self, name, obj):
+        for index, indexer in self.indexers.items():
+            for key in indexer(obj):
+                names = self._indices[index].get(key)
+                if names is None:
+                    continue
+                names.discard(name)
+                if not names:
+                    del self._indices[index][key]
+
+    def _apply(self, event_type, obj):
+        """apply a single watch event to the cache"""
+        name = obj.metadata.name
+        with self._cond:
+            old = self._objects.pop(name, None)
+            if old is not None:
+                self._unindex(name, old)
+            if event_type != 'DELETED':
+                self._objects[name] = obj
+                self._index(name, obj)
+        # handlers update derived state like the listing before waiters see it
+        self._notify(event_type, obj)
+        self._flush()
+        with self._cond:
+            self._cond.notify_all()
+            self._wake(*[o for o in (old, obj) if o is not None])
+
+    def _replace(self, objects, resource_version):
+        """replace the cache content with a full listing"""
+        events = []
+        with self._cond:
+            listed = {obj.metadata.name: obj for obj in objects}
+            for name, old in self._objects.items():
+                if name not in listed:
+                    events.append(('DELETED', old))
+            for name, obj in listed.items():
+                events.append(('MODIFIED' if name in self._objects else 'ADDED', obj))
+            self._objects = listed
+            self._indices = {index: {} for index in self.indexers}
+            for name, obj in listed.items():
+                self._index(name, obj)
+            self.resource_version = resource_version
+        for event_type, obj in events:
+            self._notify(event_type, obj)
+        self._flush()
+        with self._cond:
+            self._synced.set()
+            self._cond.notify_all()
+            self._wake()
+
+    def _notify(self, event_type, obj):
+        for handler in self._handlers:
+            try:
+                handler(event_type, obj)
+            except Exception as e:
+                logger.error(e)
+
+    def _flush(self):
+        for handler in self._flush_handlers:
+            try:
+                handler()
+            except Exception as e:
+                logger.error(e)
+
+    def _list(self):
+        with metrics.backend_call('kubernetes', self.list_func.__name__):
+            resp = self.list_func(Config.NAMESPACE, label_selector=self.label_selector)
+        self._replace(resp.items, resp.metadata.resource_version)
+
+    def _watch(self):
+        """follow the watch until the resync period is over"""
+        resync_at = time.monotonic() + Config.INFORMER_RESYNC_SECONDS
+        while time.monotonic() < resync_at:
+            w = watch.Watch()
+            # deserialize with the shared client instead of a new one per watch
+            w._api_client = api_client or w._api_client
+            for event in w.stream(
+                self.list_func,
+                Config.NAMESPACE,
+                label_selector=self.label_selector,
+                resource_version=self.resource_version,
+                allow_watch_bookmarks=True,
+                timeout_seconds=Config.INFORMER_WATCH_SECONDS,
+            ):
+                if event['type'] == 'BOOKMARK':
+                    self.resource_version = event['raw_object']['metadata'][
+                        'resourceVersion'
+                    ]
+                    continue
+                self._apply(event['type'], event['object'])
+                self.resource_version = event['object'].metadata.resource_version
+
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                self._list()
+                self._watch()
+                backoff = 1
+            except ApiException as e:
+                if e.status == 410:
+                    logger.info(
+                        'watch of %s expired, relisting', self.list_func.__name__
+                    )
+                    continue
+                logger.warning(e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            except Exception as e:
+                logger.warning(e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+def template_annotation(config_map, annotation, app_type):
+    """get a template setting from the annotations of its configmap
+
+    The annotation <annotation>.<type> applies to a single template and takes
+    precedence over <annotation>, which applies to every template of the
+    configmap.
+
+    :return str
+            The annotation value or None if it is not set.
+    """
+    annotations = config_map.metadata.annotations or {}
+    return annotations.get(annotation + '.' + app_type, annotations.get(annotation))
+
+
+def template_setting(app_type, annotation, default):
+    """get a numeric template setting from the annotations of its configmap
+
+    :return int
+            The setting, at least 0, or the default if it is not set or invalid.
+    """
+    try:
+        config_map = template_registry.find(app_type)
+    except Exception:
+        return default
+    value = template_annotation(config_map, annotation, app_type)
+    if value is None:
+        return default
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        logger.warning('invalid %s %s of %s', annotation, value, app_type)
+        return default
+
+
+def template_variables(text):
+    """find the variables a template reads from its alternatives
+
+    :return list(str)
+            The sorted names used as alternatives['name']
+            or alternatives.get('name').
+    """
+    return sorted({match[1] for match in variable_pattern.findall(text)})
+
+
+def _last_modified(config_map):
+    """get the time of the last change of a configmap as timestamp"""
+    times = [f.time for f in config_map.metadata.managed_fields or [] if f.time]
+    modified = max(times, default=config_map.metadata.creation_timestamp)
+    return modified.timestamp() if modified else None
+
+
+class TemplateRegistry:
+    """compiled application templates of the watched configmaps
+
+    Keeps one compiled Mako template per configmap, key and resourceVersion
+    and the parsed pod templates rendered from it per set of template
+    variables, bounded by SKELETON_CACHE_ENTRIES and SKELETON_CACHE_BYTES.
+    Entries are dropped as soon as the configmap informer reports a change
+    or deletion of their configmap. A catalogue of the templates and their
+    metadata is rebuilt on every configmap change, so listing and finding
+    templates does not look at the configmaps.
+    """
+
+    def __init__(self, informer):
+        self.informer = informer
+        self._compiled = {}
+        self._skeletons = LruCache(
+            Config.SKELETON_CACHE_ENTRIES, Config.SKELETON_CACHE_BYTES
+        )
+        self._catalogue = {}
+        self._lock = threading.Lock()
+        informer.add_handler(self._invalidate)
+        self._build_catalogue()
+
+    def _invalidate(self, event_type, config_map):
+        def outdated(key):
+            map_name, _, resource_version = key[:3]
+            return map_name == config_map.metadata.name and (
+                event_type == 'DELETED'
+                or resource_version != config_map.metadata.resource_version
+            )
+
+        with self._lock:
+            for key in list(self._compiled):
+                if outdated(key):
+                    del self._compiled[key]
+        self._skeletons.discard(outdated)
+        metrics.skeleton_cache_bytes.set(self._skeletons.bytes)
+        self._build_catalogue()
+
+    def _build_catalogue(self):
+        catalogue = {}
+        for config_map in self.informer.list():
+            for key, text in (config_map.data or {}).items():
+                # the first configmap by name wins
+                catalogue.setdefault(
+                    key.removesuffix('.yaml'),
+                    {
+                        'name': key.removesuffix('.yaml'),
+                        'source': config_map.metadata.name,
+                        'revision': config_map.metadata.resource_version,
+                        'variables': template_variables(text or ''),
+                        'modified': _last_modified(config_map),
+                    },
+                )
+        self._catalogue = catalogue
+
+    def __contains__(self, app_type):
+        return app_type in self._catalogue
+
+    def list_templates(self):
+        """list the names of all templates in the watched configmaps"""
+        return list(self._catalogue)
+
+    def template_info(self):
+        """get the metadata of all templates
+
+        :return list(dict(name=str, source=str, revision=str,
+                          variables=list, modified=float))
+                The name, configmap, its resourceVersion, the template
+                variables used and the time of the last configmap change.
+        """
+        return list(self._catalogue.values())
+
+    def find(self, app_type):
+        """find the configmap containing the template of an app type
+
+        :return V1ConfigMap
+                The first configmap by name containing the template.
+        """
+        file_name = app_type + '.yaml'
+        entry = self._catalogue.get(app_type)
+        if entry is not None:
+            config_map = self.informer.get(entry['source'])
+            if config_map is not None and file_name in (config_map.data or {}):
+                return config_map
+
+        raise Exception('No configs found for app ' + file_name)
+
+    def get(self, app_type):
+        """get the compiled template of an app type
+
+        Raises an exception if there is no template for the app type
+        or it can not be compiled.
+
+        :return Template
+                The compiled Mako template.
+        """
+        config_map = self.find(app_type)
+        file_name = app_type + '.yaml'
+        key = (
+            config_map.metadata.name,
+            file_name,
+            config_map.metadata.resource_version,
+        )
+        with self._lock:
+            template = self._compiled.get(key)
+        if template is not None:
+            return template
+
+        try:
+            template = Template(config_map.data[file_name])
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+        with self._lock:
+            self._compiled[key] = template
+        return template
+
+    def skeleton(self, app_type, template_variables):
+        """get the pod template of an app type rendered with some variables
+
+        Rendering and parsing happen once per template revision and set of
+        variables, later calls return the cached result. Templates whose
+        output changes between renders, e.g. because they generate secrets,
+        can disable the cache with the skeleton-cache annotation set to false.
+        Raises an exception if the template is missing or invalid.
+
+        :param template_variables: Variables passed as alternatives to the template.
+
+        :return dict
+                The parsed pod template, shared with other callers,
+                so it must be copied before being modified.
+        """
+        config_map = self.find(app_type)
+        cached = template_annotation(config_map, skeleton_cache_annotation, app_type)
+        cached = (cached or 'true').lower() != 'false'
+        key = (
+            config_map.metadata.name,
+            app_type + '.yaml',
+            config_map.metadata.resource_version,
+            json.dumps(template_variables or {}, sort_keys=True, default=str),
+        )
+        if cached:
+            pod_template = self._skeletons.get(key)
+            if pod_template is not None:
+                metrics.skeleton_cache.labels(app_type, 'hit').inc()
+                return pod_template
+            metrics.skeleton_cache.labels(app_type, 'miss').inc()
+
+        template = self.get(app_type)
+        try:
+            rendered_yaml = template.render(alternatives=template_variables)
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+        try:
+            pod_template = yaml.safe_load(rendered_yaml)
+        except Exception as e:
+            logger.error(e)
+            raise e
+
+        if cached:
+            # the rendered text approximates the size of the parsed template
+            self._skeletons.put(key, pod_template, len(rendered_yaml))
+            metrics.skeleton_cache_bytes.set(self._skeletons.bytes)
+        return pod_template
+
+
+def render_job_object(app_type, job_name, labels, template_variables):
+    """render the job object of an app type
+
+    The rendered pod template is taken from the skeleton cache of the
+    template registry if possible, so only a copy of it is labelled.
+    Raises an exception of the configmap does not exist or is invalid.
+
+    :param app_type: Type of the app to render the template of.
+    :param job_name: Name of the job.
+    :param labels: Labels to set on the job and its pod template.
+    :param template_variables: Variables passed as alternatives to the template.
+
+    :return V1Job
+            Job object based on the configmap template
+    """
+    with metrics.stage(app_type, 'render'):
+        pod_template = template_registry.skeleton(app_type, template_variables)
+
+    job = client.V1Job(
+        api_version='batch/v1',
+        kind='Job',
+        metadata=client.V1ObjectMeta(),
+        spec=client.V1JobSpec(template=copy.deepcopy(pod_template)),
+    )
+    return instantiate_job_object(job, job_name, labels)
+
+
+def instantiate_job_object(job, job_name, labels):
+    """name and label a rendered job object
+
+    :param job: The rendered job object, it is modified in place.
+    :param job_name: Name of the job.
+    :param labels: Labels to set on the job and its pod template.
+
+    :return V1Job
+            The job object.
+    """
+    job.metadata.name = job_name
+    job.metadata.labels = dict(labels)
+    job.spec.template['metadata']['labels'].update(labels)
+    return job
+
+
+def _instance_phase(pods):
+    """get the provisioning phase of the pods of a job
+
+    :param pods: Pods belonging to the same job.
+
+    :return str
+            The phase, one of pending, scheduled, pulling,
+            running, ready or error.
+
+    :return str
+            The ip address if ready, otherwise details on the phase or None.
+    """
+    success, status = _instance_status(pods)
+    if success:
+        return 'ready', status
+    if status == 'app_error':
+        return 'error', status
+
+    for pod in pods:
+        if pod.status is None:
+            continue
+        if pod.status.container_statuses:
+            waiting = [
+                s.state.waiting.reason
+                for s in pod.status.container_statuses
+                if s.state and s.state.waiting
+            ]
+            if waiting:
+                return 'pulling', waiting[0]
+            return 'running', None
+        if any(
+            c.type == 'PodScheduled' and c.status == 'True'
+            for c in pod.status.conditions or []
+        ):
+            return 'scheduled', pod.spec.node_name if pod.spec else None
+
+    return 'pending', None
+
+
+class InstanceMetrics:
+    """pod informer handler maintaining the instance metrics
+
+    Observes the time from pod creation to readiness once per pod
+    and counts the live instances per app type, the gauges of the changed
+    counts are set by flush after a watch event or a full listing.
+    """
+
+    def __init__(self):
+        self._ready = set()
+        self._instances = {}
+        self._counts = {}
+        self._changed = set()
+
+    def __call__(self, event_type, pod):
+        labels = pod.metadata.labels or {}
+        app_type = labels.get(type_label)
+        if app_type is None:
+            return
+
+        if event_type == 'DELETED':
+            self._ready.discard(pod.metadata.uid)
+        elif pod.metadata.uid not in self._ready and _instance_status([pod])[0]:
+            self._ready.add(pod.metadata.uid)
+            if pod.metadata.creation_timestamp is not None:
+                metrics.stage_seconds.labels(app_type, 'ready').observe(
+                    time.time() - pod.metadata.creation_timestamp.timestamp()
+                )
+
+        # unclaimed pool pods are no instances
+        name = pod.metadata.name
+        previous = self._instances.pop(name, None)
+        current = None
+        if event_type != 'DELETED' and name_label in labels:
+            current = self._instances[name] = app_type
+        if previous != current:
+            if previous is not None:
+                self._count(previous, -1)
+            if current is not None:
+                self._count(current, 1)
+
+    def _count(self, app_type, change):
+        self._counts[app_type] = self._counts.get(app_type, 0) + change
+        self._changed.add(app_type)
+
+    def flush(self):
+        """set the instance gauges of the app types whose count changed"""
+        changed, self._changed = self._changed, set()
+        for app_type in changed:
+            metrics.instances.labels(app_type).set(self._counts[app_type])
+
+
+class StartupTracker:
+    """pod informer handler learning how long the instances take to start
+
+    Observes the seconds from the creation of a pod until it is scheduled
+    and from then until it is ready into the startup estimates of its
+    app type. Only stages the tracker saw begin are observed, not those
+    of pods that were already running when the informer listed them.
+    """
+
+    def __init__(self, estimates):
+        self.estimates = estimates
+        self._pending = set()
+        self._scheduled = {}
+
+    def __call__(self, event_type, pod):
+        app_type = (pod.metadata.labels or {}).get(type_label)
+        uid = pod.metadata.uid
+        if app_type is None:
+            return
+        if event_type == 'DELETED':
+            self._pending.discard(uid)
+            self._scheduled.pop(uid, None)
+            return
+
+        if _scheduled_at(pod) is None:
+            self._pending.add(uid)
+            return
+        if uid in self._pending:
+            # the watch delivers the change right away, the timestamps of
+            # the conditions only have a resolution of seconds
+            self._pending.discard(uid)
+            scheduled_at = time.time()
+            self._scheduled[uid] = scheduled_at
+            created = pod.metadata.creation_timestamp
+            if created is not None:
+                self.estimates.observe(
+                    app_type, 'scheduling', scheduled_at - created.timestamp()
+                )
+        if uid in self._scheduled and _instance_status([pod])[0]:
+            self.estimates.observe(
+                app_type, 'starting', time.time() - self._scheduled.pop(uid)
+            )
+
+
+class EndpointReadiness:
+    """endpoint slice informer handler passing readiness changes to the pods
+
+    Updates the listing entries and wakes the readiness waiters of the pods
+    whose endpoints were added, changed or removed.
+    """
+
+    def __init__(self):
+        self._targets = {}
+
+    def __call__(self, event_type, endpoint_slice):
+        name = endpoint_slice.metadata.name
+        targets = set(_endpoint_targets(endpoint_slice))
+        changed = self._targets.pop(name, set()) | targets
+        if event_type != 'DELETED':
+            self._targets[name] = targets
+        pods = [p for p in map(pod_informer.get, sorted(changed)) if p is not None]
+        for pod in pods:
+            update_listing('MODIFIED', pod)
+            for job_name in instance_indexers['job-name'](pod):
+                pod_informer.wake('job-name', job_name)
+
+
+def track_deleted_jobs(event_type, job):
+    """job informer handler remembering the recently deleted jobs
+
+    Wakes the readiness waiters of a deleted job, its pods will not come.
+    """
+    name = job.metadata.name
+    deleted_jobs.put(name, event_type == 'DELETED', 1)
+    if event_type == 'DELETED':
+        pod_informer.wake('job-name', name)
+
+
+def create_job_object(app_type, job_name, body, api=None):
+    """create a job
+
+    A job that already exists, created concurrently by another worker
+    or replica, is not an error.
+
+    :param app_type: Type of the app the job belongs to.
+    :param job_name: Name of the job.
+    :param body: The rendered job object.
+    :param api: The batch api to create it with, default the shared one.
+
+    :return bool
+            Whether the job was created, False if it existed already.
+    """
+    api = api or batch_v1
+    try:
+        with (
+            metrics.stage(app_type, 'create'),
+            metrics.backend_call('kubernetes', 'create_namespaced_job', app_type),
+        ):
+            api.create_namespaced_job(body=body, namespace=Config.NAMESPACE)
+    except ApiException as e:
+        if e.status != 409:
+            raise
+        return False
+    # forget an earlier deletion of a job of the same name
+    deleted_jobs.put(job_name, False, 1)
+    return True
+
+
+def delete_job_object(app_type, job_name):
+    """delete a job and its pods
+
+    A job that is already gone counts as deleted.
+
+    :param app_type: Type of the app the job belongs to.
+    :param job_name: Name of the job.
+    """
+    try:
+        with metrics.backend_call('kubernetes', 'delete_namespaced_job', app_type):
+            api_response = batch_v1.delete_namespaced_job(
+                name=job_name,
+                namespace=Config.NAMESPACE,
+                body=client.V1DeleteOptions(
+                    propagation_policy='Foreground', grace_period_seconds=0
+                ),
+            )
+    except ApiException as e:
+        if e.status != 404:
+            raise
+        logger.info('Job %s already deleted', job_name)
+        return
+    logger.info(f'Job deleted. status="{str(api_response.status)}"')
+
+
+def patch_meta_labels(key, labels):
+    """set and remove meta labels of the pod of a job
+
+    Sends a patch holding only the changed labels, a None value removes
+    the label. The pod is looked up in the pod informer, so no read
+    precedes the patch unless the informer has not seen the pod yet.
+
+    :param key: (app_type, job_name) tuple of the job.
+    :param labels: Dict of label names without prefix to values or None.
+    """
+    app_type, job_name = key
+    pods = pod_informer.by_index('job-name', job_name)
+    if not pods:
+        with metrics.backend_call('kubernetes', 'list_namespaced_pod', app_type):
+            pods = core_v1.list_namespaced_pod(
+                Config.NAMESPACE, label_selector='job-name=' + job_name
+            ).items
+    if not pods:
+        raise Exception('No pod of job ' + job_name + ' found')
+
+    body = {
+        'metadata': {'labels': {meta_label_prefix + k: v for k, v in labels.items()}}
+    }
+    with metrics.backend_call('kubernetes', 'patch_namespaced_pod', app_type):
+        core_v1.patch_namespaced_pod(pods[0].metadata.name, Config.NAMESPACE, body)
+
+
+# concurrent label changes of a pod are sent as one patch
+label_patches = PatchCoalescer(patch_meta_labels)
+
+
+def max_starting(app_type):
+    """get how many instances of an app type may be starting at once
+
+    Set with the max-starting annotation on the configmap of the template,
+    MAX_STARTING applies to templates without it.
+
+    :return int
+            The limit, 0 if there is none.
+    """
+    return template_setting(app_type, max_starting_annotation, Config.MAX_STARTING)
+
+
+def starting(app_type):
+    """count the jobs of an app type that are created but not ready yet"""
+    count = 0
+    for job in job_informer.by_index('instance-type', app_type):
+        if job.metadata.deletion_timestamp or _finished_at(job) is not None:
+            continue
+        pods = pod_informer.by_index('job-name', job.metadata.name)
+        if _instance_phase(pods)[0] not in ('ready', 'error'):
+            count += 1
+    return count
+
+
+# creations are admitted by rate and the starting instances per template
+admission = Admission(max_starting, starting)
+
+
+def _finished_at(job):
+    """get the time a job completed or failed as timestamp, None if it runs"""
+    for condition in (job.status.conditions if job.status else None) or []:
+        if condition.type in ('Complete', 'Failed') and condition.status == 'True':
+            changed = condition.last_transition_time
+            return changed.timestamp() if changed else 0
+    return None
+
+
+def _meta_labels(labels):
+    """get the meta labels set with add_labels from the labels of a pod"""
+    return {
+        k.removeprefix(meta_label_prefix): v
+        for k, v in labels.items()
+        if k.startswith(meta_label_prefix)
+    }
+
+
+def _export_row(pod):
+    """summarize the pod of an instance for the export
+
+    :return dict(type=str, name=str, ip=str, phase=str, start=float, labels=dict)
+            The phase is one of the provisioning phases, or finished
+            once the pod completed.
+    """
+    labels = pod.metadata.labels or {}
+    status = pod.status
+    if status is not None and status.phase == 'Succeeded':
+        phase = 'finished'
+    else:
+        phase = _instance_phase([pod])[0]
+    return {
+        'type': labels[type_label],
+        'name': labels[name_label],
+        'ip': status.pod_ip if status else None,
+        'phase': phase,
+        'start': status.start_time.timestamp() if status and status.start_time else 0,
+        'labels': _meta_labels(labels),
+    }
+
+
+def _listing_entry(pod):
+    """summarize a pod for the instance listing
+
+    :return dict
+            The ip address, name, start time, whether it errored and the meta
+            labels, or None if the pod is not a started instance.
+    """
+    labels = pod.metadata.labels or {}
+    # unclaimed warm pool instances have no name
+    if name_label not in labels or pod.status is None:
+        return None
+    if pod.status.conditions is None or pod.status.container_statuses is None:
+        return None
+
+    if _endpoint(pod) is not None:
+        running = _pod_ready(pod)[0]
+    else:
+        running = any(
+            c.type == 'Ready' and c.status == 'True' for c in pod.status.conditions
+        )
+    errored = any(
+        s.state.terminated.exit_code != 0
+        for s in pod.status.container_statuses
+        if s.state and s.state.terminated
+    )
+    meta_labels = _meta_labels(labels)
+    name = labels[name_label]
+    return {
+        'ip': pod.status.pod_ip,
+        'name': name,
+        'sessionID': name,  # legacy support
+        'hostname': name,  # legacy support
+        'addr': pod.status.pod_ip,  # legacy support
+        'errored': errored or not running,
+        'start': pod.status.start_time.timestamp()
+        if running and pod.status.start_time
+        else 0,
+    } | meta_labels
+
+
+def update_listing(event_type, pod):
+    """pod informer handler maintaining the instance listing"""
+    app_type = (pod.metadata.labels or {}).get(type_label)
+    if app_type is None:
+        return
+    entry = None if event_type == 'DELETED' else _listing_entry(pod)
+    if entry is None:
+        listing.discard(app_type, pod.metadata.name)
+    else:
+        listing.put(app_type, pod.metadata.name, entry)
+
+
+def _instance_settled(pods):
+    """whether the pods of a job reached a final state to report"""
+    return _instance_status(pods)[1] not in ('node_not_ready', 'pulling_image')
+
+
+def _endpoint(pod):
+    """get the endpoint of a pod, None if no service selects it"""
+    if endpoint_informer is None:
+        return None
+    for endpoint_slice in endpoint_informer.by_index('pod', pod.metadata.name):
+        for endpoint in endpoint_slice.endpoints or []:
+            if endpoint.target_ref and endpoint.target_ref.name == pod.metadata.name:
+                return endpoint
+    return None
+
+
+def _pod_ready(pod):
+    """get whether a pod is ready and its ip address
+
+    The readiness is taken from the endpoint slices of a service selecting
+    the pod if there is one, as seen by the clients of the service,
+    otherwise from the container statuses.
+
+    :return tuple(bool, str)
+    """
+    endpoint = _endpoint(pod)
+    if endpoint is not None and endpoint.addresses:
+        # an unknown condition is to be interpreted as ready
+        conditions = endpoint.conditions
+        ready = conditions is None or conditions.ready is not False
+        return ready, endpoint.addresses[0]
+    statuses = pod.status.container_statuses or []
+    return all(s.ready for s in statuses), pod.status.pod_ip
+
+
+def _scheduled_at(pod):
+    """get the timestamp a pod was scheduled, 0 if unknown and None if not yet"""
+    for condition in (pod.status.conditions or []) if pod.status else []:
+        if condition.type == 'PodScheduled' and condition.status == 'True':
+            changed = condition.last_transition_time
+            return changed.timestamp() if changed else 0
+    return None
+
+
+def _instance_status(pods):
+    """summarize the state of the pods of a job
+
+    :param pods: Pods belonging to the same job.
+
+    :return bool
+            Whether the instance is ready
+
+    :return str
+            The ip address of the pod or the status message, one of
+            node_not_ready, pulling_image or app_error.
+    """
+    scheduling = True
+    errored = False
+    for pod in pods:
+        statuses = pod.status.container_statuses if pod.status else None
+        if statuses is None:
+            # a scheduled pod is pulling its images before it reports statuses
+            if _scheduled_at(pod) is not None:
+                scheduling = False
+            continue
+
+        scheduling = False
+        ready, ip = _pod_ready(pod)
+        if ready and ip is not None:
+            return True, ip
+
+        if not ready:
+            try:
+                if any(
+                    s.state.terminated and s.state.terminated.exit_code != 0
+                    for s in statuses
+                ):
+                    errored = True
+            except AttributeError:
+                pass
+
+    if errored:
+        return False, 'app_error'
+
+    if scheduling:
+        return False, 'node_not_ready'
+
+    return False, 'pulling_image'
+
 
 class IntensJob:
     def __init__(self, app_type, name, create=True, template_variables=None):
@@ -42,22 +1206,39 @@ class IntensJob:
         self.name = name
         self.template_variables = template_variables
         self.job_name = app_type + '-' + name
-        self.v1 = client.CoreV1Api()
-        self.batch_v1 = client.BatchV1Api()
-        pods = self.v1.list_namespaced_pod(
-            Config.NAMESPACE, label_selector='job-name=' + self.job_name
-        ).items
+        self.v1 = core_v1
+        self.batch_v1 = batch_v1
 
-        self.exists = not len(pods) == 0
+        # jobs claimed from the warm pool keep the name they were started with
+        instance = app_type + '/' + name
+        with metrics.stage(app_type, 'lookup'):
+            pods = pod_informer.by_index('instance', instance)
+            jobs = job_informer.by_index('instance', instance)
+        if pods and 'job-name' in pods[0].metadata.labels:
+            self.job_name = pods[0].metadata.labels['job-name']
+        elif jobs:
+            self.job_name = jobs[0].metadata.name
 
-        if not self.exists and create:
-            self._create_job()
+        self.exists = bool(pods or jobs or job_informer.get(self.job_name))
 
-    def get_ip(self):
+        if not self.exists and create:
+            job_name = None
+            if not template_variables:
+                job_name = warm_pool.claim(app_type, name)
+            if job_name is not None:
+                self.job_name = job_name
+                self.exists = True
+            else:
+                admission.submit(app_type, name, self._create_job)
+
+    def get_ip(self, timeout=10):
         """get the ip address of the pod
 
         Wait until the pod us running and then return the ip address of it.
-        This method will lock until the pod is started.
+        This method will lock until the pod is started or the timeout expired.
+        The pod state is taken from the shared pod informer.
+
+        :param timeout: Maximum seconds to wait for the pod.
 
         :return bool
                 Whether the ip was successfully retrieved
@@ -65,41 +1246,93 @@ class IntensJob:
         :return str
                 The ip address of the pod. Or if none is ready, a status message
         """
-        w = watch.Watch()
-        scheduling = True
-        # Pending, Running
+        pods = pod_informer.wait_for('job-name', self.job_name, self._settled, timeout)
+        success, status = _instance_status(pods)
+        metrics.ready_outcome(self.app_type, success, status)
+        return success, status
 
-        for event in w.stream(
-            func=self.v1.list_namespaced_pod,
-            namespace=Config.NAMESPACE,
-            label_selector='job-name=' + self.job_name,
-            timeout_seconds=10,
-        ):
-            statuses = event['object'].status.container_statuses
-            if statuses is None:
-                continue
+    async def wait_ip(self, timeout=10):
+        """get the ip address of the pod without blocking a thread
 
-            scheduling = False
-            # check if every container status has ready
-            ready = all(s.ready for s in statuses)
-            if ready and event['object'].status.pod_ip is not None:
-                w.stop()
-                return True, event['object'].status.pod_ip
+        Async variant of get_ip, waits on the event loop for the
+        pod informer to report a ready or failed pod.
 
-            if not ready:
-                try:
-                    if any(
-                        s.state.terminated and s.state.terminated.exit_code != 0
-                        for s in statuses
-                    ):
-                        return False, 'app_error'
-                except:
-                    pass
+        :param timeout: Maximum seconds to wait for the pod.
+
+        :return bool
+                Whether the ip was successfully retrieved
+
+        :return str
+                The ip address of the pod. Or if none is ready, a status message
+        """
+        pods = await pod_informer.wait_for_async(
+            'job-name', self.job_name, self._settled, timeout
+        )
+        success, status = _instance_status(pods)
+        metrics.ready_outcome(self.app_type, success, status)
+        return success, status
+
+    def _settled(self, pods):
+        """whether the pods reached a final state or the job was deleted"""
+        return _instance_settled(pods) or bool(deleted_jobs.get(self.job_name))
+
+    def eta(self, now=None):
+        """estimate the seconds until the instance is ready
+
+        From the observed startup durations of the app type and the
+        time the instance has been in its current stage.
+
+        :return float
+                0 if it is ready, None without estimate.
+        """
+        if now is None:
+            now = time.time()
+        pods = pod_informer.by_index('job-name', self.job_name)
+        if _instance_status(pods)[0]:
+            return 0.0
+        scheduled = [t for t in map(_scheduled_at, pods) if t is not None]
+        if scheduled:
+            elapsed = now - max(scheduled) if max(scheduled) else 0
+            return startup_estimates.remaining(self.app_type, 'starting', elapsed)
+        created = [
+            p.metadata.creation_timestamp.timestamp()
+            for p in pods
+            if p.metadata.creation_timestamp is not None
+        ]
+        elapsed = now - max(created) if created else 0
+        return startup_estimates.remaining(self.app_type, 'scheduling', elapsed)
+
+    def phase(self):
+        """get the provisioning phase of the instance
+
+        :return tuple(str, str)
+                The phase (pending, scheduled, pulling, running, ready, error
+                or deleted) and the ip address if ready or details on the phase.
+        """
+        return self._phase(pod_informer.by_index('job-name', self.job_name))
 
-        if scheduling:
-            return False, 'node_not_ready'
+    def _phase(self, pods):
+        """get the phase of the pods, deleted once the job is gone"""
+        if deleted_jobs.get(self.job_name):
+            return 'deleted', None
+        return _instance_phase(pods)
 
-        return False, 'pulling_image'
+    async def wait_phase(self, phase, timeout):
+        """wait on the event loop until the phase differs from the given one
+
+        :param phase: The last known phase as returned by phase().
+        :param timeout: Maximum seconds to wait.
+
+        :return tuple(str, str)
+                The current phase.
+        """
+        pods = await pod_informer.wait_for_async(
+            'job-name',
+            self.job_name,
+            lambda pods: self._phase(pods) != phase,
+            timeout,
+        )
+        return self._phase(pods)
 
     def get_meta_labels(self):
         """get custom set metadata
@@ -109,10 +1342,7 @@ class IntensJob:
         :return dict
                 The metadata
         """
-        pod_def = self.v1.list_namespaced_pod(
-            Config.NAMESPACE,
-            label_selector='job-name=' + self.job_name,
-        ).items[0]
+        pod_def = pod_informer.by_index('job-name', self.job_name)[0]
         pod_labels = dict(
             [
                 [k.removeprefix(meta_label_prefix), v]
@@ -126,106 +1356,643 @@ class IntensJob:
     def _create_job_object(self):
         """create the job object from in-cluster configmaps
 
+        The compiled template is taken from the shared template registry,
+        so only the rendering and YAML parsing happen per job.
         Creates the object to upload to the kubernetes cluster.
         Raises an exception of the configmap does not exist or is invalid.
 
         :return V1Job
                 Job object based on the configmap template
         """
-        # Get all configmaps that are marked as a config-controller app
-        config_maps = self.v1.list_namespaced_config_map(
-            Config.NAMESPACE, label_selector=Config.CONFIG_MAP_SELECTOR
-        ).items
-
-        file_name = self.app_type + '.yaml'
-        yaml_data = None
-
-        for map in config_maps:
-            if file_name in map.data:
-                yaml_data = map.data[file_name]
-                break
-
-        if yaml_data is None:
-            raise Exception('No configs found for app ' + file_name)
-
-        try:
-            rendered_yaml = Template(yaml_data).render(
-                alternatives=self.template_variables
-            )
-        except Exception as e:
-            logger.error(e)
-            raise e
-
-        try:
-            kube_info = yaml.safe_load(rendered_yaml)
-        except Exception as e:
-            logger.error(e)
-            raise e
-
-        kube_info['metadata']['labels'][name_label] = self.name
-        kube_info['metadata']['labels'][type_label] = self.app_type
-
-        job = client.V1Job(
-            api_version='batch/v1',
-            kind='Job',
-            metadata=client.V1ObjectMeta(name=self.job_name),
-            spec=client.V1JobSpec(template=kube_info),
+        return render_job_object(
+            self.app_type,
+            self.job_name,
+            {name_label: self.name, type_label: self.app_type},
+            self.template_variables,
         )
-        return job
 
     def _create_job(self):
         """create the kubernetes job
 
         Creates the job in kubernetes.
+        A job that already exists is not an error.
         Raises an exception if create_job_object also fails
         """
-        try:
-            self.batch_v1.create_namespaced_job(
-                body=self._create_job_object(), namespace=Config.NAMESPACE
-            )
-            self.exists = True
-        except Exception as e:
-            raise e
+        body = self._create_job_object()
+        create_job_object(self.app_type, self.job_name, body, self.batch_v1)
+        self.exists = True
 
     def add_labels(self, pod_labels):
-        """add metadata to a job
+        """add or remove metadata of a job
 
-            This add a bunch of metadata to the running pod of the job.
+            This sets a bunch of metadata on the running pod of the job.
             They are namespaced to not interfere with any other potential labels.
-
-            Note that there is no function to remove labels.
+            Labels set to None are removed. Concurrent calls for the same job
+            are merged into one patch.
 
         :param pod_labels: A dict of labels you want to add as metadata
 
         """
-        pod_def = self.v1.list_namespaced_pod(
-            Config.NAMESPACE,
-            label_selector='job-name=' + self.job_name,
-        ).items[0]
-        for key, val in pod_labels.items():
-            pod_def.metadata.labels[meta_label_prefix + key] = val
-
-        self.v1.patch_namespaced_pod(pod_def.metadata.name, Config.NAMESPACE, pod_def)
+        label_patches.patch((self.app_type, self.job_name), pod_labels)
 
     def _delete_job(self):
         """delete the kubernetes job
 
         Deletes the job in kubernetes.
         """
-        api_response = self.batch_v1.delete_namespaced_job(
-            name=self.job_name,
-            namespace=Config.NAMESPACE,
-            body=client.V1DeleteOptions(
-                propagation_policy='Foreground', grace_period_seconds=0
-            ),
+        delete_job_object(self.app_type, self.job_name)
+
+
+class WarmPool:
+    """pre-started unassigned instances per app type
+
+    The pool size of a template is set with the warm-pool annotation on its
+    configmap, either for all templates of the configmap or for a single one
+    with warm-pool.<type>. Pool instances carry the pool label instead of
+    the instance name label. A request claims a ready pool pod by relabelling
+    it, while a background thread keeps the pools filled up.
+    """
+
+    def __init__(self, leader=None):
+        """construct a warm pool
+
+        :param leader: The leader election deciding whether to refill the pools,
+                       claiming works in every process.
+        """
+        self.v1 = core_v1
+        self.batch_v1 = batch_v1
+        self.leader = leader or AlwaysLeader()
+        self._pending = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """start refilling the pools in a background thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='warm-pool', daemon=True)
+        self._thread.start()
+
+    def sizes(self):
+        """get the configured pool size of every app type
+
+        :return dict
+                App type to number of instances to keep ready.
+        """
+        sizes = {}
+        for config_map in config_map_informer.list():
+            for key in (config_map.data or {}).keys():
+                app_type = key.removesuffix('.yaml')
+                if app_type in sizes:
+                    continue
+                value = template_annotation(config_map, warm_pool_annotation, app_type)
+                value = value or '0'
+                try:
+                    sizes[app_type] = max(int(value), 0)
+                except ValueError:
+                    logger.warning('invalid warm pool size %s of %s', value, app_type)
+                    sizes[app_type] = 0
+        return sizes
+
+    def claim(self, app_type, name):
+        """assign a ready pool instance to a name
+
+        The pod is patched with its resourceVersion as precondition,
+        so concurrent claims of the same pod fail with a conflict
+        and move on to the next one.
+
+        :return str
+                The name of the claimed job or None if no instance is ready.
+        """
+        labels = {name_label: name, pool_label: None}
+        for pod in pod_informer.by_index('pool', app_type):
+            if pod.metadata.deletion_timestamp or not _instance_status([pod])[0]:
+                continue
+            try:
+                with metrics.backend_call(
+                    'kubernetes', 'patch_namespaced_pod', app_type
+                ):
+                    self.v1.patch_namespaced_pod(
+                        pod.metadata.name,
+                        Config.NAMESPACE,
+                        {
+                            'metadata': {
+                                'resourceVersion': pod.metadata.resource_version,
+                                'labels': labels,
+                            }
+                        },
+                    )
+            except ApiException as e:
+                if e.status in (404, 409):
+                    continue
+                raise e
+
+            job_name = pod.metadata.labels['job-name']
+            try:
+                self._label_job(app_type, job_name, labels)
+            except ApiException as e:
+                # refill takes the pool members from the pods and relabels it
+                logger.warning(e)
+            logger.info('claimed %s from warm pool for %s', job_name, name)
+            self._wakeup.set()
+            return job_name
+
+        return None
+
+    def _label_job(self, app_type, job_name, labels):
+        with metrics.backend_call('kubernetes', 'patch_namespaced_job', app_type):
+            self.batch_v1.patch_namespaced_job(
+                job_name, Config.NAMESPACE, {'metadata': {'labels': labels}}
+            )
+
+    def refill(self):
+        """create and delete pool instances to match the pool sizes
+
+        Jobs still labelled as pool members whose pod has been claimed
+        are not counted, their labels are patched again instead.
+        """
+        sizes = self.sizes()
+        pools = {}
+        for job in job_informer.list():
+            app_type = (job.metadata.labels or {}).get(pool_label)
+            if app_type is not None:
+                pools.setdefault(app_type, []).append(job)
+                self._pending.pop(job.metadata.name, None)
+
+        now = time.monotonic()
+        for job_name, (_, created) in list(self._pending.items()):
+            if now - created > Config.WARM_POOL_PENDING_SECONDS:
+                del self._pending[job_name]
+
+        for app_type in set(sizes) | set(pools):
+            healthy = []
+            for job in pools.get(app_type, []):
+                if job.metadata.deletion_timestamp:
+                    continue
+                pods = pod_informer.by_index('job-name', job.metadata.name)
+                claimed = [p for p in pods if name_label in p.metadata.labels]
+                if claimed:
+                    name = claimed[0].metadata.labels[name_label]
+                    labels = {name_label: name, pool_label: None}
+                    try:
+                        self._label_job(app_type, job.metadata.name, labels)
+                    except ApiException as e:
+                        logger.warning(e)
+                    continue
+                if _instance_status(pods)[1] == 'app_error' or (
+                    job.status and job.status.failed
+                ):
+                    self._delete(job.metadata.name)
+                    continue
+                healthy.append(job.metadata.name)
+
+            pending = [n for n, (t, _) in self._pending.items() if t == app_type]
+            missing = sizes.get(app_type, 0) - len(healthy) - len(pending)
+            for _ in range(missing):
+                self._create(app_type)
+            for job_name in healthy[sizes.get(app_type, 0) :]:
+                self._delete(job_name)
+
+    def _create(self, app_type):
+        job_name = app_type + '-pool-' + secrets.token_hex(3)
+        job = render_job_object(
+            app_type, job_name, {type_label: app_type, pool_label: app_type}, {}
         )
-        logger.info(f'Job deleted. status="{str(api_response.status)}"')
+        with metrics.backend_call('kubernetes', 'create_namespaced_job', app_type):
+            self.batch_v1.create_namespaced_job(body=job, namespace=Config.NAMESPACE)
+        self._pending[job_name] = (app_type, time.monotonic())
+
+    def _delete(self, job_name):
+        try:
+            with metrics.backend_call('kubernetes', 'delete_namespaced_job'):
+                self.batch_v1.delete_namespaced_job(
+                    name=job_name,
+                    namespace=Config.NAMESPACE,
+                    body=client.V1DeleteOptions(
+                        propagation_policy='Background', grace_period_seconds=0
+                    ),
+                )
+        except ApiException as e:
+            if e.status != 404:
+                raise e
+
+    def _run(self):
+        while True:
+            try:
+                if self.leader.is_leader:
+                    self.refill()
+            except Exception as e:
+                logger.warning(e)
+            self._wakeup.wait(Config.WARM_POOL_INTERVAL)
+            self._wakeup.clear()
+
+
+def template_images(app_type):
+    """get the images a template starts and where its pods may run
+
+    The template is rendered without template variables.
+
+    :return list(str)
+            The images of the init containers and containers.
+
+    :return dict
+            The placement of the pods: the node selector, affinity,
+            tolerations and image pull secrets of the pod spec.
+    """
+    spec = template_registry.skeleton(app_type, {}).get('spec') or {}
+    images = [
+        container['image']
+        for field in ('initContainers', 'containers')
+        for container in spec.get(field) or []
+        if container.get('image')
+    ]
+    placement = {field: spec[field] for field in placement_fields if spec.get(field)}
+    return images, placement
+
+
+def pre_pull_daemon_set(image, placement):
+    """build the DaemonSet pulling an image on the nodes of a placement
+
+    Its pods run the image once as init container and then idle in a pause
+    container, so the image stays on the node and is not garbage collected.
+    The image may have no shell or tools, so an init container before it
+    copies the static busybox of PRE_PULL_TOOLS_IMAGE into a volume and the
+    image runs that busybox's true, which always succeeds.
+
+    :return dict
+            The DaemonSet, named after a hash of the image and placement.
+    """
+    key = json.dumps([image, placement], sort_keys=True)
+    digest = hashlib.blake2b(key.encode(), digest_size=6).hexdigest()
+    labels = {pre_pull_label: digest}
+    annotations = {pre_pull_image_annotation: image}
+    resources = {'requests': {'cpu': '1m', 'memory': '8Mi'}}
+    return {
+        'apiVersion': 'apps/v1',
+        'kind': 'DaemonSet',
+        'metadata': {
+            'name': 'config-controller-pre-pull-' + digest,
+            'labels': labels,
+            'annotations': annotations,
+        },
+        'spec': {
+            'selector': {'matchLabels': labels},
+            'template': {
+                'metadata': {'labels': labels, 'annotations': annotations},
+                'spec': copy.deepcopy(placement)
+                | {
+                    'automountServiceAccountToken': False,
+                    'terminationGracePeriodSeconds': 0,
+                    'volumes': [{'name': 'tools', 'emptyDir': {'sizeLimit': '16Mi'}}],
+                    'initContainers': [
+                        {
+                            'name': 'tools',
+                            'image': Config.PRE_PULL_TOOLS_IMAGE,
+                            'imagePullPolicy': 'IfNotPresent',
+                            'command': ['cp', '/bin/busybox', '/tools/busybox'],
+                            'volumeMounts': [{'name': 'tools', 'mountPath': '/tools'}],
+                            'resources': resources,
+                        },
+                        {
+                            'name': 'pull',
+                            'image': image,
+                            'imagePullPolicy': 'IfNotPresent',
+                            'command': ['/tools/busybox', 'true'],
+                            'volumeMounts': [
+                                {
+                                    'name': 'tools',
+                                    'mountPath': '/tools',
+                                    'readOnly': True,
+                                }
+                            ],
+                            'resources': resources,
+                        },
+                    ],
+                    'containers': [
+                        {
+                            'name': 'pause',
+                            'image': Config.PRE_PULL_PAUSE_IMAGE,
+                            'resources': {
+                                'requests': {'cpu': '1m', 'memory': '8Mi'},
+                                'limits': {'memory': '16Mi'},
+                            },
+                        }
+                    ],
+                },
+            },
+        },
+    }
+
+
+def _pull_status(pod):
+    """get whether the pre-pull pod of a node has its image
+
+    :return str
+            pulled, pulling or error if an image can not be pulled
+            or an init container failed.
+    """
+    status = pod.status
+    if status is None:
+        return 'pulling'
+    for container in status.container_statuses or []:
+        if container.state and container.state.running:
+            # the init containers completed
+            return 'pulled'
+    for container in status.init_container_statuses or []:
+        state = container.state or client.V1ContainerState()
+        if container.restart_count or (
+            state.terminated and state.terminated.exit_code != 0
+        ):
+            return 'error'
+        if state.waiting and state.waiting.reason in pull_errors:
+            return 'error'
+        if container.name == 'pull' and (state.running or state.terminated):
+            # the image has been pulled to start the container
+            return 'pulled'
+    return 'pulling'
+
+
+class ImagePrePuller:
+    """pre-pull DaemonSets keeping the images of the templates on the nodes
+
+    Templates opt in with the pre-pull annotation on their configmap, either
+    for all templates of the configmap or for a single one with
+    pre-pull.<type>, PRE_PULL sets the default. Every image of their
+    containers gets a DaemonSet on the nodes the template's pods may run on,
+    so instances start without pulling. The leader creates and deletes the
+    DaemonSets when the templates change and every PRE_PULL_INTERVAL seconds.
+    """
+
+    def __init__(self, apps_v1, informer, leader=None):
+        """construct a pre-puller
+
+        :param apps_v1: AppsV1Api to manage the DaemonSets with.
+        :param informer: Informer of the pods of the DaemonSets.
+        :param leader: The leader election deciding whether to sync the
+                       DaemonSets, the status is reported by every process.
+        """
+        self.apps_v1 = apps_v1
+        self.informer = informer
+        self.leader = leader or AlwaysLeader()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """start syncing the DaemonSets in a background thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='pre-pull', daemon=True)
+        self._thread.start()
+
+    def trigger(self, *_):
+        """sync soon, e.g. as handler of the configmap informer"""
+        self._wakeup.set()
+
+    def desired(self):
+        """get the DaemonSets needed by the templates
+
+        Templates that can not be rendered without variables are skipped.
+
+        :return dict
+                DaemonSet name to a tuple of the DaemonSet and
+                the names of the templates using its image.
+        """
+        daemon_sets = {}
+        for app_type in template_registry.list_templates():
+            try:
+                config_map = template_registry.find(app_type)
+                enabled = template_annotation(config_map, pre_pull_annotation, app_type)
+                if (enabled or str(Config.PRE_PULL)).lower() != 'true':
+                    continue
+                images, placement = template_images(app_type)
+            except Exception as e:
+                logger.warning('can not pre-pull the images of %s: %s', app_type, e)
+                continue
+            for image in images:
+                daemon_set = pre_pull_daemon_set(image, placement)
+                name = daemon_set['metadata']['name']
+                daemon_sets.setdefault(name, (daemon_set, []))[1].append(app_type)
+        return daemon_sets
+
+    def sync(self):
+        """create the missing DaemonSets and delete those no longer needed"""
+        desired = self.desired()
+        with metrics.backend_call('kubernetes', 'list_namespaced_daemon_set'):
+            existing = self.apps_v1.list_namespaced_daemon_set(
+                Config.NAMESPACE, label_selector=pre_pull_label
+            ).items
+        existing = {daemon_set.metadata.name for daemon_set in existing}
+        for name in sorted(desired.keys() - existing):
+            logger.info('pre-pulling %s', desired[name][0]['metadata']['annotations'])
+            with metrics.backend_call('kubernetes', 'create_namespaced_daemon_set'):
+                self.apps_v1.create_namespaced_daemon_set(
+                    Config.NAMESPACE, desired[name][0]
+                )
+        for name in sorted(existing - desired.keys()):
+            try:
+                with metrics.backend_call('kubernetes', 'delete_namespaced_daemon_set'):
+                    self.apps_v1.delete_namespaced_daemon_set(name, Config.NAMESPACE)
+            except ApiException as e:
+                if e.status != 404:
+                    raise e
+
+    def status(self):
+        """get the pull status of the pre-pulled images per node
+
+        :return list(dict(image=str, templates=list, nodes=dict))
+                The nodes map node names to pulled, pulling or error.
+        """
+        nodes = {}
+        for pod in self.informer.list():
+            digest = (pod.metadata.labels or {}).get(pre_pull_label)
+            node = pod.spec.node_name if pod.spec else None
+            if node is not None:
+                nodes.setdefault(digest, {})[node] = _pull_status(pod)
+        return [
+            {
+                'image': daemon_set['metadata']['annotations'][
+                    pre_pull_image_annotation
+                ],
+                'templates': sorted(app_types),
+                'nodes': nodes.get(
+                    daemon_set['metadata']['labels'][pre_pull_label], {}
+                ),
+            }
+            for daemon_set, app_types in self.desired().values()
+        ]
+
+    def _run(self):
+        while True:
+            try:
+                if self.leader.is_leader:
+                    self.sync()
+            except Exception as e:
+                logger.warning(e)
+            self._wakeup.wait(Config.PRE_PULL_INTERVAL)
+            self._wakeup.clear()
+
+
+class LeaseElector:
+    """leader election with a coordination.k8s.io Lease
+
+    The leader renews the lease every LEADER_RENEW_SECONDS. Another process
+    takes it over once it was not renewed for LEADER_LEASE_SECONDS.
+    """
+
+    def __init__(self, coordination_v1, name, holder=None):
+        """construct an elector
+
+        :param coordination_v1: The CoordinationV1Api to manage the lease with.
+        :param name: Name of the lease in JOB_NAMESPACE.
+        :param holder: Identity of this process, hostname and pid by default.
+        """
+        self.coordination_v1 = coordination_v1
+        self.name = name
+        self.holder = holder or identity()
+        self.is_leader = False
+        self._thread = None
+
+    def start(self):
+        """start campaigning in a background thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='leader', daemon=True)
+        self._thread.start()
+
+    def try_acquire(self, now=None):
+        """acquire or renew the lease
+
+        :return bool
+                Whether this process holds the lease.
+        """
+        now = now or datetime.datetime.now(datetime.UTC)
+        # MicroTime needs exactly six fractional digits
+        timestamp = now.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        try:
+            lease = self.coordination_v1.read_namespaced_lease(
+                self.name, Config.NAMESPACE
+            )
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            lease = client.V1Lease(
+                metadata=client.V1ObjectMeta(name=self.name),
+                spec=client.V1LeaseSpec(
+                    holder_identity=self.holder,
+                    lease_duration_seconds=Config.LEADER_LEASE_SECONDS,
+                    acquire_time=timestamp,
+                    renew_time=timestamp,
+                    lease_transitions=0,
+                ),
+            )
+            try:
+                self.coordination_v1.create_namespaced_lease(Config.NAMESPACE, lease)
+            except ApiException as e:
+                if e.status != 409:
+                    raise
+                return self._set(False)
+            return self._set(True)
+
+        spec = lease.spec
+        if spec.holder_identity != self.holder:
+            duration = spec.lease_duration_seconds or Config.LEADER_LEASE_SECONDS
+            renewed = spec.renew_time or spec.acquire_time
+            if renewed and renewed + datetime.timedelta(seconds=duration) > now:
+                return self._set(False)
+            spec.holder_identity = self.holder
+            spec.acquire_time = timestamp
+            spec.lease_transitions = (spec.lease_transitions or 0) + 1
+        spec.renew_time = timestamp
+        spec.lease_duration_seconds = Config.LEADER_LEASE_SECONDS
+        try:
+            # fails with a conflict if another process updated it in between
+            self.coordination_v1.replace_namespaced_lease(
+                self.name, Config.NAMESPACE, lease
+            )
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            return self._set(False)
+        return self._set(True)
+
+    def _set(self, leader):
+        if leader != self.is_leader:
+            logger.info('%s %s leader', self.holder, 'is' if leader else 'is no')
+        self.is_leader = leader
+        return leader
+
+    def _run(self):
+        event = threading.Event()
+        while True:
+            try:
+                self.try_acquire()
+            except Exception as e:
+                logger.warning(e)
+                self._set(False)
+            event.wait(Config.LEADER_RENEW_SECONDS)
 
 
 class KubernetesApi:
     def __init__(self):
-        self.v1 = client.CoreV1Api()
-        self.batch_v1 = client.BatchV1Api()
+        global pod_informer, job_informer, config_map_informer, template_registry
+        global warm_pool, endpoint_informer, pre_puller
+        self.v1 = core_v1
+        self.batch_v1 = batch_v1
+
+        pod_informer = Informer(
+            self.v1.list_namespaced_pod,
+            label_selector=type_label,
+            indexers=instance_indexers,
+        )
+        job_informer = Informer(
+            self.batch_v1.list_namespaced_job,
+            label_selector=type_label,
+            indexers=instance_indexers,
+        )
+        instance_metrics = InstanceMetrics()
+        pod_informer.add_handler(instance_metrics)
+        pod_informer.add_flush_handler(instance_metrics.flush)
+        pod_informer.add_handler(StartupTracker(startup_estimates))
+        pod_informer.add_handler(update_listing)
+        job_informer.add_handler(track_deleted_jobs)
+        self.listing = listing
+        config_map_informer = Informer(
+            self.v1.list_namespaced_config_map,
+            label_selector=Config.CONFIG_MAP_SELECTOR,
+        )
+        template_registry = TemplateRegistry(config_map_informer)
+        metrics.templates = template_registry
+        pre_pull_informer = Informer(
+            self.v1.list_namespaced_pod, label_selector=pre_pull_label
+        )
+        informers = (pod_informer, job_informer, config_map_informer, pre_pull_informer)
+        if Config.ENDPOINT_SLICES:
+            endpoint_informer = Informer(
+                client.DiscoveryV1Api(api_client).list_namespaced_endpoint_slice,
+                indexers={'pod': _endpoint_targets},
+            )
+            endpoint_informer.add_handler(EndpointReadiness())
+            informers += (endpoint_informer,)
+        for informer in informers:
+            informer.start()
+        for informer in informers:
+            if not informer.wait_for_sync(Config.INFORMER_SYNC_TIMEOUT):
+                logger.warning('informer of %s not synced', informer.list_func.__name__)
+        if Config.LEADER_ELECTION:
+            self.leader = LeaseElector(
+                client.CoordinationV1Api(api_client), Config.LEADER_LEASE_NAME
+            )
+        else:
+            self.leader = AlwaysLeader()
+        self.leader.start()
+        warm_pool = WarmPool(self.leader)
+        warm_pool.start()
+        pre_puller = ImagePrePuller(
+            client.AppsV1Api(api_client), pre_pull_informer, self.leader
+        )
+        config_map_informer.add_handler(pre_puller.trigger)
+        pre_puller.start()
+        self.admission = admission
 
     def get_jobs(self, type):
         """get running jobs of a type
@@ -240,69 +2007,27 @@ class KubernetesApi:
                 A list of all running jobs of the type.
         """
 
-        podlist = []
-        pods = self.v1.list_namespaced_pod(
-            namespace=Config.NAMESPACE, label_selector=type_label + '=' + type
-        )
-        for pod in pods.items:
-            running = False
-            errored = False
-            if pod.status.conditions is None:
-                break
-            for condition in pod.status.conditions:
-                if condition.type == 'Ready' and condition.status == 'True':
-                    running = True
-                    break
-
-            if pod.status.container_statuses is None:
-                break
-            if pod.status.container_statuses:
-                for status in pod.status.container_statuses:
-                    if not status.state.terminated:
-                        continue
-
-                    if status.state.terminated.exit_code != 0:
-                        errored = True
-
-            meta_labels = dict(
-                [
-                    [k.removeprefix(meta_label_prefix), v]
-                    for k, v in pod.metadata.labels.items()
-                    if k.startswith(meta_label_prefix)
-                ]
-            )
-            podlist.append(
-                {
-                    'ip': pod.status.pod_ip,
-                    'name': pod.metadata.labels[name_label],
-                    'sessionID': pod.metadata.labels[name_label],  # legacy support
-                    'hostname': pod.metadata.labels[name_label],  # legacy support
-                    'addr': pod.status.pod_ip,  # legacy support
-                    'errored': errored or not running,
-                    'start': pod.status.start_time.timestamp() if running else 0,
-                }
-                | meta_labels
-            )
-        return podlist
+        return [entry for _, entry in listing.snapshot(type)[1]]
 
     def list_templates(self):
         """list all available application template names
 
-        This method goes through all configmaps with the selector
+        This method goes through all watched configmaps with the selector
         and returns a list of the applications.
 
         :return list
                 A list containing the names you can requrest applications with.
         """
-        config_maps = self.v1.list_namespaced_config_map(
-            Config.NAMESPACE, label_selector=Config.CONFIG_MAP_SELECTOR
-        ).items
+        return template_registry.list_templates()
 
-        templates = []
-        for map in config_maps:
-            for template in map.data.keys():
-                templates.append(template.removesuffix('.yaml'))
-        return templates
+    def template_info(self):
+        """get the metadata of all available application templates
+
+        :return list(dict)
+                The name, source configmap, resourceVersion, template
+                variables and last modification time of every template.
+        """
+        return template_registry.template_info()
 
     def get_job(self, type, name, create=True, template_variables=None):
         """create a job of an app giving it a name
@@ -327,18 +2052,298 @@ class KubernetesApi:
         job = IntensJob(type, name, create, template_variables)
         return job
 
-    def delete_job(self, type, name):
+    def export_instances(self, type=None):
+        """iterate over all instances, listing their pods page by page
+
+        The pods are listed from the apiserver in pages of EXPORT_PAGE_SIZE,
+        only one page is held at a time, so the memory use does not grow
+        with the number of instances.
+
+        If the continue token of the listing expires, it is listed again
+        from the start skipping the pods exported already, the apiserver
+        lists pods in the order of their names.
+
+        :param type: App type to restrict the export to, all types if None.
+                     Raises a ValueError if there is no template of that type.
+
+        :return iterator(dict(type=str, name=str, ip=str, phase=str,
+                              start=float, labels=dict))
+        """
+        if type is not None and type not in template_registry:
+            raise ValueError(f'unknown app type {type}')
+        selector = name_label if type is None else f'{type_label}={type},{name_label}'
+        token = None
+        last = None
+        restarted = False
+        while True:
+            try:
+                with metrics.backend_call(
+                    'kubernetes', 'list_namespaced_pod', type or ''
+                ):
+                    page = self.v1.list_namespaced_pod(
+                        Config.NAMESPACE,
+                        label_selector=selector,
+                        limit=Config.EXPORT_PAGE_SIZE,
+                        _continue=token,
+                    )
+            except ApiException as e:
+                if e.status != 410 or token is None:
+                    raise
+                if restarted:
+                    # expired again before any new pod was exported
+                    raise RuntimeError('the pod listing expired, export again') from e
+                logger.info('pod listing expired after %s, listing again', last)
+                token = None
+                restarted = True
+                continue
+            for pod in page.items:
+                if last is not None and pod.metadata.name <= last:
+                    continue
+                last = pod.metadata.name
+                restarted = False
+                yield _export_row(pod)
+            token = page.metadata._continue
+            if not token:
+                return
+
+    def pre_pull_status(self):
+        """get the pull status of the pre-pulled template images per node
+
+        :return list(dict(image=str, templates=list, nodes=dict))
+        """
+        return pre_puller.status()
+
+    def retry_after(self, type, name):
+        """suggest when to ask again for an instance that is not ready
+
+        :return int
+                Seconds for the Retry-After header, from the admission queue
+                and the observed startup durations of the app type.
+        """
+        position = admission.position(type, name)
+        if position is not None:
+            startup = startup_estimates.remaining(type, 'scheduling', 0)
+            return retry_after(admission.wait_estimate(position) + (startup or 0))
+        return retry_after(IntensJob(type, name, create=False).eta())
+
+    def create_jobs(self, type, instances):
+        """create many instances of an app type at once
+
+        The template is rendered once per distinct set of template variables
+        and the jobs are submitted concurrently, limited by BATCH_PARALLELISM.
+        Instances without template variables are claimed from the warm pool
+        if possible.
+
+        :param type: What application you want instances of.
+        :param instances: List of (name, template_variables) tuples.
+
+        :return list(dict(name=str, status=str))
+                The status of each instance, one of created, claimed,
+                queued with its position, exists or error with a msg.
+                Repeated names are created once and reported as duplicate.
+        """
+        results = {}
+        rendered = {}
+        pending = []
+        seen = set()
+        for name, template_variables in instances:
+            if name in seen:
+                continue
+            seen.add(name)
+            job = IntensJob(type, name, create=False)
+            if job.exists:
+                results[name] = {'name': name, 'status': 'exists'}
+                continue
+
+            key = json.dumps(template_variables, sort_keys=True)
+            try:
+                if key not in rendered:
+                    rendered[key] = render_job_object(
+                        type, None, {}, template_variables
+                    )
+            except Exception as e:
+                results[name] = {'name': name, 'status': 'error', 'msg': str(e)}
+                continue
+            pending.append((job, not template_variables, rendered[key]))
+
+        def submit(job, claimable, job_object):
+            if claimable and warm_pool.claim(type, job.name) is not None:
+                return {'name': job.name, 'status': 'claimed'}
+            body = instantiate_job_object(
+                copy.deepcopy(job_object),
+                job.job_name,
+                {name_label: job.name, type_label: type},
+            )
+
+            created = []
+
+            def create():
+                created.append(
+                    create_job_object(type, job.job_name, body, self.batch_v1)
+                )
+
+            try:
+                position = admission.submit(type, job.name, create)
+            except ApiException as e:
+                return {'name': job.name, 'status': 'error', 'msg': e.reason}
+            except Exception as e:
+                return {'name': job.name, 'status': 'error', 'msg': str(e)}
+            if position:
+                return {'name': job.name, 'status': 'queued', 'position': position}
+            if created == [False]:
+                return {'name': job.name, 'status': 'exists'}
+            return {'name': job.name, 'status': 'created'}
+
+        with ThreadPoolExecutor(max_workers=Config.BATCH_PARALLELISM) as executor:
+            for result in executor.map(lambda args: submit(*args), pending):
+                results[result['name']] = result
+
+        statuses = []
+        for name, _ in instances:
+            if name in seen:
+                seen.discard(name)
+                statuses.append(results[name])
+            else:
+                statuses.append({'name': name, 'status': 'duplicate'})
+        return statuses
+
+    def patch_jobs(self, type, instances):
+        """set and remove meta labels of many instances of an app type at once
+
+        :param type: What application the instances are of.
+        :param instances: Dict of instance names to dicts of labels,
+                          a None value removes the label.
+
+        :return list(dict(name=str, status=str))
+                The status of each instance, one of patched, not_found or error.
+        """
+
+        def patch(name, labels):
+            try:
+                job = IntensJob(type, name, create=False)
+                if not job.exists:
+                    return {'name': name, 'status': 'not_found'}
+                job.add_labels(labels)
+            except Exception as e:
+                return {'name': name, 'status': 'error', 'msg': str(e)}
+            return {'name': name, 'status': 'patched'}
+
+        with ThreadPoolExecutor(max_workers=Config.BATCH_PARALLELISM) as executor:
+            return list(executor.map(lambda args: patch(*args), instances.items()))
+
+    def find_job(self, name):
+        """find an instance by name in any app type
+
+        Uses the instance-name index of the informers,
+        the name is also the legacy sessionID.
+
+        :param name: Name of the application instance.
+
+        :return IntensJob
+                The instance or None if there is none of that name.
+        """
+        objects = pod_informer.by_index('instance-name', name) or job_informer.by_index(
+            'instance-name', name
+        )
+        for obj in objects:
+            app_type = obj.metadata.labels.get(type_label)
+            if app_type is not None:
+                return IntensJob(app_type, name, create=False)
+        return None
+
+    def record_access(self, type, accesses):
+        """share the last access of instances with the other processes
+
+        The time is set as last-access annotation on the pods.
+
+        :param accesses: Dict of instance names to access timestamps.
+        """
+
+        def record(name, last):
+            body = {'metadata': {'annotations': {last_access_annotation: str(last)}}}
+            for pod in pod_informer.by_index('instance', type + '/' + name):
+                try:
+                    with metrics.backend_call(
+                        'kubernetes', 'patch_namespaced_pod', type
+                    ):
+                        self.v1.patch_namespaced_pod(
+                            pod.metadata.name, Config.NAMESPACE, body
+                        )
+                except ApiException as e:
+                    logger.warning(e)
+
+        with ThreadPoolExecutor(max_workers=Config.BATCH_PARALLELISM) as executor:
+            list(executor.map(lambda args: record(*args), accesses.items()))
+
+    def last_access(self, type):
+        """get the last access of the instances of a type recorded by any process
+
+        :return dict
+                Instance name to access timestamp.
+        """
+        accesses = {}
+        for pod in pod_informer.by_index('instance-type', type):
+            name = pod.metadata.labels.get(name_label)
+            value = (pod.metadata.annotations or {}).get(last_access_annotation)
+            if name is None or value is None:
+                continue
+            try:
+                accesses[name] = max(float(value), accesses.get(name, 0))
+            except ValueError:
+                continue
+        return accesses
+
+    def idle_ttl(self, type):
+        """get the seconds after which idle instances of a type are deleted
+
+        Set with the idle-ttl annotation on the configmap of the template,
+        IDLE_TTL applies to templates without it.
+
+        :return int
+                The TTL in seconds, 0 if idle instances are kept.
+        """
+        return template_setting(type, idle_ttl_annotation, Config.IDLE_TTL)
+
+    def collect_finished(self):
+        """find jobs that completed or failed more than REAPER_FINISHED_TTL ago
+
+        Finished jobs are kept for a while, so their state can be looked at.
+
+        :return list(tuple(str, str, function))
+                App type, instance name (or job name of pool jobs)
+                and a function deleting the job.
+        """
+        deadline = time.time() - Config.REAPER_FINISHED_TTL
+        finished = []
+        for job in job_informer.list():
+            finished_at = _finished_at(job)
+            if finished_at is None or finished_at > deadline:
+                continue
+            labels = job.metadata.labels or {}
+            app_type = labels.get(type_label)
+            finished.append(
+                (
+                    app_type,
+                    labels.get(name_label, job.metadata.name),
+                    functools.partial(delete_job_object, app_type, job.metadata.name),
+                )
+            )
+        return finished
+
+    def delete_job(self, type, name, job=None):
         """delete a job of an app with a given name
 
         Delete a kubernetes job of that type or name.
 
         :param type: Type of the application.
         :param name: Name of the application instance.
+        :param job: The already looked up IntensJob of the instance, if any.
 
         :return bool
                 Whether or not a job was deleted.
         """
-        job = IntensJob(type, name, create=False)
+        if job is None:
+            job = IntensJob(type, name, create=False)
         if job.exists:
             job._delete_job()
             return True
@@ -0,0 +1,74 @@
+"""
+elects the process running the background loops
+"""
+
+import fcntl
+import logging
+import os
+import socket
+import threading
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def identity():
+    """identify this worker process among all workers and replicas"""
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class AlwaysLeader:
+    """leadership of a controller running as a single process"""
+
+    is_leader = True
+
+    def start(self):
+        pass
+
+
+class FileLockElector:
+    """leader election among the workers of one host with a file lock
+
+    The worker holding an exclusive lock on the file is the leader,
+    the lock is released by the operating system when it exits.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.is_leader = False
+        self._file = None
+        self._thread = None
+
+    def start(self):
+        """start trying to get the lock in a background thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='leader', daemon=True)
+        self._thread.start()
+
+    def try_acquire(self):
+        """try to get the lock
+
+        :return bool
+                Whether this process holds the lock.
+        """
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        if not self.is_leader:
+            logger.info('%s is leader', identity())
+        self.is_leader = True
+        return True
+
+    def _run(self):
+        event = threading.Event()
+        while not self.is_leader:
+            try:
+                self.try_acquire()
+            except OSError as e:
+                logger.warning(e)
+            event.wait(Config.LEADER_RENEW_SECONDS)
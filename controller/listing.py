@@ -0,0 +1,129 @@
+"""
+incrementally maintained listings of the instances of every app type
+"""
+
+import base64
+import binascii
+import bisect
+import itertools
+import secrets
+import threading
+
+
+class InstanceListing:
+    """summaries of the instances of every app type
+
+    The backends put the summary of an instance whenever it changes
+    and discard it when the instance is gone, so a listing is never rebuilt
+    from the backend objects. Every change of an app type bumps its version,
+    which together with the epoch of the process identifies the content.
+    """
+
+    def __init__(self):
+        self.epoch = secrets.token_hex(4)
+        self._entries = {}
+        self._sorted = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def put(self, app_type, key, entry):
+        """add or replace the summary of an instance
+
+        :param key: Unique key of the instance, e.g. the pod name.
+        :param entry: The summary dict, it must not be modified afterwards.
+        """
+        with self._lock:
+            entries = self._entries.setdefault(app_type, {})
+            if entries.get(key) == entry:
+                return
+            entries[key] = entry
+            self._changed(app_type)
+
+    def discard(self, app_type, key):
+        with self._lock:
+            entries = self._entries.get(app_type)
+            if not entries or key not in entries:
+                return
+            del entries[key]
+            self._changed(app_type)
+
+    def count(self, app_type):
+        with self._lock:
+            return len(self._entries.get(app_type, ()))
+
+    def snapshot(self, app_type):
+        """get the current listing of an app type
+
+        :return int
+                The version of the listing.
+
+        :return list(tuple(str, dict))
+                The keys and summaries sorted by key.
+        """
+        with self._lock:
+            items = self._sorted.get(app_type)
+            if items is None:
+                items = sorted(self._entries.get(app_type, {}).items())
+                self._sorted[app_type] = items
+            return self._versions.get(app_type, 0), items
+
+    def _changed(self, app_type):
+        self._versions[app_type] = self._versions.get(app_type, 0) + 1
+        # sorted lazily on the next read, many changes may come in between
+        self._sorted.pop(app_type, None)
+
+
+def parse_selector(selector):
+    """parse a selector like user=alice,group=admins
+
+    :return dict
+            The required value of each key.
+    """
+    required = {}
+    for term in filter(None, (selector or '').split(',')):
+        key, sep, value = term.partition('=')
+        if not sep or not key:
+            raise ValueError('invalid selector ' + term)
+        required[key.strip()] = value.strip()
+    return required
+
+
+def encode_continue(key):
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_continue(token):
+    try:
+        return base64.b64decode(token.encode(), altchars=b'-_', validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError('invalid continue token')
+
+
+def query(items, selector=None, fields=None, limit=None, after=None):
+    """select a page of a listing
+
+    :param items: Sorted keys and summaries from InstanceListing.snapshot.
+    :param selector: Dict of keys and values the summaries must have.
+    :param fields: Keys to include in the result, all if None.
+    :param limit: Maximum number of summaries to return.
+    :param after: Key of the last summary of the previous page.
+
+    :return list(dict)
+            The selected summaries.
+
+    :return str
+            The key of the last returned summary if there are more, else None.
+    """
+    start = bisect.bisect_right(items, after, key=lambda item: item[0]) if after else 0
+    page = []
+    last_key = None
+    for key, entry in itertools.islice(items, start, None):
+        if selector and any(str(entry.get(k)) != v for k, v in selector.items()):
+            continue
+        if limit is not None and len(page) == limit:
+            return page, last_key
+        if fields is not None:
+            entry = {k: entry[k] for k in fields if k in entry}
+        page.append(entry)
+        last_key = key
+    return page, None
@@ -0,0 +1,82 @@
+"""
+least recently used cache bounded by entries and size
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LruCache:
+    """thread-safe cache evicting the least recently used entries
+
+    Entries are evicted once there are more than max_entries of them
+    or their sizes add up to more than max_bytes.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        """construct a cache
+
+        :param max_entries: Maximum number of entries, 0 disables the cache.
+        :param max_bytes: Maximum sum of the entry sizes.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """get an entry and mark it as recently used
+
+        :return
+                The value or None if it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size):
+        """add or replace an entry, evicting old ones if needed
+
+        Values larger than max_bytes are not cached.
+
+        :param size: Size of the value in bytes, an estimate is good enough.
+        """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self.bytes > self.max_bytes
+            ):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def pop(self, key):
+        """remove an entry
+
+        :return
+                The value or None if it is not cached.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self.bytes -= entry[1]
+            return entry[0]
+
+    def discard(self, predicate):
+        """drop all entries whose key satisfies the predicate"""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self.bytes -= self._entries.pop(key)[1]
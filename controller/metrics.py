@@ -0,0 +1,172 @@
+"""
+prometheus metrics of the provisioning stages and backend calls
+"""
+
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# with several workers the gauges of the processes are merged: the sizes
+# of per process queues and caches add up, the values every process (or
+# only the leader) computes for the whole cluster take the latest one
+
+# the templates of the backend, set once it is loaded
+templates = ()
+
+# provisioning takes from milliseconds (cache lookups) up to minutes (image pulls)
+buckets = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+stage_seconds = Histogram(
+    'config_controller_stage_seconds',
+    'Duration of the provisioning stages of an instance',
+    ['app_type', 'stage'],
+    buckets=buckets,
+)
+ready_outcomes = Counter(
+    'config_controller_ready_outcomes_total',
+    'Results of readiness checks of instances',
+    ['app_type', 'outcome'],
+)
+backend_call_seconds = Histogram(
+    'config_controller_backend_call_seconds',
+    'Latency of kubernetes apiserver and docker daemon calls',
+    ['app_type', 'backend', 'verb'],
+    buckets=buckets,
+)
+backend_errors = Counter(
+    'config_controller_backend_errors_total',
+    'Failed kubernetes apiserver and docker daemon calls',
+    ['app_type', 'backend', 'verb'],
+)
+reaper_deletes = Counter(
+    'config_controller_reaper_deletes_total',
+    'Deletions carried out by the background reaper',
+    ['app_type', 'reason', 'outcome'],
+)
+reaper_queue = Gauge(
+    'config_controller_reaper_queue',
+    'Instances waiting to be deleted',
+    multiprocess_mode='livesum',
+)
+active_instances = Gauge(
+    'config_controller_active_instances',
+    'Instances accessed within the activity window per template',
+    ['app_type'],
+    multiprocess_mode='livemostrecent',
+)
+idle_instances = Gauge(
+    'config_controller_idle_instances',
+    'Instances not accessed within the activity window per template',
+    ['app_type'],
+    multiprocess_mode='livemostrecent',
+)
+admission_queue = Gauge(
+    'config_controller_admission_queue',
+    'Instance creations waiting for admission per template',
+    ['app_type'],
+    multiprocess_mode='livesum',
+)
+admission_wait_seconds = Histogram(
+    'config_controller_admission_wait_seconds',
+    'Time instance creations waited for admission',
+    ['app_type'],
+    buckets=buckets,
+)
+skeleton_cache = Counter(
+    'config_controller_skeleton_cache_total',
+    'Lookups of rendered job skeletons per template',
+    ['app_type', 'outcome'],
+)
+skeleton_cache_bytes = Gauge(
+    'config_controller_skeleton_cache_bytes',
+    'Size of the rendered templates held by the job skeleton cache',
+    multiprocess_mode='livesum',
+)
+label_patches = Counter(
+    'config_controller_label_patches_total',
+    'Meta label patches sent to the backend or merged into another patch',
+    ['app_type', 'outcome'],
+)
+startup_estimate_seconds = Gauge(
+    'config_controller_startup_estimate_seconds',
+    'Moving average of the duration of the startup stages per template',
+    ['app_type', 'stage'],
+    multiprocess_mode='livemostrecent',
+)
+response_cache = Counter(
+    'config_controller_response_cache_total',
+    'Lookups of cached responses of the read-only routes',
+    ['route', 'outcome'],
+)
+response_cache_bytes = Gauge(
+    'config_controller_response_cache_bytes',
+    'Size of the responses held by the response cache',
+    multiprocess_mode='livesum',
+)
+instances = Gauge(
+    'config_controller_instances',
+    'Live instances per template',
+    ['app_type'],
+    multiprocess_mode='livemostrecent',
+)
+
+
+def app_type_label(app_type):
+    """get the label value of an app type
+
+    The app types of requests are not validated, so types without a
+    template are labelled unknown instead of adding a series each.
+    """
+    if not app_type or app_type in templates:
+        return app_type
+    return 'unknown'
+
+
+@contextmanager
+def stage(app_type, name):
+    """time a provisioning stage of an instance
+
+    :param app_type: Type of the app the instance belongs to.
+    :param name: Name of the stage, e.g. lookup, render or create.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.labels(app_type_label(app_type), name).observe(
+            time.perf_counter() - start
+        )
+
+
+@contextmanager
+def backend_call(backend, verb, app_type=''):
+    """time a call to the kubernetes apiserver or docker daemon
+
+    Failed calls are counted separately and re-raised.
+
+    :param backend: kubernetes or docker.
+    :param verb: The kind of call, e.g. list, create, patch or delete.
+    :param app_type: Type of the app the call is made for, if any.
+    """
+    app_type = app_type_label(app_type)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        backend_errors.labels(app_type, backend, verb).inc()
+        raise
+    finally:
+        backend_call_seconds.labels(app_type, backend, verb).observe(
+            time.perf_counter() - start
+        )
+
+
+def ready_outcome(app_type, success, status):
+    """count the result of a readiness check
+
+    :param success: Whether the instance is ready.
+    :param status: The status message if it is not ready.
+    """
+    outcome = 'ready' if success else status
+    ready_outcomes.labels(app_type_label(app_type), outcome).inc()
@@ -0,0 +1,72 @@
+"""
+estimates how long the instances of a template take to become ready
+"""
+
+import math
+import threading
+
+from config import Config
+from controller import metrics
+
+
+class StartupEstimates:
+    """moving averages of the startup stages per template
+
+    The stages follow each other: scheduling lasts until the instance is
+    placed on a node, starting until it is ready, including the image pull.
+    Each is kept as exponentially weighted moving average, so the estimates
+    follow changes like a newly pushed image.
+    """
+
+    stages = ('scheduling', 'starting')
+    # weight of a new observation
+    weight = 0.3
+
+    def __init__(self):
+        self._averages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, app_type, stage, seconds):
+        """add the observed duration of a stage of an instance"""
+        seconds = max(seconds, 0.0)
+        with self._lock:
+            average = self._averages.get((app_type, stage))
+            if average is not None:
+                seconds = average + self.weight * (seconds - average)
+            self._averages[(app_type, stage)] = seconds
+        metrics.startup_estimate_seconds.labels(app_type, stage).set(seconds)
+
+    def estimate(self, app_type, stage):
+        """get the average duration of a stage, None if it was never observed"""
+        with self._lock:
+            return self._averages.get((app_type, stage))
+
+    def remaining(self, app_type, stage, elapsed):
+        """estimate the seconds until an instance is ready
+
+        :param stage: The stage the instance is in.
+        :param elapsed: Seconds the instance has been in the stage.
+
+        :return float
+                The rest of the current stage and the following stages,
+                None if any of them was never observed.
+        """
+        estimates = [
+            self.estimate(app_type, s) for s in self.stages[self.stages.index(stage) :]
+        ]
+        if None in estimates:
+            return None
+        return max(estimates[0] - elapsed, 0.0) + sum(estimates[1:])
+
+
+def retry_after(seconds):
+    """turn an estimate into the value of a Retry-After header
+
+    :param seconds: Estimated seconds until an instance is ready or None.
+
+    :return int
+            Whole seconds between 1 and RETRY_AFTER_MAX, 1 without estimate.
+    """
+    if seconds is None:
+        return 1
+    return max(1, min(math.ceil(seconds), Config.RETRY_AFTER_MAX))
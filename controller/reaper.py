@@ -0,0 +1,163 @@
+"""
+deletes instances in the background
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from controller import metrics
+from controller.leader import AlwaysLeader
+
+logger = logging.getLogger(__name__)
+
+
+class Reaper:
+    """background queue deleting instances
+
+    Deletions are queued per app type and name and carried out by a worker
+    thread in batches of REAPER_BATCH_SIZE, the deletions of a batch run in
+    parallel. Failed deletions are retried with exponential backoff up to
+    REAPER_RETRIES times. Every REAPER_INTERVAL seconds the instances
+    reported by the collect function, e.g. finished jobs, are queued as well,
+    by the elected leader only.
+    """
+
+    def __init__(self, collect=None, leader=None):
+        """construct a reaper
+
+        :param collect: Function returning a list of (app_type, name, delete)
+                        tuples of instances to garbage collect.
+        :param leader: The leader election deciding whether to collect.
+        """
+        self.collect = collect
+        self.leader = leader or AlwaysLeader()
+        self._queue = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=Config.BATCH_PARALLELISM, thread_name_prefix='reaper'
+        )
+        self._thread = None
+
+    def start(self):
+        """start deleting and collecting in a background thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='reaper', daemon=True)
+        self._thread.start()
+
+    def enqueue(self, app_type, name, delete, reason='requested'):
+        """queue the deletion of an instance
+
+        :param delete: Function deleting the instance, raising on failure.
+        :param reason: Why the instance is deleted, requested or finished.
+
+        :return bool
+                False if the instance is already queued.
+        """
+        with self._cond:
+            key = (app_type, name)
+            if key in self._queue:
+                return False
+            self._queue[key] = {
+                'delete': delete,
+                'reason': reason,
+                'attempts': 0,
+                'not_before': 0,
+                'running': False,
+            }
+            metrics.reaper_queue.set(len(self._queue))
+            self._cond.notify()
+        return True
+
+    def pending(self, app_type, name):
+        """whether the deletion of an instance is queued or running"""
+        with self._cond:
+            return (app_type, name) in self._queue
+
+    def sweep(self):
+        """queue the instances reported by the collect function"""
+        if self.collect is None:
+            return
+        for app_type, name, delete in self.collect():
+            self.enqueue(app_type, name, delete, reason='finished')
+
+    def run_once(self):
+        """delete one batch of due instances
+
+        :return int
+                The number of deletions attempted.
+        """
+        now = time.monotonic()
+        with self._cond:
+            batch = [
+                (key, item)
+                for key, item in self._queue.items()
+                if not item['running'] and item['not_before'] <= now
+            ][: Config.REAPER_BATCH_SIZE]
+            for _, item in batch:
+                item['running'] = True
+
+        for (key, item), error in zip(
+            batch, self._executor.map(self._delete, batch), strict=True
+        ):
+            self._done(key, item, error)
+        return len(batch)
+
+    def _delete(self, entry):
+        (app_type, _), item = entry
+        try:
+            with metrics.stage(app_type, 'delete'):
+                item['delete']()
+        except Exception as e:
+            return e
+        return None
+
+    def _done(self, key, item, error):
+        app_type, name = key
+        with self._cond:
+            item['running'] = False
+            item['attempts'] += 1
+            retry = error is not None and item['attempts'] <= Config.REAPER_RETRIES
+            if retry:
+                item['not_before'] = time.monotonic() + min(2 ** item['attempts'], 60)
+            else:
+                del self._queue[key]
+            metrics.reaper_queue.set(len(self._queue))
+
+        if error is None:
+            outcome = 'deleted'
+        elif retry:
+            outcome = 'retry'
+            logger.warning('deleting %s/%s failed, retrying: %s', app_type, name, error)
+        else:
+            outcome = 'failed'
+            logger.error('deleting %s/%s failed: %s', app_type, name, error)
+        metrics.reaper_deletes.labels(app_type, item['reason'], outcome).inc()
+
+    def _run(self):
+        next_sweep = time.monotonic()
+        while True:
+            if time.monotonic() >= next_sweep:
+                # followers look again after an interval like the leader
+                if self.leader.is_leader:
+                    try:
+                        self.sweep()
+                    except Exception as e:
+                        logger.warning(e)
+                next_sweep = time.monotonic() + Config.REAPER_INTERVAL
+
+            if self.run_once():
+                continue
+
+            # sleep until the next retry, sweep or enqueued deletion
+            with self._cond:
+                due = min(
+                    (i['not_before'] for i in self._queue.values() if not i['running']),
+                    default=next_sweep,
+                )
+                timeout = min(due, next_sweep) - time.monotonic()
+                if timeout > 0:
+                    self._cond.wait(timeout)
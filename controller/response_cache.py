@@ -0,0 +1,111 @@
+"""
+short-lived cache of the serialized responses of read-only routes
+"""
+
+import hashlib
+import threading
+import time
+
+from config import Config
+from controller import metrics
+from controller.lru import LruCache
+
+
+class CachedResponse:
+    """a serialized response and what it is valid for"""
+
+    def __init__(self, body, headers, version, expires):
+        self.body = body
+        self.headers = headers
+        self.version = version
+        self.expires = expires
+
+
+class ResponseCache:
+    """serialized responses kept for RESPONSE_CACHE_TTL seconds
+
+    Entries are keyed by the app type they list, the route and the query.
+    An entry is also dropped once the version it was built from, e.g. the
+    version of the instance listing, changed, and writes through the API
+    invalidate the entries of their app type right away.
+    """
+
+    def __init__(self, store=None, ttl=None):
+        """construct a cache
+
+        :param store: Store of the entries with the get, put and discard
+                      methods of LruCache. By default an LruCache bounded by
+                      RESPONSE_CACHE_ENTRIES and RESPONSE_CACHE_BYTES.
+        :param ttl: Seconds an entry is served, RESPONSE_CACHE_TTL by default.
+                    0 disables the cache.
+        """
+        if store is None:
+            store = LruCache(Config.RESPONSE_CACHE_ENTRIES, Config.RESPONSE_CACHE_BYTES)
+        self.store = store
+        self.ttl = Config.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version=None):
+        """get a cached response
+
+        :param key: Tuple of the app type or None, the route and the query.
+        :param version: Version of the data the response must be built from.
+
+        :return CachedResponse
+                The response or None if it is missing, expired or outdated.
+        """
+        entry = self.store.get(key) if self.ttl > 0 else None
+        if entry is not None and (
+            entry.expires <= time.monotonic() or entry.version != version
+        ):
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.response_cache.labels(key[1], 'miss' if entry is None else 'hit').inc()
+        return entry
+
+    def put(self, key, body, headers=None, version=None):
+        """cache a serialized response
+
+        :param body: The serialized response.
+        :param headers: Headers to send with it. Without ETag header, a weak
+                        ETag is derived from the body.
+        :param version: Version of the data the response was built from.
+
+        :return CachedResponse
+                The response with its ETag and Cache-Control headers.
+        """
+        headers = dict(headers or {})
+        if 'ETag' not in headers:
+            digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+            headers['ETag'] = f'W/"{digest}"'
+        headers['Cache-Control'] = f'max-age={self.ttl}' if self.ttl > 0 else 'no-cache'
+        entry = CachedResponse(body, headers, version, time.monotonic() + self.ttl)
+        if self.ttl > 0:
+            self.store.put(key, entry, len(body))
+            metrics.response_cache_bytes.set(getattr(self.store, 'bytes', 0))
+        return entry
+
+    def invalidate(self, app_type):
+        """drop the cached responses of an app type"""
+        self.store.discard(lambda key: key[0] == app_type)
+
+    def stats(self):
+        """get the hit ratio and size of the cache
+
+        :return dict(hits=int, misses=int, ratio=float, entries=int, bytes=int)
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'ratio': hits / (hits + misses) if hits + misses else 0.0,
+            'entries': len(self.store),
+            'bytes': getattr(self.store, 'bytes', 0),
+        }
@@ -1,49 +1,321 @@
+import asyncio
+import functools
+import hashlib
+import json
 import logging
-import os
+import re
+import threading
 import time
 
-from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-if os.getenv('KUBERNETES_SERVICE_HOST'):
-    import controller.kubernetes_api
+from config import Config
+from controller import backends, listing
+from controller.activity import ActivityTracker, IdleReclaimer
+from controller.reaper import Reaper
+from controller.response_cache import ResponseCache
+from controller.singleflight import SingleFlight
 
-    controller.kubernetes_api.load_config()
-    api = controller.kubernetes_api.KubernetesApi()
-else:
-    import controller.docker_api
+logger = logging.getLogger(__name__)
 
-    controller.docker_api.load_config()
-    api = controller.docker_api.DockerApi()
 
-logger = logging.getLogger(__name__)
-bp = APIRouter()
+async def require_backend():
+    """load the backend in a thread if a request arrives before the warm-up"""
+    if not backends.loaded():
+        await run_in_threadpool(backends.load)
+
+
+bp = APIRouter(dependencies=[Depends(require_backend)])
+# the backend selected with BACKEND, loaded by warm_up or the first request
+api = backends.LazyApi()
+# set once the backend is loaded and the background loops run
+ready = threading.Event()
+_warm_up_lock = threading.Lock()
+# concurrent requests for the same instance share one create and readiness wait
+provisioning = SingleFlight()
+# deletes requested instances and garbage collects finished ones
+reaper = Reaper()
+# last access of the instances, idle ones are deleted after the idle TTL
+activity = ActivityTracker()
+# serialized responses of the read-only routes, invalidated by writes
+response_cache = ResponseCache()
+
+
+def warm_up():
+    """load the backend and start the background loops
+
+    Runs in a thread started by the app lifespan, so the server accepts
+    requests while the caches of the backend are synced.
+    """
+    with _warm_up_lock:
+        if ready.is_set():
+            return
+        backend = backends.load()
+        reaper.collect = backend.collect_finished
+        reaper.leader = backend.leader
+        reaper.start()
+        IdleReclaimer(
+            activity,
+            backend,
+            lambda type, name: delete_instance(type, name, reason='idle'),
+            backend.leader,
+        ).start()
+        ready.set()
+
+
+async def provision(type, name, template_variables, timeout=10, queued=False):
+    """get or create an instance and wait for it to be ready
+
+    Concurrent calls for the same arguments are coalesced, all callers
+    get the result of the same call. Instances that are estimated to take
+    longer than the timeout to start are not waited for, neither are those
+    whose creation is queued by the admission unless queued is set.
+
+    :param queued: Whether to wait for a queued creation to be admitted
+                   within the timeout.
+
+    :return tuple(bool, str, dict)
+            Whether the instance is ready, its ip address or status
+            and its meta labels if it is ready.
+    """
+
+    async def get_ready():
+        deadline = time.monotonic() + timeout
+        job = await run_in_threadpool(
+            api.get_job, type, name, template_variables=template_variables
+        )
+        if api.admission.position(type, name) is not None:
+            if not queued:
+                # the creation waits for admission, do not hold the request
+                return False, 'queued', {}
+            while api.admission.pending(type, name):
+                if time.monotonic() >= deadline:
+                    return False, 'queued', {}
+                await asyncio.sleep(0.1)
+            error = api.admission.failure(type, name)
+            if error is not None:
+                raise error
+        wait = max(deadline - time.monotonic(), 0)
+        eta = job.eta()
+        if eta is not None and eta > wait:
+            # it will not be ready in time, answer right away from the cache
+            wait = 0
+        success, instance = await job.wait_ip(wait)
+        meta_labels = job.get_meta_labels() if success else {}
+        return success, instance, meta_labels
+
+    return await provisioning.do((type, name, timeout, queued), get_ready)
+
+
+def preferred_wait(req: Request):
+    """get the seconds a client is willing to wait from a Prefer: wait=n header
+
+    :return int
+            The seconds to wait, limited to the ready timeout, or 10 by default.
+    """
+    match = re.search(r'\bwait=(\d+)', req.headers.get('prefer', ''))
+    if match is None:
+        return 10
+    return min(int(match.group(1)), Config.READY_TIMEOUT)
+
+
+def if_none_match(req: Request, etag):
+    """whether the client has the response with an ETag already"""
+    tags = req.headers.get('if-none-match', '')
+    return etag in [t.strip() for t in tags.split(',')]
+
+
+async def cached(req: Request, app_type, build, version=None):
+    """answer a read-only route from the response cache
+
+    Responses are built on a miss and answered with 304 if the client sent
+    their ETag in If-None-Match.
+
+    :param app_type: The app type the response lists, None for other routes.
+    :param build: Coroutine function returning the content of the response
+                  and a dict of headers to send with it.
+    :param version: Version of the data the response is built from.
+    """
+    key = (app_type, req.scope['route'].path, str(req.query_params))
+    entry = response_cache.get(key, version)
+    if entry is None:
+        content, headers = await build()
+        entry = response_cache.put(key, JSONResponse(content).body, headers, version)
+    if if_none_match(req, entry.headers['ETag']):
+        return Response(status_code=304, headers=entry.headers)
+    return Response(entry.body, media_type='application/json', headers=entry.headers)
 
 
 @bp.get('/app')
-def templates():
-    return api.list_templates()
+async def templates(req: Request, detail: bool = False):
+    """list the available app types
+
+    With detail=true the metadata of every template is returned instead:
+    its source, revision, template variables and modification time.
+    """
+
+    async def build():
+        if detail:
+            return api.template_info(), {}
+        return api.list_templates(), {}
+
+    return await cached(req, None, build)
+
+
+def listing_etag(type, version, params):
+    """identify a listing page by the listing version and the query
+
+    :return str
+            A weak ETag that changes whenever an instance of the type changes.
+    """
+    query = '&'.join(f'{k}={v}' for k, v in sorted(params.items()))
+    # the type is hashed too, it may contain characters not allowed in headers
+    key = json.dumps([type, query])
+    digest = hashlib.blake2b(key.encode(), digest_size=6).hexdigest()
+    return f'W/"{api.listing.epoch}-{version}-{digest}"'
 
 
 @bp.get('/app/{type}')
-def getAll(type: str):
-    return api.get_jobs(type)
+async def getAll(
+    type: str,
+    req: Request,
+    selector: str | None = None,
+    fields: str | None = None,
+    limit: int | None = Query(None, ge=1),
+    continue_: str | None = Query(None, alias='continue'),
+):
+    """list the running instances of a type
+
+    Served from the instance listing of the backend without calling it.
+    Instances can be filtered by name or meta labels with
+    selector=key=value,..., reduced to some fields with fields=ip,name and
+    paged with limit; the X-Continue response header holds the continue
+    parameter of the next page. Unchanged pages are answered with 304
+    if the ETag is sent in If-None-Match.
+    """
+    try:
+        required = listing.parse_selector(selector)
+        after = listing.decode_continue(continue_) if continue_ else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={'status': 'error', 'msg': str(e)})
+
+    version, items = api.listing.snapshot(type)
+
+    async def build():
+        page, last_key = listing.query(
+            items,
+            selector=required,
+            fields=fields.split(',') if fields else None,
+            limit=limit,
+            after=after,
+        )
+        headers = {'ETag': listing_etag(type, version, dict(req.query_params))}
+        if last_key is not None:
+            headers['X-Continue'] = listing.encode_continue(last_key)
+        return page, headers
+
+    return await cached(req, type, build, (api.listing.epoch, version))
+
+
+@bp.post('/app/{type}')
+async def create_many(type: str, instances: list[str | dict]):
+    """create many instances of a type at once
+
+    The body is a list of instance names or of objects with
+    a name and optional template variables, e.g.
+    ["a", {"name": "b", "variables": {"key": "value"}}]
+    """
+    try:
+        requested = [
+            (i, {}) if isinstance(i, str) else (i['name'], i.get('variables') or {})
+            for i in instances
+        ]
+    except KeyError as e:
+        raise HTTPException(
+            status_code=422, detail={'status': 'error', 'msg': f'missing {e}'}
+        )
+    results = await run_in_threadpool(api.create_jobs, type, requested)
+    response_cache.invalidate(type)
+    return results
+
+
+@bp.patch('/app/{type}')
+async def patch_many(type: str, instances: dict[str, dict]):
+    """set meta labels of many instances of a type at once
+
+    The body maps instance names to the labels to set, labels set to
+    null are removed, e.g. {"a": {"user": "alice", "group": null}}
+    """
+    results = await run_in_threadpool(api.patch_jobs, type, instances)
+    response_cache.invalidate(type)
+    for result in results:
+        if result['status'] == 'patched':
+            activity.touch(type, result['name'])
+    return results
+
+
+@bp.get('/export')
+async def export(type: str | None = None):
+    """stream all instances as newline delimited JSON
+
+    One row per instance with its type, name, ip address, phase, start time
+    and meta labels, read from the backend page by page while streaming.
+    An error while streaming ends the export with an error row.
+    """
+    if type is not None and type not in api.list_templates():
+        raise HTTPException(
+            status_code=404,
+            detail={'status': 'error', 'msg': f'unknown app type {type}'},
+        )
+
+    def rows():
+        try:
+            for row in api.export_instances(type):
+                yield json.dumps(row) + '\n'
+        except Exception as e:
+            logger.warning(e)
+            yield json.dumps({'status': 'error', 'msg': str(e)}) + '\n'
+
+    return StreamingResponse(rows(), media_type='application/x-ndjson')
+
+
+@bp.get('/images')
+async def images():
+    """get the pull status of the pre-pulled template images per node"""
+    return await run_in_threadpool(api.pre_pull_status)
 
 
 @bp.get('/api/{type}', deprecated=True)
-def getAll_(type: str):
-    return api.get_jobs(type)
+async def getAll_(type: str, req: Request):
+    version = api.listing.snapshot(type)[0]
+
+    async def build():
+        return await run_in_threadpool(api.get_jobs, type), {}
+
+    return await cached(req, type, build, (api.listing.epoch, version))
 
 
 @bp.get('/app/{type}/{name}')
-def get(type, name, req: Request, response: Response):
+async def get(type, name, req: Request, response: Response):
+    if reaper.pending(type, name):
+        response.status_code = 202
+        return {'status': 'deleting'}
     try:
-        job = api.get_job(type, name, template_variables=dict(req.query_params))
-        success, instance = job.get_ip()
+        success, instance, meta_labels = await provision(
+            type, name, dict(req.query_params), preferred_wait(req)
+        )
+        # touched once the type and instance are known to exist
+        activity.touch(type, name)
         if not success:
             response.status_code = 202
+            response.headers['Retry-After'] = str(api.retry_after(type, name))
+            position = api.admission.position(type, name)
+            if position is not None:
+                return {'status': 'queued', 'position': position}
             return {'status': instance}
 
-        meta_labels = job.get_meta_labels()
         logger.info('{"hostname": "%s"}', instance)
         return {'ip': instance} | meta_labels
     except Exception as e:
@@ -52,66 +324,155 @@ def get(type, name, req: Request, response: Response):
         return {'status': 'error', 'msg': str(e)}
 
 
+@bp.get('/app/{type}/{name}/events')
+async def events(type, name, req: Request):
+    """stream the provisioning phases of an instance as server-sent events
+
+    Creates the instance if it does not exist yet and sends an event for each
+    phase change until the instance is ready or errored. Ends with an error
+    event if its queued creation failed and a deleted event if it is deleted.
+    """
+    try:
+        job = await run_in_threadpool(
+            api.get_job, type, name, template_variables=dict(req.query_params)
+        )
+    except Exception as e:
+        logger.warning(e)
+        raise HTTPException(status_code=404, detail={'status': 'error', 'msg': str(e)})
+    activity.touch(type, name)
+
+    async def stream():
+        deadline = time.monotonic() + Config.READY_TIMEOUT
+        phase = None
+        sent = time.monotonic()
+        while True:
+            queued = api.admission.pending(type, name)
+            if queued:
+                current = ('pending', 'queued')
+            else:
+                error = api.admission.failure(type, name)
+                if error is not None:
+                    yield f'event: error\ndata: {json.dumps({"msg": str(error)})}\n\n'
+                    return
+                current = job.phase()
+            if current[0] == 'deleted':
+                yield 'event: deleted\ndata: {}\n\n'
+                return
+            if current != phase:
+                phase = current
+                data = {'phase': phase[0]}
+                if phase[0] == 'ready':
+                    data |= {'ip': phase[1]} | job.get_meta_labels()
+                elif phase[1] is not None:
+                    data['detail'] = phase[1]
+                yield f'event: phase\ndata: {json.dumps(data)}\n\n'
+                sent = time.monotonic()
+                if phase[0] in ('ready', 'error'):
+                    return
+            elif time.monotonic() - sent >= 15:
+                yield ': keep-alive\n\n'
+                sent = time.monotonic()
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield 'event: timeout\ndata: {}\n\n'
+                return
+            if queued:
+                # a failed creation does not change the pods, look again soon
+                await asyncio.sleep(min(remaining, 0.1))
+            else:
+                await job.wait_phase(phase, min(remaining, 15))
+
+    return StreamingResponse(
+        stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'}
+    )
+
+
+@bp.post('/app/{type}/{name}/heartbeat', status_code=204)
+async def heartbeat(type, name):
+    """mark an instance as in use, so it is not reclaimed as idle"""
+    job = await run_in_threadpool(api.get_job, type, name, create=False)
+    if not job.exists:
+        raise HTTPException(status_code=404, detail={'status': 'No job found'})
+    activity.touch(type, name)
+
+
 @bp.patch('/app/{type}/{name}')
-def patch(type, name, data: dict):
+async def patch(type, name, data: dict):
     try:
-        job = api.get_job(type, name, create=False)
+        job = await run_in_threadpool(api.get_job, type, name, create=False)
         if not job.exists:
             raise Exception('Job does ' + type + '/' + name + ' not exist')
-        job.add_labels(data)
+        activity.touch(type, name)
+        await run_in_threadpool(job.add_labels, data)
+        response_cache.invalidate(type)
         return {'status': 'Success'}
     except Exception as e:
         logger.warning(e)
         raise HTTPException(status_code=404, detail={'status': 'error', 'msg': str(e)})
 
 
-@bp.delete('/app/{type}/{name}')
-def delete(type, name):
-    resp = api.delete_job(type, name)
-    if resp:
+def delete_instance(type, name, job=None, reason='requested'):
+    """queue the deletion of an instance with the reaper
+
+    :param job: The already looked up job of the instance, if any.
+    :param reason: Why the instance is deleted, e.g. requested or idle.
+
+    :return bool
+            Whether the instance exists.
+    """
+    if job is None:
+        job = api.get_job(type, name, create=False)
+    if not job.exists:
+        return False
+    reaper.enqueue(
+        type, name, functools.partial(api.delete_job, type, name, job), reason
+    )
+    response_cache.invalidate(type)
+    return True
+
+
+@bp.delete('/app/{type}/{name}', status_code=202)
+async def delete(type, name):
+    """delete an instance
+
+    Answers as soon as the deletion is queued, it is carried out
+    in the background.
+    """
+    if await run_in_threadpool(delete_instance, type, name):
         return {'status': 'Success'}
 
     raise HTTPException(status_code=404, detail={'status': 'No job found'})
 
 
 @bp.get('/create/{name}', deprecated=True)
-def create_old(name, sessionID: str, req: Request, response: Response):
-    start_time = time.time()
-
-    def get_app():
-        try:
-            job = api.get_job(name, sessionID, template_variables=dict(req.query_params))
-            success, instance = job.get_ip()
-            if not success:
-                return instance, 202
-
-            logger.info('{"hostname": "%s"}', instance)
-            return instance, 200
-        except Exception as e:
-            logger.warning(e)
-            return str(e), 404
+async def create_old(name, sessionID: str, req: Request, response: Response):
+    try:
+        success, instance, _ = await provision(
+            name, sessionID, dict(req.query_params), Config.READY_TIMEOUT, queued=True
+        )
+    except Exception as e:
+        logger.warning(e)
+        response.status_code = 404
+        return {'status': 'error', 'msg': str(e)}
 
-    while True:
+    if not success:
         # if it takes too long, delete the pod it tried to provision and return
-        if time.time() - start_time > 300:
-            delete(name, sessionID)
-            response.status_code = 408
-            return {'status': 'Could not provision app'}
+        api.admission.cancel(name, sessionID)
+        await run_in_threadpool(delete_instance, name, sessionID)
+        response.status_code = 408
+        return {'status': 'Could not provision app'}
 
-        reply = get_app()
-        if reply[1] != 202:
-            break
-
-    ip = reply[0]
-    return {'hostname': ip, 'addr': ip}
+    logger.info('{"hostname": "%s"}', instance)
+    return {'hostname': instance, 'addr': instance}
 
 
 @bp.get('/release/{name}', deprecated=True)
-def release(name):
-    for template in api.list_templates():
-        for job in api.get_jobs(template):
-            if job['name'] == name or job['sessionID'] == name:
-                delete(template, job['name'])
-                return {'status': 'Success'}
+async def release(name):
+    job = await run_in_threadpool(api.find_job, name)
+    if job is not None and await run_in_threadpool(
+        delete_instance, job.app_type, name, job
+    ):
+        return {'status': 'Success'}
 
     raise HTTPException(status_code=404, detail={'status': 'Not found'})
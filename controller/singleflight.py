@@ -0,0 +1,48 @@
+"""
+coalesces concurrent calls for the same key into one execution
+"""
+
+import asyncio
+
+
+class SingleFlight:
+    """share one in-flight call per key
+
+    The first caller of a key starts the call, every caller arriving
+    while it is still running awaits the same result or exception.
+    Once it finished, the next caller starts a new call.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    @property
+    def in_flight(self):
+        """number of keys with a running call"""
+        return len(self._calls)
+
+    async def do(self, key, func, *args, **kwargs):
+        """run the coroutine function once for all concurrent callers of a key
+
+        The call is shielded, so a caller being cancelled
+        (e.g. by a client disconnect) does not abort the other callers.
+
+        :param key: Hashable key identifying the call.
+        :param func: Coroutine function to call.
+
+        :return
+                The result of the shared call.
+        """
+        # futures can only be awaited on the loop they belong to
+        key = (asyncio.get_running_loop(), key)
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = future
+
+            def forget(done):
+                if self._calls.get(key) is done:
+                    del self._calls[key]
+
+            future.add_done_callback(forget)
+        return await asyncio.shield(future)
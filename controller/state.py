@@ -0,0 +1,132 @@
+"""
+per-instance state shared by the workers of the controller
+"""
+
+import json
+import sqlite3
+import threading
+
+
+class MemoryStore:
+    """thread-safe state of a single process
+
+    Values are dicts of fields kept per namespace and key,
+    e.g. the meta labels per container name.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._data = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            return dict(self._data.get((namespace, key), {}))
+
+    def items(self, namespace):
+        """get the values of all keys of a namespace"""
+        with self._lock:
+            return {k: dict(v) for (n, k), v in self._data.items() if n == namespace}
+
+    def update(self, namespace, key, values):
+        """set fields of a key, fields set to None are removed"""
+        with self._lock:
+            current = self._data.setdefault((namespace, key), {})
+            for field, value in values.items():
+                if value is None:
+                    current.pop(field, None)
+                else:
+                    current[field] = value
+            self._version += 1
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+            self._version += 1
+
+    def version(self):
+        """get a number that changes whenever the state changed"""
+        return self._version
+
+
+class SqliteStore:
+    """state in a sqlite database shared by the workers of one host
+
+    Every thread uses its own connection. The database is in WAL mode,
+    so reads do not block the writes of other workers.
+    """
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS state (namespace TEXT, key TEXT,'
+                ' field TEXT, value TEXT, PRIMARY KEY (namespace, key, field))'
+            )
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+        return db
+
+    def get(self, namespace, key):
+        rows = self._connection().execute(
+            'SELECT field, value FROM state WHERE namespace = ? AND key = ?',
+            (namespace, key),
+        )
+        return {field: json.loads(value) for field, value in rows}
+
+    def items(self, namespace):
+        rows = self._connection().execute(
+            'SELECT key, field, value FROM state WHERE namespace = ?', (namespace,)
+        )
+        items = {}
+        for key, field, value in rows:
+            items.setdefault(key, {})[field] = json.loads(value)
+        return items
+
+    def update(self, namespace, key, values):
+        with self._connection() as db:
+            for field, value in values.items():
+                if value is None:
+                    db.execute(
+                        'DELETE FROM state'
+                        ' WHERE namespace = ? AND key = ? AND field = ?',
+                        (namespace, key, field),
+                    )
+                else:
+                    db.execute(
+                        'INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)',
+                        (namespace, key, field, json.dumps(value)),
+                    )
+
+    def delete(self, namespace, key):
+        with self._connection() as db:
+            db.execute(
+                'DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key)
+            )
+
+    def version(self):
+        """get a number that changes whenever another connection changed the state"""
+        return self._connection().execute('PRAGMA data_version').fetchone()[0]
+
+
+def open_store(url):
+    """open the state store configured with STATE_STORE
+
+    :param url: memory for a store of this process or
+                sqlite:///<path> for a database shared by the workers.
+    """
+    if url == 'memory':
+        return MemoryStore()
+    if url.startswith('sqlite://'):
+        return SqliteStore(url.removeprefix('sqlite://'))
+    raise ValueError('unknown state store ' + url)
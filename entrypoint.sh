@@ -1,7 +1,18 @@
 #!/usr/bin/env sh
 
+WORKERS=${WORKERS:-1}
+if [ "${WORKERS}" -gt 1 ]; then
+  # the workers share their state and elect one to run the background loops
+  export LEADER_ELECTION=${LEADER_ELECTION:-true}
+  export STATE_STORE=${STATE_STORE:-sqlite:///tmp/config-controller.db}
+  # any worker may serve /metrics, so they write them to shared files
+  export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+  mkdir -p "${PROMETHEUS_MULTIPROC_DIR}"
+  rm -f "${PROMETHEUS_MULTIPROC_DIR}"/*.db
+fi
+
 if [ -z ${OTEL_SERVICE_NAME} ]; then
-  uvicorn controller:app --port ${SERVICE_PORT} --host 0.0.0.0 --log-config log_conf.yaml
+  uvicorn controller:app --port ${SERVICE_PORT} --host 0.0.0.0 --workers ${WORKERS} --log-config log_conf.yaml
 else
-  opentelemetry-instrument fastapi run --port ${SERVICE_PORT} controller --log-config log_conf.yaml
+  opentelemetry-instrument fastapi run --port ${SERVICE_PORT} --workers ${WORKERS} controller --log-config log_conf.yaml
 fi
@@ -0,0 +1,32 @@
+"""
+points the controller at a fake apiserver before it is imported
+"""
+
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.fake_apiserver import FakeApiServer
+from benchmarks.run import app_type, job_template, kubeconfig
+
+apiserver = FakeApiServer(schedule_delay=0.01, ready_delay=0.05)
+apiserver.add_config_map(
+    'templates',
+    {app_type + '.yaml': job_template},
+    labels={'config-controller.semafor.ch/template': 'true'},
+)
+apiserver.start()
+
+workdir = tempfile.mkdtemp(prefix='config-controller-')
+with open(os.path.join(workdir, 'kubeconfig'), 'w') as f:
+    f.write(kubeconfig % apiserver.url)
+os.environ.pop('KUBERNETES_SERVICE_HOST', None)
+os.environ['KUBECONFIG'] = os.path.join(workdir, 'kubeconfig')
+os.environ['BACKEND'] = 'kubernetes'
+os.environ['JOB_NAMESPACE'] = 'default'
+
+
+@pytest.fixture
+def fake_apiserver():
+    return apiserver
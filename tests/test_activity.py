@@ -0,0 +1,87 @@
+import time
+
+from config import Config
+from controller import metrics
+from controller.activity import ActivityTracker, IdleReclaimer
+from controller.listing import InstanceListing
+
+
+class Api:
+    def __init__(self, ttls):
+        self.ttls = ttls
+        self.listing = InstanceListing()
+
+    def list_templates(self):
+        return sorted(self.ttls)
+
+    def idle_ttl(self, app_type):
+        return self.ttls[app_type]
+
+
+def test_ages():
+    tracker = ActivityTracker()
+    tracker.touch('a', '1', now=100)
+    tracker.touch('a', '2', now=100)
+
+    assert tracker.ages('a', ['1', '3'], now=150) == {'1': 50, '3': 0}
+    # instances that are gone are forgotten
+    assert tracker.last_access('a', '2') is None
+    assert tracker.last_access('a', '3') == 150
+
+
+def test_reclaims_idle_instances(monkeypatch):
+    monkeypatch.setattr(Config, 'ACTIVITY_WINDOW', 30)
+    api = Api({'a': 60, 'b': 0})
+    for app_type, name in (('a', '1'), ('a', '2'), ('a', '3'), ('b', '1')):
+        api.listing.put(app_type, name, {'name': name})
+    tracker = ActivityTracker()
+    for app_type, name, last in (('a', '1', 0), ('a', '2', 80), ('a', '3', 95)):
+        tracker.touch(app_type, name, now=last)
+    tracker.touch('b', '1', now=1)
+    reclaimed = []
+    reclaimer = IdleReclaimer(tracker, api, lambda *key: reclaimed.append(key))
+
+    assert reclaimer.sweep(now=100) == [('a', '1')]
+    assert reclaimed == [('a', '1')]
+    # templates without idle TTL are kept
+    assert metrics.idle_instances.labels('b')._value.get() == 1
+    assert metrics.active_instances.labels('a')._value.get() == 2
+    assert metrics.idle_instances.labels('a')._value.get() == 1
+
+
+def test_shares_accesses(monkeypatch):
+    monkeypatch.setattr(Config, 'LEADER_ELECTION', True)
+    api = Api({'a': 60})
+    api.listing.put('a', '1', {'name': '1'})
+    api.recorded = {}
+    api.record_access = lambda app_type, accesses: api.recorded.update(accesses)
+    # accessed through another worker
+    api.last_access = lambda app_type: {'1': 90}
+    tracker = ActivityTracker()
+    tracker.touch('a', '1', now=0)
+    reclaimer = IdleReclaimer(tracker, api, None)
+
+    reclaimer.share()
+    assert api.recorded == {'1': 0}
+    assert tracker.flush() == {}
+    assert reclaimer.sweep(now=100) == []
+
+
+def test_share_forgets_outdated_accesses(monkeypatch):
+    monkeypatch.setattr(Config, 'ACTIVITY_WINDOW', 30)
+
+    class Follower:
+        is_leader = False
+
+    api = Api({'a': 60, 'b': 0})
+    tracker = ActivityTracker()
+    now = time.time()
+    tracker.touch('a', 'recent', now=now - 50)
+    tracker.touch('a', 'old', now=now - 100)
+    tracker.touch('unknown', '1', now=now)
+    reclaimer = IdleReclaimer(tracker, api, None, Follower())
+
+    reclaimer.share()
+    assert tracker.last_access('a', 'recent') == now - 50
+    assert tracker.last_access('a', 'old') is None
+    assert tracker.last_access('unknown', '1') is None
@@ -0,0 +1,88 @@
+import pytest
+
+from config import Config
+from controller import metrics
+from controller.admission import Admission
+
+
+def test_token_bucket(monkeypatch):
+    monkeypatch.setattr(Config, 'ADMISSION_RATE', 0.001)
+    monkeypatch.setattr(Config, 'ADMISSION_BURST', 2)
+    monkeypatch.setattr(metrics, 'templates', {'a'})
+    admission = Admission(lambda app_type: 0, lambda app_type: 0)
+    admission._start = lambda: None
+    created = []
+
+    for name in ('1', '2', '3', '4'):
+        position = admission.submit('a', name, lambda n=name: created.append(n))
+    assert created == ['1', '2']
+    assert position == 2
+    assert admission.position('a', '3') == 1
+    assert admission.submit('a', '3', None) == 1
+    assert metrics.admission_queue.labels('a')._value.get() == 2
+
+    assert admission.run_once() is None
+    admission._tokens = 1
+    admission.run_once().result()
+    assert created == ['1', '2', '3']
+    assert admission.position('a', '4') == 1
+
+
+def test_rate_split_between_processes(monkeypatch):
+    monkeypatch.setattr(Config, 'ADMISSION_RATE', 6)
+    monkeypatch.setattr(Config, 'ADMISSION_BURST', 8)
+    monkeypatch.setattr(Config, 'WORKERS', 2)
+    monkeypatch.setattr(Config, 'REPLICAS', 2)
+    monkeypatch.setattr(metrics, 'templates', {'a'})
+    admission = Admission(lambda app_type: 0, lambda app_type: 0)
+    admission._start = lambda: None
+    created = []
+
+    for name in ('1', '2', '3'):
+        admission.submit('a', name, lambda n=name: created.append(n))
+    assert created == ['1', '2']
+    assert admission.wait_estimate(1) == pytest.approx(1 / 1.5, rel=0.1)
+
+
+def test_max_starting(monkeypatch):
+    monkeypatch.setattr(Config, 'ADMISSION_RATE', 0)
+    starting = {'a': 1, 'b': 0}
+    admission = Admission({'a': 1, 'b': 1}.get, starting.get)
+    admission._start = lambda: None
+    created = []
+
+    assert admission.submit('a', '1', lambda: created.append('a1')) == 1
+    assert admission.submit('b', '1', lambda: starting.update(b=1)) == 0
+    # a template at its limit does not block the others
+    assert admission.submit('b', '2', lambda: created.append('b2')) == 2
+    starting['b'] = 0
+    admission.run_once().result()
+    assert created == ['b2']
+
+    starting['a'] = 0
+    admission.run_once().result()
+    assert created == ['b2', 'a1']
+    assert admission.run_once() is None
+
+
+def test_queued_failure_and_cancel(monkeypatch):
+    monkeypatch.setattr(Config, 'ADMISSION_RATE', 0)
+    admission = Admission({'a': 1}.get, {'a': 1}.get)
+    admission._start = lambda: None
+
+    def failing():
+        raise RuntimeError('invalid template')
+
+    assert admission.submit('a', '1', failing) == 1
+    assert admission.submit('a', '2', None) == 2
+    assert admission.cancel('a', '2')
+    assert not admission.cancel('a', '2')
+    assert admission.position('a', '2') is None
+
+    admission.max_starting = lambda app_type: 0
+    admission.run_once().result()
+    assert not admission.pending('a', '1')
+    # the next submit gets the error like a creation run right away
+    with pytest.raises(RuntimeError, match='invalid template'):
+        admission.submit('a', '1', failing)
+    assert admission.failure('a', '1') is None
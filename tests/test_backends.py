@@ -0,0 +1,34 @@
+import pytest
+
+from config import Config
+from controller import backends
+
+loads = []
+
+
+def load_config():
+    loads.append(True)
+
+
+class FakeApi:
+    name = 'fake'
+
+
+def test_lazy_load(monkeypatch):
+    monkeypatch.setattr(backends, '_api', None)
+    monkeypatch.setattr(Config, 'BACKEND', 'fake')
+    monkeypatch.setitem(backends.registry, 'fake', (__name__, 'FakeApi'))
+    api = backends.LazyApi()
+
+    assert not backends.loaded()
+    assert api.name == 'fake'
+    assert api.name == 'fake'
+    assert backends.loaded()
+    assert loads == [True]
+
+
+def test_unknown_backend(monkeypatch):
+    monkeypatch.setattr(backends, '_api', None)
+    monkeypatch.setattr(Config, 'BACKEND', 'unknown')
+    with pytest.raises(ValueError):
+        backends.load()
@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from controller.coalesce import PatchCoalescer
+
+
+def test_concurrent_patches_are_merged():
+    sent = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def send(key, changes):
+        sent.append((key, dict(changes)))
+        started.set()
+        release.wait(5)
+
+    coalescer = PatchCoalescer(send)
+    first = threading.Thread(target=coalescer.patch, args=(('a', '1'), {'x': '1'}))
+    first.start()
+    started.wait(5)
+
+    # arrive while the first patch is sent and end up in one batch
+    waiting = [
+        threading.Thread(target=coalescer.patch, args=(('a', '1'), changes))
+        for changes in ({'x': '2', 'y': '1'}, {'y': None})
+    ]
+    for thread in waiting:
+        thread.start()
+    while len(coalescer._pending[('a', '1')].changes) < 2:
+        pass
+    release.set()
+    for thread in [first, *waiting]:
+        thread.join(5)
+
+    assert sent[0] == (('a', '1'), {'x': '1'})
+    assert sent[1][1]['x'] == '2'
+    assert len(sent) == 2
+    assert not coalescer._running and not coalescer._pending
+
+
+def test_errors_are_raised():
+    def send(*_):
+        raise RuntimeError('conflict')
+
+    coalescer = PatchCoalescer(send)
+    with pytest.raises(RuntimeError):
+        coalescer.patch(('a', '1'), {'x': '1'})
+    assert not coalescer._running
@@ -0,0 +1,99 @@
+from controller import docker_api
+from controller.docker_api import ContainerRegistry
+
+
+def inspect(container_id, app_type, name, running=True, finished=None):
+    return {
+        'Id': container_id,
+        'Name': '/' + app_type + '-' + name,
+        'Config': {
+            'Labels': {docker_api.type_label: app_type, docker_api.name_label: name}
+        },
+        'NetworkSettings': {'Networks': {'net': {'IPAddress': '10.0.0.' + name}}},
+        'State': {
+            'Status': 'running' if running else 'exited',
+            'StartedAt': '2024-01-01T10:00:00.123Z',
+            'FinishedAt': finished or '0001-01-01T00:00:00Z',
+            'Running': running,
+        },
+    }
+
+
+def test_registry_index(monkeypatch):
+    monkeypatch.setattr(docker_api, 'docker_network', 'net', raising=False)
+    registry = ContainerRegistry()
+    registry.update(inspect('b', 'a', '2'))
+    registry.update(inspect('a', 'a', '1'))
+    registry.update(inspect('c', 'other', '1', running=False))
+
+    assert [e['name'] for e in registry.by_type('a')] == ['1', '2']
+    assert registry.get('a-1')['ip'] == '10.0.0.1'
+    assert registry.get('other-1')['running'] is False
+    assert [e['type'] for e in registry.by_instance('1')] == ['a', 'other']
+
+    snapshot = registry.by_type('a')
+    registry.remove('a')
+    assert registry.get('a-1') is None
+    assert len(registry.by_type('a')) == 1
+    # readers keep a consistent snapshot
+    assert len(snapshot) == 2
+
+
+def test_get_jobs_skips_stopped(monkeypatch):
+    monkeypatch.setattr(docker_api, 'docker_network', 'net', raising=False)
+    registry = ContainerRegistry()
+    registry.update(inspect('a', 'a', '1'))
+    registry.update(inspect('b', 'a', '2', running=False))
+    monkeypatch.setattr(docker_api, 'registry', registry, raising=False)
+
+    jobs = docker_api.DockerApi().get_jobs('a')
+    assert [j['name'] for j in jobs] == ['1']
+    assert jobs[0]['ip'] == '10.0.0.1'
+
+
+def test_export_instances(monkeypatch):
+    monkeypatch.setattr(docker_api, 'docker_network', 'net', raising=False)
+    registry = ContainerRegistry()
+    registry.update(inspect('a', 'a', '1'))
+    registry.update(inspect('b', 'a', '2', running=False))
+    registry.update(inspect('c', 'other', '3'))
+    monkeypatch.setattr(docker_api, 'registry', registry, raising=False)
+    docker_api.state.update('meta-labels', 'a-1', {'user': 'alice'})
+
+    api = docker_api.DockerApi()
+    rows = list(api.export_instances('a'))
+    assert [(r['name'], r['phase'], r['labels']) for r in rows] == [
+        ('1', 'ready', {'user': 'alice'}),
+        ('2', 'finished', {}),
+    ]
+    assert len(list(api.export_instances())) == 3
+    docker_api.state.delete('meta-labels', 'a-1')
+
+
+def test_template_catalogue(tmp_path):
+    catalogue = docker_api.TemplateCatalogue(str(tmp_path))
+    catalogue.refresh()
+    assert catalogue.list_templates() == []
+
+    (tmp_path / 'b.properties').write_text('image = b\n')
+    (tmp_path / 'a.properties').write_text('image = a\n')
+    (tmp_path / 'notes.txt').write_text('')
+    catalogue.refresh()
+    assert catalogue.list_templates() == ['a', 'b']
+    assert catalogue.template_info()[0]['source'] == str(tmp_path / 'a.properties')
+
+    (tmp_path / 'a.properties').unlink()
+    catalogue.refresh()
+    assert catalogue.list_templates() == ['b']
+
+
+def test_collect_finished(monkeypatch):
+    monkeypatch.setattr(docker_api, 'docker_network', 'net', raising=False)
+    registry = ContainerRegistry()
+    registry.update(inspect('a', 'a', '1'))
+    registry.update(inspect('b', 'a', '2', False, '2024-01-01T11:00:00.5Z'))
+    registry.update(inspect('c', 'a', '3', False, '2999-01-01T11:00:00.5Z'))
+    monkeypatch.setattr(docker_api, 'registry', registry, raising=False)
+
+    finished = docker_api.DockerApi().collect_finished()
+    assert [(t, n) for t, n, _ in finished] == [('a', '2')]
@@ -0,0 +1,949 @@
+import datetime
+
+import pytest
+from kubernetes import client
+
+from config import Config
+from controller import kubernetes_api
+from controller.kubernetes_api import (
+    Informer,
+    instance_indexers,
+    name_label,
+    type_label,
+)
+from controller.listing import InstanceListing
+from controller.lru import LruCache
+from controller.readiness import StartupEstimates
+
+
+def make_pod(name, app_type, instance, ready=False, ip=None, **labels):
+    statuses = None
+    if ready is not None:
+        statuses = [
+            client.V1ContainerStatus(
+                name='app',
+                image='app',
+                image_id='',
+                ready=ready,
+                restart_count=0,
+            )
+        ]
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(
+            name=name,
+            resource_version='1',
+            labels={
+                'job-name': app_type + '-' + instance,
+                type_label: app_type,
+                name_label: instance,
+            }
+            | labels,
+        ),
+        status=client.V1PodStatus(container_statuses=statuses, pod_ip=ip),
+    )
+
+
+def list_namespaced_pod():
+    pass
+
+
+def test_informer_index():
+    informer = Informer(list_namespaced_pod, indexers=instance_indexers)
+    informer._replace([make_pod('a-1-x', 'a', '1'), make_pod('b-1-x', 'b', '1')], '1')
+
+    assert informer.has_synced
+    assert [p.metadata.name for p in informer.by_index('instance-type', 'a')] == [
+        'a-1-x'
+    ]
+    assert len(informer.by_index('instance-name', '1')) == 2
+    assert informer.by_index('instance', 'b/1')[0].metadata.name == 'b-1-x'
+
+    informer._apply('DELETED', make_pod('a-1-x', 'a', '1'))
+    assert informer.by_index('job-name', 'a-1') == []
+    assert informer.get('a-1-x') is None
+
+
+def test_informer_relist_emits_deletes():
+    events = []
+    informer = Informer(list_namespaced_pod, indexers=instance_indexers)
+    informer.add_handler(lambda event, obj: events.append((event, obj.metadata.name)))
+    informer._replace([make_pod('a-1-x', 'a', '1')], '1')
+    informer._replace([make_pod('a-2-x', 'a', '2')], '2')
+
+    assert ('DELETED', 'a-1-x') in events
+    assert ('ADDED', 'a-2-x') in events
+    assert informer.resource_version == '2'
+
+
+def test_instance_status():
+    assert kubernetes_api._instance_status([]) == (False, 'node_not_ready')
+    assert kubernetes_api._instance_status([make_pod('p', 'a', '1')]) == (
+        False,
+        'pulling_image',
+    )
+    assert kubernetes_api._instance_status(
+        [make_pod('p', 'a', '1', ready=True, ip='10.0.0.1')]
+    ) == (True, '10.0.0.1')
+
+
+def test_get_ip_waits_for_informer(monkeypatch):
+    informer = Informer(list_namespaced_pod, indexers=instance_indexers)
+    informer._replace([make_pod('a-1-x', 'a', '1', ready=True, ip='10.0.0.1')], '1')
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', informer, raising=False)
+    monkeypatch.setattr(kubernetes_api, 'job_informer', informer, raising=False)
+
+    job = kubernetes_api.IntensJob('a', '1', create=False)
+    assert job.exists
+    assert job.get_ip(timeout=0) == (True, '10.0.0.1')
+
+
+def list_namespaced_config_map():
+    pass
+
+
+def make_config_map(name, resource_version, data):
+    return client.V1ConfigMap(
+        metadata=client.V1ObjectMeta(name=name, resource_version=resource_version),
+        data=data,
+    )
+
+
+def test_template_registry_invalidation():
+    informer = Informer(list_namespaced_config_map)
+    registry = kubernetes_api.TemplateRegistry(informer)
+    informer._replace([make_config_map('maps', '1', {'a.yaml': 'v: ${1}'})], '1')
+
+    assert registry.list_templates() == ['a']
+    template = registry.get('a')
+    assert registry.get('a') is template
+
+    informer._apply('MODIFIED', make_config_map('maps', '2', {'a.yaml': 'v: ${2}'}))
+    assert registry.get('a') is not template
+    assert registry.get('a').render() == 'v: 2'
+    assert len(registry._compiled) == 1
+
+    informer._apply('DELETED', make_config_map('maps', '2', {}))
+    assert registry._compiled == {}
+
+
+def test_wait_ip_is_woken_by_informer(monkeypatch):
+    import asyncio
+
+    informer = Informer(list_namespaced_pod, indexers=instance_indexers)
+    informer._replace([make_pod('a-1-x', 'a', '1', ready=None)], '1')
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', informer, raising=False)
+    monkeypatch.setattr(kubernetes_api, 'job_informer', informer, raising=False)
+
+    async def scenario():
+        job = kubernetes_api.IntensJob('a', '1', create=False)
+        waiting = asyncio.create_task(job.wait_ip(timeout=5))
+        await asyncio.sleep(0.05)
+        ready = make_pod('a-1-x', 'a', '1', ready=True, ip='10.0.0.1')
+        await asyncio.to_thread(informer._apply, 'MODIFIED', ready)
+        return await waiting
+
+    assert asyncio.run(scenario()) == (True, '10.0.0.1')
+    assert informer._waiters == {}
+
+
+def test_wait_ip_returns_when_job_is_deleted(monkeypatch):
+    import asyncio
+
+    job_object = client.V1Job(
+        metadata=client.V1ObjectMeta(
+            name='a-1', labels={type_label: 'a', name_label: '1'}
+        )
+    )
+    pods = Informer(list_namespaced_pod, indexers=instance_indexers)
+    pods._replace([], '1')
+    jobs = Informer(list_namespaced_pod, indexers=instance_indexers)
+    jobs.add_handler(kubernetes_api.track_deleted_jobs)
+    jobs._replace([job_object], '1')
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', pods, raising=False)
+    monkeypatch.setattr(kubernetes_api, 'job_informer', jobs, raising=False)
+
+    async def scenario():
+        job = kubernetes_api.IntensJob('a', '1', create=False)
+        waiting = asyncio.create_task(job.wait_ip(timeout=5))
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(jobs._apply, 'DELETED', job_object)
+        return await asyncio.wait_for(waiting, 1)
+
+    # the pods of a job deleted meanwhile are not waited for
+    assert asyncio.run(scenario()) == (False, 'node_not_ready')
+
+
+class FakeBatchApi:
+    def __init__(self):
+        self.created = []
+        self.deleted = []
+        self.patched = []
+
+    def create_namespaced_job(self, body, namespace):
+        self.created.append(body)
+
+    def delete_namespaced_job(self, name, namespace, body):
+        self.deleted.append(name)
+
+    def patch_namespaced_job(self, name, namespace, body):
+        self.patched.append((name, body))
+
+
+class FakeCoreApi:
+    def __init__(self, conflicts=()):
+        self.conflicts = set(conflicts)
+        self.patched = []
+
+    def patch_namespaced_pod(self, name, namespace, body):
+        if name in self.conflicts:
+            raise kubernetes_api.ApiException(status=409)
+        self.patched.append((name, body))
+
+
+def make_pool_pod(name, job_name, app_type, ready=True):
+    pod = make_pod(name, app_type, 'unused', ready=ready, ip='10.0.0.2')
+    del pod.metadata.labels[name_label]
+    pod.metadata.labels['job-name'] = job_name
+    pod.metadata.labels[kubernetes_api.pool_label] = app_type
+    return pod
+
+
+def test_warm_pool_claim_skips_conflicts(monkeypatch):
+    pods = Informer(list_namespaced_pod, indexers=instance_indexers)
+    pods._replace(
+        [
+            make_pool_pod('a-pool-1-x', 'a-pool-1', 'a'),
+            make_pool_pod('a-pool-2-x', 'a-pool-2', 'a'),
+            make_pool_pod('a-pool-3-x', 'a-pool-3', 'a', ready=False),
+        ],
+        '1',
+    )
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', pods, raising=False)
+
+    pool = kubernetes_api.WarmPool.__new__(kubernetes_api.WarmPool)
+    pool.v1 = FakeCoreApi(conflicts={'a-pool-1-x'})
+    pool.batch_v1 = FakeBatchApi()
+    pool._wakeup = kubernetes_api.threading.Event()
+
+    assert pool.claim('a', 'user') == 'a-pool-2'
+    name, body = pool.v1.patched[0]
+    assert name == 'a-pool-2-x'
+    assert body['metadata']['labels'] == {
+        name_label: 'user',
+        kubernetes_api.pool_label: None,
+    }
+    assert pool.claim('b', 'user') is None
+
+
+def test_warm_pool_refill(monkeypatch):
+    config_maps = Informer(list_namespaced_config_map)
+    config_map = make_config_map(
+        'maps', '1', {'a.yaml': 'metadata:\n  labels: {}\n', 'b.yaml': ''}
+    )
+    config_map.metadata.annotations = {
+        kubernetes_api.warm_pool_annotation: '0',
+        kubernetes_api.warm_pool_annotation + '.a': '2',
+    }
+    config_maps._replace([config_map], '1')
+    empty = Informer(list_namespaced_pod, indexers=instance_indexers)
+    empty._replace([], '1')
+    monkeypatch.setattr(kubernetes_api, 'config_map_informer', config_maps, False)
+    monkeypatch.setattr(
+        kubernetes_api,
+        'template_registry',
+        kubernetes_api.TemplateRegistry(config_maps),
+        raising=False,
+    )
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', empty, raising=False)
+    monkeypatch.setattr(kubernetes_api, 'job_informer', empty, raising=False)
+
+    pool = kubernetes_api.WarmPool.__new__(kubernetes_api.WarmPool)
+    pool.batch_v1 = FakeBatchApi()
+    pool._pending = {}
+
+    assert pool.sizes() == {'a': 2, 'b': 0}
+    pool.refill()
+    pool.refill()
+    assert len(pool.batch_v1.created) == 2
+    labels = pool.batch_v1.created[0].spec.template['metadata']['labels']
+    assert labels[kubernetes_api.pool_label] == 'a'
+    assert name_label not in labels
+
+
+def test_warm_pool_keeps_claimed_job(monkeypatch):
+    config_maps = Informer(list_namespaced_config_map)
+    config_maps._replace([make_config_map('maps', '1', {'a.yaml': ''})], '1')
+    job = client.V1Job(
+        metadata=client.V1ObjectMeta(
+            name='a-pool-1',
+            labels={type_label: 'a', kubernetes_api.pool_label: 'a'},
+        )
+    )
+    jobs = Informer(list_namespaced_pod, indexers=instance_indexers)
+    jobs._replace([job], '1')
+    # the pod was claimed but relabelling its job failed
+    pod = make_pod('a-pool-1-x', 'a', 'user', ready=True, ip='10.0.0.2')
+    pod.metadata.labels['job-name'] = 'a-pool-1'
+    pods = Informer(list_namespaced_pod, indexers=instance_indexers)
+    pods._replace([pod], '1')
+    monkeypatch.setattr(kubernetes_api, 'config_map_informer', config_maps, False)
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', pods, raising=False)
+    monkeypatch.setattr(kubernetes_api, 'job_informer', jobs, raising=False)
+
+    pool = kubernetes_api.WarmPool.__new__(kubernetes_api.WarmPool)
+    pool.batch_v1 = FakeBatchApi()
+    pool._pending = {}
+    pool.refill()
+
+    assert pool.batch_v1.deleted == []
+    assert pool.batch_v1.patched == [
+        (
+            'a-pool-1',
+            {
+                'metadata': {
+                    'labels': {name_label: 'user', kubernetes_api.pool_label: None}
+                }
+            },
+        )
+    ]
+
+
+class FakeClusterApi(FakeBatchApi, FakeCoreApi):
+    """core and batch api listing the given objects to the informers"""
+
+    def __init__(self, config_maps=()):
+        FakeBatchApi.__init__(self)
+        FakeCoreApi.__init__(self)
+        self.config_maps = list(config_maps)
+
+    def list_namespaced_pod(self):
+        pass
+
+    def list_namespaced_job(self):
+        pass
+
+    def list_namespaced_config_map(self):
+        pass
+
+
+def test_get_job_creates_instance(monkeypatch):
+    api = FakeClusterApi(
+        [make_config_map('maps', '1', {'a.yaml': 'metadata:\n  labels: {}\n'})]
+    )
+    listed = {'list_namespaced_config_map': api.config_maps}
+    monkeypatch.setattr(kubernetes_api, 'core_v1', api)
+    monkeypatch.setattr(kubernetes_api, 'batch_v1', api)
+    monkeypatch.setattr(
+        Informer,
+        'start',
+        lambda self: self._replace(listed.get(self.list_func.__name__, []), '1'),
+    )
+    monkeypatch.setattr(kubernetes_api.WarmPool, '_run', lambda self: None)
+    monkeypatch.setattr(kubernetes_api.ImagePrePuller, '_run', lambda self: None)
+    monkeypatch.setattr(kubernetes_api.metrics, 'templates', ())
+    for name in (
+        'pod_informer',
+        'job_informer',
+        'config_map_informer',
+        'endpoint_informer',
+        'template_registry',
+        'warm_pool',
+        'pre_puller',
+    ):
+        monkeypatch.setattr(kubernetes_api, name, None, raising=False)
+
+    job = kubernetes_api.KubernetesApi().get_job('a', 'new')
+    assert job.exists
+    assert [j.metadata.name for j in api.created] == ['a-new']
+    assert api.created[0].metadata.labels == {name_label: 'new', type_label: 'a'}
+
+
+def test_instance_phase():
+    pending = make_pod('p', 'a', '1', ready=None)
+    scheduled = make_pod('p', 'a', '1', ready=None)
+    scheduled.status.conditions = [
+        client.V1PodCondition(type='PodScheduled', status='True')
+    ]
+    pulling = make_pod('p', 'a', '1')
+    pulling.status.container_statuses[0].state = client.V1ContainerState(
+        waiting=client.V1ContainerStateWaiting(reason='ContainerCreating')
+    )
+    running = make_pod('p', 'a', '1')
+    ready = make_pod('p', 'a', '1', ready=True, ip='10.0.0.1')
+
+    assert kubernetes_api._instance_phase([]) == ('pending', None)
+    assert kubernetes_api._instance_phase([pending]) == ('pending', None)
+    assert kubernetes_api._instance_phase([scheduled])[0] == 'scheduled'
+    assert kubernetes_api._instance_phase([pulling]) == (
+        'pulling',
+        'ContainerCreating',
+    )
+    assert kubernetes_api._instance_phase([running]) == ('running', None)
+    assert kubernetes_api._instance_phase([ready]) == ('ready', '10.0.0.1')
+
+
+def test_create_jobs_renders_once_per_variable_set(monkeypatch):
+    config_maps = Informer(list_namespaced_config_map)
+    config_maps._replace(
+        [make_config_map('maps', '1', {'a.yaml': 'metadata:\n  labels: {}\n'})], '1'
+    )
+    registry = kubernetes_api.TemplateRegistry(config_maps)
+    existing = Informer(list_namespaced_pod, indexers=instance_indexers)
+    existing._replace([make_pod('a-3-x', 'a', '3')], '1')
+    monkeypatch.setattr(kubernetes_api, 'template_registry', registry, False)
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', existing, False)
+    monkeypatch.setattr(kubernetes_api, 'job_informer', existing, False)
+
+    renders = []
+    render = kubernetes_api.render_job_object
+    monkeypatch.setattr(
+        kubernetes_api,
+        'render_job_object',
+        lambda *args: renders.append(args) or render(*args),
+    )
+
+    deleted_jobs = LruCache(10, 10)
+    deleted_jobs.put('a-1', True, 1)
+    monkeypatch.setattr(kubernetes_api, 'deleted_jobs', deleted_jobs)
+
+    api = kubernetes_api.KubernetesApi.__new__(kubernetes_api.KubernetesApi)
+    api.batch_v1 = FakeBatchApi()
+    results = api.create_jobs(
+        'a',
+        [('1', {'v': '1'}), ('2', {'v': '1'}), ('3', {'v': '1'}), ('1', {'v': '2'})],
+    )
+
+    assert [r['status'] for r in results] == [
+        'created',
+        'created',
+        'exists',
+        'duplicate',
+    ]
+    # a recreated job is no longer taken for deleted
+    assert deleted_jobs.get('a-1') is False
+    assert len(renders) == 1
+    names = sorted(job.metadata.name for job in api.batch_v1.created)
+    assert names == ['a-1', 'a-2']
+    labels = api.batch_v1.created[0].spec.template['metadata']['labels']
+    assert labels[type_label] == 'a'
+
+
+class ExpiringCoreApi:
+    """lists pods in pages, expired maps continue tokens to their failures"""
+
+    def __init__(self, pods, expired):
+        self.pods = pods
+        self.expired = expired
+        self.lists = 0
+
+    def list_namespaced_pod(self, namespace, label_selector, limit, _continue):
+        self.lists += 1
+        if self.expired.get(_continue):
+            self.expired[_continue] -= 1
+            raise kubernetes_api.ApiException(status=410)
+        offset = int(_continue or 0)
+        token = str(offset + limit) if offset + limit < len(self.pods) else None
+        return client.V1PodList(
+            items=self.pods[offset : offset + limit],
+            metadata=client.V1ListMeta(_continue=token),
+        )
+
+
+def test_export_instances_restarts_expired_listing(monkeypatch):
+    config_maps = Informer(list_namespaced_config_map)
+    config_maps._replace(
+        [make_config_map('maps', '1', {'a.yaml': 'metadata:\n  labels: {}\n'})], '1'
+    )
+    registry = kubernetes_api.TemplateRegistry(config_maps)
+    monkeypatch.setattr(kubernetes_api, 'template_registry', registry, False)
+    monkeypatch.setattr(Config, 'EXPORT_PAGE_SIZE', 2)
+    pods = [make_pod(f'a-{i}-x', 'a', str(i)) for i in range(5)]
+    api = kubernetes_api.KubernetesApi.__new__(kubernetes_api.KubernetesApi)
+
+    api.v1 = ExpiringCoreApi(pods, {'4': 1})
+    assert [r['name'] for r in api.export_instances('a')] == ['0', '1', '2', '3', '4']
+    assert api.v1.lists == 6
+
+    # expired again before the restarted listing got further
+    api.v1 = ExpiringCoreApi(pods, {'2': 2})
+    with pytest.raises(RuntimeError):
+        list(api.export_instances('a'))
+
+    with pytest.raises(ValueError):
+        list(api.export_instances('a,x=y'))
+
+
+def test_update_listing(monkeypatch):
+    listing = InstanceListing()
+    monkeypatch.setattr(kubernetes_api, 'listing', listing)
+    pod = make_pod(
+        'a-1-x',
+        'a',
+        '1',
+        ready=True,
+        ip='10.0.0.1',
+        **{kubernetes_api.meta_label_prefix + 'user': 'x'},
+    )
+    pod.status.conditions = [client.V1PodCondition(type='Ready', status='True')]
+    pod.status.start_time = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+
+    kubernetes_api.update_listing('ADDED', pod)
+    version, items = listing.snapshot('a')
+    assert items[0][1]['ip'] == '10.0.0.1'
+    assert items[0][1]['user'] == 'x'
+    assert items[0][1]['errored'] is False
+
+    # pods without status are not listed yet
+    kubernetes_api.update_listing('ADDED', make_pod('a-2-x', 'a', '2', ready=None))
+    assert listing.count('a') == 1
+
+    kubernetes_api.update_listing('DELETED', pod)
+    assert listing.snapshot('a')[1] == []
+
+
+def test_template_catalogue():
+    informer = Informer(list_namespaced_config_map)
+    informer._replace(
+        [
+            make_config_map('a', '1', {'x.yaml': "${alternatives['user']}"}),
+            make_config_map('b', '2', {'x.yaml': '', 'y.yaml': ''}),
+        ],
+        '2',
+    )
+    registry = kubernetes_api.TemplateRegistry(informer)
+    assert registry.list_templates() == ['x', 'y']
+    assert registry.find('y').metadata.name == 'b'
+
+    text = "${alternatives.get('image', 'a')} ${alternatives[\"user\"]}"
+    informer._apply('MODIFIED', make_config_map('a', '3', {'x.yaml': text}))
+    info = registry.template_info()
+    assert info[0]['source'] == 'a'
+    assert info[0]['revision'] == '3'
+    assert info[0]['variables'] == ['image', 'user']
+
+    informer._apply('DELETED', make_config_map('a', '3', {}))
+    assert registry.find('x').metadata.name == 'b'
+
+
+def test_find_job(monkeypatch):
+    informer = Informer(list_namespaced_pod, indexers=instance_indexers)
+    informer._replace([make_pod('a-1-x', 'a', '1'), make_pod('b-2-x', 'b', '2')], '1')
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', informer, raising=False)
+    monkeypatch.setattr(kubernetes_api, 'job_informer', informer, raising=False)
+
+    api = kubernetes_api.KubernetesApi.__new__(kubernetes_api.KubernetesApi)
+    job = api.find_job('2')
+    assert (job.app_type, job.job_name) == ('b', 'b-2')
+    assert api.find_job('3') is None
+
+
+def test_collect_finished(monkeypatch):
+    now = datetime.datetime.now(datetime.UTC)
+
+    def make_job(name, labels, finished=None):
+        conditions = None
+        if finished is not None:
+            conditions = [
+                client.V1JobCondition(
+                    type='Complete', status='True', last_transition_time=finished
+                )
+            ]
+        return client.V1Job(
+            metadata=client.V1ObjectMeta(name=name, labels=labels),
+            status=client.V1JobStatus(conditions=conditions),
+        )
+
+    jobs = Informer(list_namespaced_pod)
+    jobs._replace(
+        [
+            make_job('a-1', {type_label: 'a', name_label: '1'}),
+            make_job('a-2', {type_label: 'a', name_label: '2'}, now),
+            make_job(
+                'a-3',
+                {type_label: 'a', name_label: '3'},
+                now - datetime.timedelta(hours=1),
+            ),
+            make_job('a-pool-1', {type_label: 'a'}, now - datetime.timedelta(hours=1)),
+        ],
+        '1',
+    )
+    monkeypatch.setattr(kubernetes_api, 'job_informer', jobs, raising=False)
+
+    api = kubernetes_api.KubernetesApi.__new__(kubernetes_api.KubernetesApi)
+    finished = api.collect_finished()
+    assert [(t, n) for t, n, _ in finished] == [('a', '3'), ('a', 'a-pool-1')]
+    assert finished[1][2].args == ('a', 'a-pool-1')
+
+
+def test_idle_ttl(monkeypatch):
+    config_map = make_config_map('a', '1', {'x.yaml': '', 'y.yaml': ''})
+    config_map.metadata.annotations = {
+        kubernetes_api.idle_ttl_annotation: '600',
+        kubernetes_api.idle_ttl_annotation + '.y': '60',
+    }
+    informer = Informer(list_namespaced_config_map)
+    informer._replace([config_map], '1')
+    monkeypatch.setattr(
+        kubernetes_api,
+        'template_registry',
+        kubernetes_api.TemplateRegistry(informer),
+        raising=False,
+    )
+    monkeypatch.setattr(kubernetes_api.Config, 'IDLE_TTL', 0)
+
+    api = kubernetes_api.KubernetesApi.__new__(kubernetes_api.KubernetesApi)
+    assert api.idle_ttl('x') == 600
+    assert api.idle_ttl('y') == 60
+    assert api.idle_ttl('z') == 0
+
+
+def test_skeleton_cache():
+    informer = Informer(list_namespaced_config_map)
+    informer._replace(
+        [make_config_map('maps', '1', {'a.yaml': 'metadata:\n  labels: {}\n'})], '1'
+    )
+    registry = kubernetes_api.TemplateRegistry(informer)
+
+    skeleton = registry.skeleton('a', {'v': '1', 'w': '2'})
+    assert registry.skeleton('a', {'w': '2', 'v': '1'}) is skeleton
+    assert registry.skeleton('a', {}) is not skeleton
+
+    informer._apply(
+        'MODIFIED', make_config_map('maps', '2', {'a.yaml': 'metadata: {}\n'})
+    )
+    assert len(registry._skeletons) == 0
+    assert registry.skeleton('a', {}) == {'metadata': {}}
+
+    config_map = make_config_map('maps', '3', {'a.yaml': 'metadata: {}\n'})
+    config_map.metadata.annotations = {
+        kubernetes_api.skeleton_cache_annotation: 'false'
+    }
+    informer._apply('MODIFIED', config_map)
+    assert registry.skeleton('a', {}) is not registry.skeleton('a', {})
+
+
+def test_starting(monkeypatch):
+    def make_job(name, instance):
+        return client.V1Job(
+            metadata=client.V1ObjectMeta(
+                name=name, labels={type_label: 'a', name_label: instance}
+            ),
+            status=client.V1JobStatus(),
+        )
+
+    jobs = Informer(list_namespaced_pod, indexers=instance_indexers)
+    jobs._replace([make_job('a-1', '1'), make_job('a-2', '2')], '1')
+    pods = Informer(list_namespaced_pod, indexers=instance_indexers)
+    pods._replace([make_pod('a-1-x', 'a', '1', ready=True, ip='10.0.0.1')], '1')
+    monkeypatch.setattr(kubernetes_api, 'job_informer', jobs, raising=False)
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', pods, raising=False)
+
+    # a-2 has no pod yet
+    assert kubernetes_api.starting('a') == 1
+
+
+def make_endpoint_slice(name, pod, ready, ip='10.0.0.9'):
+    return client.V1EndpointSlice(
+        metadata=client.V1ObjectMeta(name=name, resource_version='1'),
+        address_type='IPv4',
+        endpoints=[
+            client.V1Endpoint(
+                addresses=[ip],
+                conditions=client.V1EndpointConditions(ready=ready),
+                target_ref=client.V1ObjectReference(kind='Pod', name=pod),
+            )
+        ],
+    )
+
+
+def test_endpoint_readiness(monkeypatch):
+    pods = Informer(list_namespaced_pod, indexers=instance_indexers)
+    pods._replace([make_pod('a-1-x', 'a', '1', ready=True, ip='10.0.0.1')], '1')
+    endpoints = Informer(
+        list_namespaced_pod, indexers={'pod': kubernetes_api._endpoint_targets}
+    )
+    endpoints.add_handler(kubernetes_api.EndpointReadiness())
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', pods, raising=False)
+    monkeypatch.setattr(kubernetes_api, 'endpoint_informer', endpoints)
+    monkeypatch.setattr(kubernetes_api, 'listing', InstanceListing())
+    pod = pods.get('a-1-x')
+
+    # without a service the container statuses count
+    assert kubernetes_api._instance_status([pod]) == (True, '10.0.0.1')
+
+    # the endpoint of the service is not ready yet
+    endpoints._apply('ADDED', make_endpoint_slice('svc-x', 'a-1-x', False))
+    assert kubernetes_api._instance_status([pod]) == (False, 'pulling_image')
+
+    endpoints._apply('MODIFIED', make_endpoint_slice('svc-x', 'a-1-x', True))
+    assert kubernetes_api._instance_status([pod]) == (True, '10.0.0.9')
+
+    endpoints._apply('DELETED', make_endpoint_slice('svc-x', 'a-1-x', True))
+    assert kubernetes_api._instance_status([pod]) == (True, '10.0.0.1')
+
+
+def test_startup_tracker():
+    estimates = StartupEstimates()
+    tracker = kubernetes_api.StartupTracker(estimates)
+    created = datetime.datetime.now(datetime.UTC) - datetime.timedelta(seconds=3)
+
+    pending = make_pod('a-1-x', 'a', '1', ready=None)
+    pending.metadata.uid = 'u1'
+    pending.metadata.creation_timestamp = created
+    tracker('ADDED', pending)
+    assert estimates.estimate('a', 'scheduling') is None
+
+    scheduled = make_pod('a-1-x', 'a', '1')
+    scheduled.metadata.uid = 'u1'
+    scheduled.metadata.creation_timestamp = created
+    scheduled.status.conditions = [
+        client.V1PodCondition(type='PodScheduled', status='True')
+    ]
+    tracker('MODIFIED', scheduled)
+    assert estimates.estimate('a', 'scheduling') == pytest.approx(3, abs=0.5)
+
+    ready = make_pod('a-1-x', 'a', '1', ready=True, ip='10.0.0.1')
+    ready.metadata.uid = 'u1'
+    ready.status.conditions = scheduled.status.conditions
+    tracker('MODIFIED', ready)
+    assert estimates.estimate('a', 'starting') == pytest.approx(0, abs=0.5)
+
+    # pods already running when listed are not observed
+    running = make_pod('a-2-x', 'a', '2', ready=True, ip='10.0.0.2')
+    running.metadata.uid = 'u2'
+    running.status.conditions = scheduled.status.conditions
+    estimates = StartupEstimates()
+    kubernetes_api.StartupTracker(estimates)('ADDED', running)
+    assert estimates.estimate('a', 'scheduling') is None
+
+
+def test_eta(monkeypatch):
+    estimates = StartupEstimates()
+    estimates.observe('a', 'scheduling', 2)
+    estimates.observe('a', 'starting', 10)
+    monkeypatch.setattr(kubernetes_api, 'startup_estimates', estimates)
+    now = datetime.datetime.now(datetime.UTC)
+
+    pod = make_pod('a-1-x', 'a', '1', ready=None)
+    pod.metadata.creation_timestamp = now
+    pods = Informer(list_namespaced_pod, indexers=instance_indexers)
+    pods._replace([pod], '1')
+    monkeypatch.setattr(kubernetes_api, 'pod_informer', pods, raising=False)
+    monkeypatch.setattr(kubernetes_api, 'job_informer', pods, raising=False)
+
+    job = kubernetes_api.IntensJob('a', '1', create=False)
+    assert job.eta(now.timestamp() + 1) == pytest.approx(11)
+
+    pod.status.conditions = [
+        client.V1PodCondition(
+            type='PodScheduled', status='True', last_transition_time=now
+        )
+    ]
+    assert job.eta(now.timestamp() + 4) == pytest.approx(6)
+
+
+def test_pre_pull_daemon_set():
+    placement = {'nodeSelector': {'gpu': 'true'}}
+    daemon_set = kubernetes_api.pre_pull_daemon_set('sim:1', placement)
+    assert daemon_set == kubernetes_api.pre_pull_daemon_set('sim:1', placement)
+    assert (
+        daemon_set['metadata']['name']
+        != (kubernetes_api.pre_pull_daemon_set('sim:2', placement)['metadata']['name'])
+    )
+    spec = daemon_set['spec']['template']['spec']
+    assert spec['nodeSelector'] == {'gpu': 'true'}
+    tools, pull = spec['initContainers']
+    assert pull['image'] == 'sim:1'
+    # the pulled image only needs to run the copied static binary
+    assert pull['command'][0] == tools['command'][-1]
+    assert tools['image'] == Config.PRE_PULL_TOOLS_IMAGE
+
+
+def test_pull_status():
+    def make_pre_pull_pod(restart_count=0, **state):
+        tools = client.V1ContainerState(
+            terminated=client.V1ContainerStateTerminated(exit_code=0)
+        )
+        return client.V1Pod(
+            metadata=client.V1ObjectMeta(name='p'),
+            status=client.V1PodStatus(
+                init_container_statuses=[
+                    client.V1ContainerStatus(
+                        name=name,
+                        image=image,
+                        image_id='',
+                        ready=False,
+                        restart_count=restarts,
+                        state=state,
+                    )
+                    for name, image, restarts, state in (
+                        ('tools', 'busybox', 0, tools),
+                        (
+                            'pull',
+                            'sim:1',
+                            restart_count,
+                            client.V1ContainerState(**state),
+                        ),
+                    )
+                ]
+            ),
+        )
+
+    waiting = client.V1ContainerStateWaiting
+    terminated = client.V1ContainerStateTerminated
+    assert kubernetes_api._pull_status(client.V1Pod()) == 'pulling'
+    assert (
+        kubernetes_api._pull_status(
+            make_pre_pull_pod(waiting=waiting(reason='PodInitializing'))
+        )
+        == 'pulling'
+    )
+    assert (
+        kubernetes_api._pull_status(
+            make_pre_pull_pod(waiting=waiting(reason='ImagePullBackOff'))
+        )
+        == 'error'
+    )
+    assert (
+        kubernetes_api._pull_status(
+            make_pre_pull_pod(terminated=terminated(exit_code=0))
+        )
+        == 'pulled'
+    )
+    # a failing pull container is not hidden as pulled
+    assert (
+        kubernetes_api._pull_status(
+            make_pre_pull_pod(terminated=terminated(exit_code=127))
+        )
+        == 'error'
+    )
+    assert (
+        kubernetes_api._pull_status(
+            make_pre_pull_pod(1, waiting=waiting(reason='CrashLoopBackOff'))
+        )
+        == 'error'
+    )
+
+
+class FakeAppsApi:
+    def __init__(self, existing=()):
+        self.existing = list(existing)
+        self.created = []
+        self.deleted = []
+
+    def list_namespaced_daemon_set(self, namespace, label_selector):
+        items = [
+            client.V1DaemonSet(metadata=client.V1ObjectMeta(name=name))
+            for name in self.existing
+        ]
+        return client.V1DaemonSetList(items=items)
+
+    def create_namespaced_daemon_set(self, namespace, body):
+        self.created.append(body)
+
+    def delete_namespaced_daemon_set(self, name, namespace):
+        self.deleted.append(name)
+
+
+def test_image_pre_puller(monkeypatch):
+    template = (
+        'spec:\n  containers:\n  - name: app\n    image: sim:1\n'
+        '  - name: sidecar\n    image: proxy:1\n'
+    )
+    config_map = make_config_map(
+        'templates', '1', {'sim.yaml': template, 'b.yaml': template}
+    )
+    config_map.metadata.annotations = {
+        'config-controller.semafor.ch/pre-pull.sim': 'true'
+    }
+    informer = Informer(list_namespaced_config_map)
+    informer._replace([config_map], '1')
+    monkeypatch.setattr(
+        kubernetes_api,
+        'template_registry',
+        kubernetes_api.TemplateRegistry(informer),
+        raising=False,
+    )
+
+    apps = FakeAppsApi(existing=['config-controller-pre-pull-old'])
+    pods = Informer(list_namespaced_pod)
+    pods._replace([], '1')
+    pre_puller = kubernetes_api.ImagePrePuller(apps, pods)
+    pre_puller.sync()
+
+    # only the template with the annotation is pre-pulled
+    images = sorted(
+        d['metadata']['annotations'][kubernetes_api.pre_pull_image_annotation]
+        for d in apps.created
+    )
+    assert images == ['proxy:1', 'sim:1']
+    assert apps.deleted == ['config-controller-pre-pull-old']
+
+    pod = client.V1Pod(
+        metadata=client.V1ObjectMeta(
+            name='x', resource_version='1', labels=apps.created[0]['metadata']['labels']
+        ),
+        spec=client.V1PodSpec(containers=[], node_name='node-a'),
+        status=client.V1PodStatus(
+            container_statuses=[
+                client.V1ContainerStatus(
+                    name='pause',
+                    image='pause',
+                    image_id='',
+                    ready=True,
+                    restart_count=0,
+                    state=client.V1ContainerState(
+                        running=client.V1ContainerStateRunning()
+                    ),
+                )
+            ]
+        ),
+    )
+    pods._apply('ADDED', pod)
+    status = {s['image']: s for s in pre_puller.status()}
+    image = apps.created[0]['metadata']['annotations'][
+        kubernetes_api.pre_pull_image_annotation
+    ]
+    assert status[image]['nodes'] == {'node-a': 'pulled'}
+    assert status[image]['templates'] == ['sim']
+
+
+class FakeGauge:
+    def __init__(self):
+        self.values = {}
+        self.sets = 0
+
+    def labels(self, *labels):
+        gauge = self
+
+        class Child:
+            def set(self, value):
+                gauge.sets += 1
+                gauge.values[labels] = value
+
+        return Child()
+
+
+def test_instance_metrics_counts_per_listing(monkeypatch):
+    gauge = FakeGauge()
+    monkeypatch.setattr(kubernetes_api.metrics, 'instances', gauge)
+    informer = Informer(list_namespaced_pod, indexers=instance_indexers)
+    instance_metrics = kubernetes_api.InstanceMetrics()
+    informer.add_handler(instance_metrics)
+    informer.add_flush_handler(instance_metrics.flush)
+
+    pods = [make_pod(f'm-{i}-x', 'm', str(i)) for i in range(3000)]
+    pods.append(make_pool_pod('m-pool-1-x', 'm-pool-1', 'm'))
+    informer._replace(pods, '1')
+    informer._replace(pods, '2')
+    # the gauge is set once per listing that changed the count, not per pod
+    assert gauge.values == {('m',): 3000}
+    assert gauge.sets == 1
+
+    informer._replace(pods[1:], '3')
+    assert gauge.values == {('m',): 2999}
+    claimed = make_pod('m-pool-1-x', 'm', 'user')
+    informer._apply('MODIFIED', claimed)
+    assert gauge.values == {('m',): 3000}
+    informer._apply('DELETED', claimed)
+    assert gauge.values == {('m',): 2999}
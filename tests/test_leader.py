@@ -0,0 +1,38 @@
+import datetime
+
+from kubernetes import client, config
+
+from controller.kubernetes_api import LeaseElector
+from controller.leader import FileLockElector
+
+
+def coordination_v1():
+    return client.CoordinationV1Api(config.new_client_from_config())
+
+
+def test_lease_election(fake_apiserver):
+    api = coordination_v1()
+    first = LeaseElector(api, 'test-lease', 'first')
+    second = LeaseElector(api, 'test-lease', 'second')
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.try_acquire()
+    lease = fake_apiserver.resources['leases']['test-lease']
+    assert lease['spec']['holderIdentity'] == 'first'
+
+    # taken over once the lease expired
+    later = datetime.datetime.now(datetime.UTC) + datetime.timedelta(minutes=1)
+    assert second.try_acquire(later)
+    assert not first.try_acquire()
+    lease = fake_apiserver.resources['leases']['test-lease']
+    assert lease['spec']['leaseTransitions'] == 1
+
+
+def test_file_lock_election(tmp_path):
+    first = FileLockElector(str(tmp_path / 'leader.lock'))
+    second = FileLockElector(str(tmp_path / 'leader.lock'))
+
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.is_leader and not second.is_leader
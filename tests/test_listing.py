@@ -0,0 +1,62 @@
+import pytest
+
+from controller.listing import (
+    InstanceListing,
+    decode_continue,
+    encode_continue,
+    parse_selector,
+    query,
+)
+
+
+def test_versions():
+    listing = InstanceListing()
+    assert listing.snapshot('a') == (0, [])
+
+    listing.put('a', 'a-2', {'name': '2'})
+    listing.put('a', 'a-1', {'name': '1'})
+    version, items = listing.snapshot('a')
+    assert version == 2
+    assert [key for key, _ in items] == ['a-1', 'a-2']
+
+    # unchanged summaries do not change the version
+    listing.put('a', 'a-1', {'name': '1'})
+    listing.discard('a', 'missing')
+    assert listing.snapshot('a')[0] == 2
+    assert listing.snapshot('b')[0] == 0
+
+    listing.discard('a', 'a-1')
+    assert listing.snapshot('a')[0] == 3
+    assert listing.count('a') == 1
+
+
+def test_query():
+    items = [
+        (f'a-{i}', {'name': str(i), 'ip': f'10.0.0.{i}', 'user': 'x' if i % 2 else 'y'})
+        for i in range(1, 6)
+    ]
+
+    page, last = query(items, selector={'user': 'x'}, fields=['name'], limit=2)
+    assert page == [{'name': '1'}, {'name': '3'}]
+    assert last == 'a-3'
+
+    page, last = query(
+        items, selector={'user': 'x'}, fields=['name'], limit=2, after=last
+    )
+    assert page == [{'name': '5'}]
+    assert last is None
+
+    page, last = query(items)
+    assert len(page) == 5 and last is None
+
+
+def test_selector_and_token():
+    assert parse_selector('user=alice, group=admins') == {
+        'user': 'alice',
+        'group': 'admins',
+    }
+    with pytest.raises(ValueError):
+        parse_selector('user')
+    assert decode_continue(encode_continue('a-1')) == 'a-1'
+    with pytest.raises(ValueError):
+        decode_continue('%%%')
@@ -0,0 +1,27 @@
+from controller.lru import LruCache
+
+
+def test_evicts_least_recently_used():
+    cache = LruCache(2, 100)
+    cache.put('a', 1, 10)
+    cache.put('b', 2, 10)
+    assert cache.get('a') == 1
+    cache.put('c', 3, 10)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.bytes == 20
+
+
+def test_size_bound():
+    cache = LruCache(10, 100)
+    cache.put('a', 1, 60)
+    cache.put('b', 2, 60)
+    assert cache.get('a') is None
+    cache.put('c', 3, 200)
+    assert cache.get('c') is None
+    assert len(cache) == 1
+
+    cache.discard(lambda key: key == 'b')
+    assert len(cache) == 0
+    assert cache.bytes == 0
@@ -0,0 +1,67 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from controller import metrics
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_backend_call_counts_errors(monkeypatch):
+    monkeypatch.setattr(metrics, 'templates', {'test'})
+    labels = {'app_type': 'test', 'backend': 'kubernetes', 'verb': 'failing'}
+    calls = sample('config_controller_backend_call_seconds_count', **labels)
+    errors = sample('config_controller_backend_errors_total', **labels)
+
+    with metrics.backend_call('kubernetes', 'failing', 'test'):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.backend_call('kubernetes', 'failing', 'test'):
+            raise ValueError()
+
+    assert sample('config_controller_backend_call_seconds_count', **labels) == calls + 2
+    assert sample('config_controller_backend_errors_total', **labels) == errors + 1
+
+
+def test_ready_outcome(monkeypatch):
+    monkeypatch.setattr(metrics, 'templates', {'test'})
+    before = sample(
+        'config_controller_ready_outcomes_total', app_type='test', outcome='ready'
+    )
+    metrics.ready_outcome('test', True, '10.0.0.1')
+    metrics.ready_outcome('test', False, 'pulling_image')
+
+    assert (
+        sample(
+            'config_controller_ready_outcomes_total', app_type='test', outcome='ready'
+        )
+        == before + 1
+    )
+    assert sample(
+        'config_controller_ready_outcomes_total',
+        app_type='test',
+        outcome='pulling_image',
+    )
+
+
+def test_unknown_app_type(monkeypatch):
+    monkeypatch.setattr(metrics, 'templates', {'test'})
+    before = sample(
+        'config_controller_stage_seconds_count', app_type='unknown', stage='lookup'
+    )
+
+    with metrics.stage('not a template', 'lookup'):
+        pass
+
+    assert not sample(
+        'config_controller_stage_seconds_count',
+        app_type='not a template',
+        stage='lookup',
+    )
+    assert (
+        sample(
+            'config_controller_stage_seconds_count', app_type='unknown', stage='lookup'
+        )
+        == before + 1
+    )
@@ -0,0 +1,28 @@
+import pytest
+
+from config import Config
+from controller.readiness import StartupEstimates, retry_after
+
+
+def test_startup_estimates():
+    estimates = StartupEstimates()
+    assert estimates.remaining('a', 'scheduling', 0) is None
+
+    estimates.observe('a', 'scheduling', 2)
+    estimates.observe('a', 'starting', 10)
+    assert estimates.remaining('a', 'scheduling', 1) == 11
+    assert estimates.remaining('a', 'starting', 4) == 6
+    assert estimates.remaining('a', 'starting', 20) == 0
+
+    # new observations move the average by the weight
+    estimates.observe('a', 'starting', 20)
+    assert estimates.estimate('a', 'starting') == pytest.approx(13)
+    assert estimates.estimate('b', 'starting') is None
+
+
+def test_retry_after(monkeypatch):
+    monkeypatch.setattr(Config, 'RETRY_AFTER_MAX', 30)
+    assert retry_after(None) == 1
+    assert retry_after(0) == 1
+    assert retry_after(4.2) == 5
+    assert retry_after(600) == 30
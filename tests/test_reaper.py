@@ -0,0 +1,70 @@
+import time
+
+from config import Config
+from controller.reaper import Reaper
+
+
+def test_retries_until_deleted(monkeypatch):
+    monkeypatch.setattr(Config, 'REAPER_RETRIES', 2)
+    reaper = Reaper()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RuntimeError('apiserver unavailable')
+
+    assert reaper.enqueue('a', '1', flaky)
+    assert not reaper.enqueue('a', '1', flaky)
+    assert reaper.run_once() == 1
+    assert reaper.pending('a', '1')
+
+    # retried after the backoff only
+    assert reaper.run_once() == 0
+    reaper._queue[('a', '1')]['not_before'] = 0
+    assert reaper.run_once() == 1
+    assert not reaper.pending('a', '1')
+    assert len(attempts) == 2
+
+
+def test_gives_up(monkeypatch):
+    monkeypatch.setattr(Config, 'REAPER_RETRIES', 0)
+    reaper = Reaper()
+
+    def failing():
+        raise RuntimeError('forbidden')
+
+    reaper.enqueue('a', '1', failing)
+    reaper.run_once()
+    assert not reaper.pending('a', '1')
+
+
+def test_batches_and_sweeps(monkeypatch):
+    monkeypatch.setattr(Config, 'REAPER_BATCH_SIZE', 2)
+    deleted = []
+    finished = [('a', str(i), lambda i=i: deleted.append(i)) for i in range(3)]
+    reaper = Reaper(lambda: finished)
+
+    reaper.sweep()
+    assert reaper.run_once() == 2
+    assert reaper.run_once() == 1
+    assert sorted(deleted) == [0, 1, 2]
+    assert reaper.run_once() == 0
+
+
+def test_follower_waits_between_sweeps(monkeypatch):
+    class Follower:
+        is_leader = False
+
+    monkeypatch.setattr(Config, 'REAPER_INTERVAL', 60)
+    reaper = Reaper(lambda: [], Follower())
+    calls = []
+
+    def run_once():
+        calls.append(1)
+        return 0
+
+    reaper.run_once = run_once
+    reaper.start()
+    time.sleep(0.2)
+    assert len(calls) <= 2
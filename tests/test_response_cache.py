@@ -0,0 +1,49 @@
+import time
+
+from controller.lru import LruCache
+from controller.response_cache import ResponseCache
+
+
+def test_get_put():
+    cache = ResponseCache(LruCache(10, 1000), ttl=60)
+    key = ('a', '/app/{type}', '')
+    assert cache.get(key) is None
+
+    entry = cache.put(key, b'[]', {'X-Continue': 'x'}, version=1)
+    assert entry.headers['ETag'].startswith('W/"')
+    assert entry.headers['Cache-Control'] == 'max-age=60'
+    assert cache.get(key, version=1) is entry
+    # built from an older version of the data
+    assert cache.get(key, version=2) is None
+    assert cache.stats() | {'ratio': None} == {
+        'hits': 1,
+        'misses': 2,
+        'ratio': None,
+        'entries': 1,
+        'bytes': 2,
+    }
+
+
+def test_expiry_and_invalidation():
+    cache = ResponseCache(LruCache(10, 1000), ttl=60)
+    cache.put(('a', '/app/{type}', ''), b'[1]')
+    cache.put(('b', '/app/{type}', ''), b'[2]', {'ETag': '"b"'})
+    cache.put((None, '/app', ''), b'["a"]')
+
+    cache.invalidate('a')
+    assert cache.get(('a', '/app/{type}', '')) is None
+    assert cache.get(('b', '/app/{type}', '')).headers['ETag'] == '"b"'
+    assert cache.get((None, '/app', '')).body == b'["a"]'
+
+    cache.ttl = 0.01
+    cache.put((None, '/app', ''), b'["b"]')
+    time.sleep(0.02)
+    assert cache.get((None, '/app', '')) is None
+
+
+def test_disabled():
+    cache = ResponseCache(LruCache(10, 1000), ttl=0)
+    entry = cache.put((None, '/app', ''), b'[]')
+    assert entry.headers['Cache-Control'] == 'no-cache'
+    assert cache.get((None, '/app', '')) is None
+    assert len(cache.store) == 0
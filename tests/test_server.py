@@ -1,48 +1,368 @@
+import asyncio
+import json
+import threading
+import time
+
 import pytest
+from fastapi.testclient import TestClient
 
-from controller import create_app
+from config import Config
+from controller import app, kubernetes_api, routes
 
 
 @pytest.fixture
 def client():
+    with TestClient(app) as client:
+        yield client
 
-    class KubeApi:
-        def __init__(self):
-            pass
 
-        def get_job(self, type, name):
-            assert type == 'type'
-            assert name == 'name'
-            return '0.0.0.0'
+def test_info(client, monkeypatch):
+    assert routes.ready.wait(30)
+    rv = client.get('/info')
+    assert rv.json()['status'] == 'UP'
 
-        def list_templates(self):
-            return ['type']
+    # not ready while the backend is loaded
+    monkeypatch.setattr(routes, 'ready', threading.Event())
+    rv = client.get('/info')
+    assert rv.status_code == 503
+    assert rv.json()['status'] == 'STARTING'
 
-        def get_jobs(self, type):
-            assert type == 'type'
-            return [dict(name=type, ip='0.0.0.0')]
 
-    app = create_app({
-        'TESTING': True,
-        'KUBE': KubeApi(),
-    })
-    with app.test_client() as client:
-        yield client
+def test_metrics(client, monkeypatch, tmp_path):
+    rv = client.get('/metrics')
+    assert 'config_controller_instances' in rv.text
+
+    # the workers' metrics come from the files of the shared directory
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    rv = client.get('/metrics')
+    assert rv.status_code == 200
+    assert 'config_controller_instances' not in rv.text
 
 
 def test_not_found(client):
     rv = client.get('/')
-    assert b'{"msg":"not found","status":"error"}\n' in rv.data
+    assert rv.status_code == 404
 
 
-def test_list_containers(client):
-    rv = client.get('/app/type')
-    assert b'[{"ip":"0.0.0.0","name":"type"}]\n' == rv.data
+def test_list_templates(client):
+    rv = client.get('/app')
+    assert rv.json() == ['bench']
 
+    rv = client.get('/app?detail=true')
+    assert rv.json()[0]['source'] == 'templates'
+    assert rv.json()[0]['variables'] == ['image']
 
-def test_create_container(client):
     rv = client.get('/app')
-    assert b'["type"]\n' in rv.data
+    assert rv.headers['Cache-Control'].startswith('max-age=')
+    rv = client.get('/app', headers={'If-None-Match': rv.headers['ETag']})
+    assert rv.status_code == 304
+    assert client.get('/info').json()['responseCache']['hits'] >= 1
+
+
+def test_create_container(client, fake_apiserver):
+    rv = client.get('/app/bench/name', headers={'Prefer': 'wait=5'})
+    assert rv.status_code == 200
+    ip = rv.json()['ip']
+    assert ip.startswith('10.1.')
+    assert 'bench-name' in fake_apiserver.resources['jobs']
+
+    rv = client.get('/app/bench')
+    assert [(j['name'], j['ip']) for j in rv.json()] == [('name', ip)]
+
+    rv = client.patch('/app/bench/name', json={'user': 'someone'})
+    assert rv.json() == {'status': 'Success'}
+    rv = client.get('/app/bench/name')
+    assert rv.json()['user'] == 'someone'
+
+    rv = client.delete('/app/bench/name')
+    assert rv.status_code == 202
+    assert rv.json() == {'status': 'Success'}
+    assert poll(client, '/app/bench', lambda rv: rv.json() == []).json() == []
+    assert 'bench-name' not in fake_apiserver.resources['jobs']
+
+
+def test_endpoint_slice_readiness(client, fake_apiserver):
+    rv = client.get('/app/bench/served', headers={'Prefer': 'wait=5'})
+    assert rv.status_code == 200
+    pod = next(
+        p
+        for p in fake_apiserver.resources['pods'].values()
+        if p['metadata']['labels']['job-name'] == 'bench-served'
+    )
+
+    def endpoint_slice(ready):
+        return {
+            'metadata': {'name': 'bench-svc'},
+            'addressType': 'IPv4',
+            'endpoints': [
+                {
+                    'addresses': ['10.2.0.1'],
+                    'conditions': {'ready': ready},
+                    'targetRef': {'kind': 'Pod', 'name': pod['metadata']['name']},
+                }
+            ],
+        }
+
+    # the service does not consider the instance ready
+    fake_apiserver.store('endpointslices', 'ADDED', endpoint_slice(False))
+    rv = poll(
+        client,
+        '/app/bench/served',
+        lambda rv: rv.status_code == 202,
+        headers={'Prefer': 'wait=0'},
+    )
+    assert rv.status_code == 202
+    assert 1 <= int(rv.headers['Retry-After']) <= 30
+
+    fake_apiserver.store('endpointslices', 'MODIFIED', endpoint_slice(True))
+    rv = client.get('/app/bench/served', headers={'Prefer': 'wait=5'})
+    assert rv.json()['ip'] == '10.2.0.1'
+
+    fake_apiserver.store('endpointslices', 'DELETED', endpoint_slice(True))
+    client.delete('/app/bench/served')
+
+
+def test_pre_pull(client, fake_apiserver):
+    template = 'spec:\n  containers:\n  - name: app\n    image: sim:1\n'
+    fake_apiserver.add_config_map(
+        'big-templates',
+        {'big.yaml': template},
+        labels={'config-controller.semafor.ch/template': 'true'},
+        annotations={'config-controller.semafor.ch/pre-pull': 'true'},
+    )
+    rv = poll(
+        client,
+        '/images',
+        lambda rv: rv.json() and rv.json()[0]['nodes'] == {'fake-node': 'pulled'},
+    )
+    assert rv.json() == [
+        {'image': 'sim:1', 'templates': ['big'], 'nodes': {'fake-node': 'pulled'}}
+    ]
+    assert len(fake_apiserver.resources['daemonsets']) == 1
+
+    fake_apiserver.store(
+        'configmaps', 'DELETED', fake_apiserver.resources['configmaps']['big-templates']
+    )
+    assert poll(client, '/images', lambda rv: rv.json() == []).json() == []
+    for _ in range(50):
+        if not fake_apiserver.resources['daemonsets']:
+            break
+        time.sleep(0.02)
+    assert fake_apiserver.resources['daemonsets'] == {}
+
+
+def test_export(client, fake_apiserver, monkeypatch):
+    for name in ('x1', 'x2', 'x3'):
+        client.get('/app/bench/' + name, headers={'Prefer': 'wait=5'})
+    client.patch('/app/bench/x2', json={'user': 'someone'})
+    monkeypatch.setattr(Config, 'EXPORT_PAGE_SIZE', 1)
+    lists = fake_apiserver.snapshot()[0].get('list pods', 0)
+
+    rv = client.get('/export?type=bench')
+    # one page per instance
+    assert fake_apiserver.snapshot()[0]['list pods'] - lists >= 3
+    assert rv.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in rv.text.splitlines()]
+    assert [(r['type'], r['name'], r['phase']) for r in rows] == [
+        ('bench', 'x1', 'ready'),
+        ('bench', 'x2', 'ready'),
+        ('bench', 'x3', 'ready'),
+    ]
+    assert rows[1]['labels'] == {'user': 'someone'}
+    assert all(r['ip'].startswith('10.1.') and r['start'] for r in rows)
+
+    for name in ('x1', 'x2', 'x3'):
+        client.delete('/app/bench/' + name)
+
+    # the type ends up in the label selector
+    rv = client.get('/export', params={'type': 'bench,user=someone'})
+    assert rv.status_code == 404
+
+
+def test_unknown_template(client):
+    rv = client.get('/app/unknown/name')
+    assert rv.status_code == 404
+    assert rv.json()['status'] == 'error'
+
+
+def test_create_waits_for_admission(client, monkeypatch):
+    assert routes.ready.wait(30)
+    admission = routes.api.admission
+    monkeypatch.setattr(Config, 'ADMISSION_RATE', 10)
+    admission._tokens, admission._refilled = 0.0, time.monotonic()
+
+    rv = client.get('/create/bench?sessionID=admitted')
+    assert rv.status_code == 200
+    assert rv.json()['hostname'].startswith('10.1.')
+    client.delete('/app/bench/admitted')
+
+    # queued creations are taken back when the timeout expires
+    monkeypatch.setattr(Config, 'ADMISSION_RATE', 0.001)
+    monkeypatch.setattr(Config, 'READY_TIMEOUT', 0.2)
+    admission._tokens, admission._refilled = 0.0, time.monotonic()
+    rv = client.get('/create/bench?sessionID=expired')
+    assert rv.status_code == 408
+    assert admission.position('bench', 'expired') is None
+
+
+def events(client, url):
+    """get the server-sent events of a stream as (event, data) tuples"""
+    rv = client.get(url)
+    assert rv.headers['content-type'].startswith('text/event-stream')
+    messages = [m.splitlines() for m in rv.text.split('\n\n') if m.strip()]
+    return [
+        (m[0].removeprefix('event: '), json.loads(m[1].removeprefix('data: ')))
+        for m in messages
+        if not m[0].startswith(':')
+    ]
+
+
+def test_events(client, monkeypatch):
+    assert routes.ready.wait(30)
+    stream = events(client, '/app/bench/streamed/events')
+    assert stream[-1][0] == 'phase'
+    assert stream[-1][1]['phase'] == 'ready'
+    assert stream[-1][1]['ip'].startswith('10.1.')
+
+    # the job is gone before its pods
+    kubernetes_api.deleted_jobs.put('bench-streamed', True, 1)
+    assert events(client, '/app/bench/streamed/events') == [('deleted', {})]
+    kubernetes_api.deleted_jobs.put('bench-streamed', False, 1)
+    client.delete('/app/bench/streamed')
+
+    def failing():
+        raise RuntimeError('invalid template')
+
+    admission = routes.api.admission
+    monkeypatch.setattr(Config, 'ADMISSION_RATE', 10)
+    admission._tokens, admission._refilled = 0.0, time.monotonic()
+    assert admission.submit('bench', 'doomed', failing) > 0
+    stream = events(client, '/app/bench/doomed/events')
+    assert stream == [
+        ('phase', {'phase': 'pending', 'detail': 'queued'}),
+        ('error', {'msg': 'invalid template'}),
+    ]
+
+
+def test_list_unusual_type(client):
+    for type in ('caf%C3%A9', 'a%0D%0Ab', '%E2%9C%93'):
+        rv = client.get('/app/' + type)
+        assert rv.status_code == 200
+        assert rv.json() == []
+        rv = client.get('/app/' + type, headers={'If-None-Match': rv.headers['ETag']})
+        assert rv.status_code == 304
+
+
+def test_unknown_type_is_not_tracked(client):
+    for i in range(3):
+        assert client.get(f'/app/bogus-{i}/name').status_code == 404
+    assert not [k for k in routes.activity._last if k[0].startswith('bogus-')]
+
+
+def test_delete_missing(client):
+    rv = client.delete('/app/bench/missing')
+    assert rv.status_code == 404
+
+
+def test_backend_calls_leave_the_event_loop(client, monkeypatch):
+    def off_loop(call):
+        def wrapper(*args, **kwargs):
+            with pytest.raises(RuntimeError):
+                asyncio.get_running_loop()
+            return call(*args, **kwargs)
+
+        return wrapper
+
+    monkeypatch.setattr(routes.api, 'get_job', off_loop(routes.api.get_job))
+    monkeypatch.setattr(routes.api, 'find_job', off_loop(routes.api.find_job))
+    assert client.post('/app/bench/missing/heartbeat').status_code == 404
+    assert client.delete('/app/bench/missing').status_code == 404
+    assert client.get('/release/missing').status_code == 404
+
+
+def poll(client, url, predicate, headers=None):
+    """get a url until the response satisfies the predicate
+
+    The listing follows the fake apiserver asynchronously.
+    """
+    for _ in range(50):
+        rv = client.get(url, headers=headers)
+        if predicate(rv):
+            break
+        time.sleep(0.02)
+    return rv
+
+
+def test_list_pages(client):
+    for name in ('a', 'b', 'c'):
+        client.get('/app/bench/' + name, headers={'Prefer': 'wait=5'})
+    client.patch('/app/bench/b', json={'user': 'someone'})
+
+    rv = client.get('/app/bench?fields=name&limit=2')
+    assert rv.json() == [{'name': 'a'}, {'name': 'b'}]
+    rv = client.get(f'/app/bench?fields=name&continue={rv.headers["X-Continue"]}')
+    assert rv.json() == [{'name': 'c'}]
+    assert 'X-Continue' not in rv.headers
+
+    rv = poll(
+        client,
+        '/app/bench?selector=user=someone&fields=name,user',
+        lambda rv: rv.json(),
+    )
+    assert rv.json() == [{'name': 'b', 'user': 'someone'}]
+    etag = rv.headers['ETag']
+    rv = client.get(
+        '/app/bench?selector=user=someone&fields=name,user',
+        headers={'If-None-Match': etag},
+    )
+    assert rv.status_code == 304
+
+    client.delete('/app/bench/a')
+    rv = poll(client, '/app/bench?fields=name', lambda rv: len(rv.json()) == 2)
+    assert rv.json() == [{'name': 'b'}, {'name': 'c'}]
+
+    assert client.get('/app/bench?continue=%25').status_code == 400
+    for name in ('b', 'c'):
+        client.delete('/app/bench/' + name)
+
+
+def test_release(client, fake_apiserver):
+    client.get('/app/bench/session', headers={'Prefer': 'wait=5'})
+
+    rv = client.get('/release/session')
+    assert rv.json() == {'status': 'Success'}
+    poll(client, '/app/bench', lambda rv: rv.json() == [])
+    assert 'bench-session' not in fake_apiserver.resources['jobs']
+
+    rv = client.get('/release/session')
+    assert rv.status_code == 404
+
+
+def test_heartbeat(client):
+    client.get('/app/bench/active', headers={'Prefer': 'wait=5'})
+
+    rv = client.post('/app/bench/active/heartbeat')
+    assert rv.status_code == 204
+    assert client.post('/app/bench/missing/heartbeat').status_code == 404
+    client.delete('/app/bench/active')
+
+
+def test_patch_many(client):
+    for name in ('p1', 'p2'):
+        client.get('/app/bench/' + name, headers={'Prefer': 'wait=5'})
+
+    rv = client.patch(
+        '/app/bench', json={'p1': {'user': 'a', 'group': 'x'}, 'p2': {'user': 'b'}}
+    )
+    assert [r['status'] for r in rv.json()] == ['patched', 'patched']
+    rv = client.patch('/app/bench', json={'p1': {'group': None}, 'p3': {}})
+    assert rv.json()[1] == {'name': 'p3', 'status': 'not_found'}
 
-    rv = client.get('/app/type/name')
-    assert b'{"ip":"0.0.0.0"}\n' in rv.data
+    rv = poll(
+        client,
+        '/app/bench?fields=name,user,group',
+        lambda rv: 'group' not in rv.json()[0],
+    )
+    assert rv.json() == [{'name': 'p1', 'user': 'a'}, {'name': 'p2', 'user': 'b'}]
+    for name in ('p1', 'p2'):
+        client.delete('/app/bench/' + name)
@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from controller.singleflight import SingleFlight
+
+
+def test_concurrent_calls_are_coalesced():
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key * 2
+
+    async def scenario():
+        group = SingleFlight()
+        results = await asyncio.gather(*[group.do('a', work, 'a') for _ in range(5)])
+        assert group.in_flight == 0
+        return results
+
+    assert asyncio.run(scenario()) == ['aa'] * 5
+    assert calls == ['a']
+
+
+def test_exceptions_are_shared():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('failed')
+
+    async def scenario():
+        group = SingleFlight()
+        results = await asyncio.gather(
+            group.do('a', fail), group.do('a', fail), return_exceptions=True
+        )
+        assert all(isinstance(r, ValueError) for r in results)
+        with pytest.raises(ValueError):
+            await group.do('a', fail)
+
+    asyncio.run(scenario())
@@ -0,0 +1,36 @@
+import pytest
+
+from controller.state import MemoryStore, SqliteStore, open_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStore()
+    return SqliteStore(str(tmp_path / 'state.db'))
+
+
+def test_update(store):
+    store.update('labels', 'a-1', {'user': 'x'})
+    labels = store.get('labels', 'a-1')
+    labels['user'] = 'changed'
+
+    assert store.get('labels', 'a-1') == {'user': 'x'}
+    store.update('labels', 'a-1', {'user': None, 'group': 'y'})
+    assert store.get('labels', 'a-1') == {'group': 'y'}
+    store.update('activity', 'a/1', {'last': 1.5})
+    assert store.items('activity') == {'a/1': {'last': 1.5}}
+
+    store.delete('labels', 'a-1')
+    assert store.get('labels', 'a-1') == {}
+    assert store.items('labels') == {}
+
+
+def test_sqlite_is_shared(tmp_path):
+    path = str(tmp_path / 'state.db')
+    first, second = SqliteStore(path), open_store('sqlite://' + path)
+    version = second.version()
+
+    first.update('labels', 'a-1', {'user': 'x'})
+    assert second.get('labels', 'a-1') == {'user': 'x'}
+    assert second.version() != version